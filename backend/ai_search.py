@@ -1,24 +1,130 @@
 import os
 import json
-from google import genai
-from sqlalchemy import or_
-from database import SessionLocal
-from models import Article
+import logging
+import asyncio
+import metrics
+from database import AsyncSessionLocal
+from models import Article, StatCounter
+from stats import bump, SEARCH_CACHE_VERSION
+from search_index import apply_search, ranked_ids, snippets
+from embeddings import get_store
+from gemini import get_client, generate_text_async, strip_code_fence, INTERACTIVE
+from analysis_cache import normalize
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 意味検索で再ランキングに追加する候補数
+SEMANTIC_CANDIDATES = int(os.environ.get("SEMANTIC_CANDIDATES", "10"))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", "3600"))
+
+# 正規化クエリ -> 解析結果 / (正規化クエリ, 候補ID集合) -> 再ランキング結果
+parsed_query_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+rerank_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+# phase: parse（クエリ解析）/ candidates（候補の取得）/ rank（再ランキング）
+SEARCH_PHASE_SECONDS = metrics.histogram("ai_search_phase_duration_seconds", "AI 検索の段階毎の所要時間", ["phase"])
+SEARCH_CACHE_LOOKUPS = metrics.counter("ai_search_cache_total", "AI 検索のキャッシュ参照（result: hit / miss）", ["cache", "result"])
+
+def cached(cache, name, key):
+    value = cache.get(key)
+    SEARCH_CACHE_LOOKUPS.inc(cache=name, result="miss" if value is None else "hit")
+    return value
+
+def search_cache_version(db):
+    """再ランキング結果の世代。キャッシュのキーに含め、世代が変われば古い結果を引かない"""
+    return db.query(StatCounter.count).filter(
+        StatCounter.dimension == SEARCH_CACHE_VERSION[0], StatCounter.key == SEARCH_CACHE_VERSION[1]
+    ).scalar() or 0
+
+def invalidate_search_cache(db):
+    """新しい記事が入ったら再ランキング結果を捨てる（クエリ解析結果は記事に依存しないので残す）。
+
+    収集は別プロセスのワーカーでも動くため、SQLite の世代を進めて Web プロセスのキャッシュも無効にする。
+    """
+    bump(db, *SEARCH_CACHE_VERSION)
+    db.commit()
+    rerank_cache.clear()
 
 def get_gemini_client():
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key or api_key == "your_gemini_api_key_here":
-        raise ValueError("Valid GEMINI_API_KEY is required.")
-    return genai.Client(api_key=api_key)
+    return get_client()
+
+# 検索結果の直列化に使う列名（行ごとに __table__ を辿らない）
+ARTICLE_COLUMNS = [c.name for c in Article.__table__.columns]
+
+def article_to_dict(a):
+    return {name: getattr(a, name) for name in ARTICLE_COLUMNS}
 
-def search_articles(query: str):
+def candidate_dict(a):
+    """再ランキングのプロンプトに渡す最小限のフィールド"""
+    return {
+        "id": a.id, "title": a.title, "summary_ja": a.summary_ja,
+        "score": a.score, "source_type": a.source_type, "url": a.url
+    }
+
+# FTS で取る候補の件数
+KEYWORD_CANDIDATES = 20
+
+def semantic_hits(query):
+    """埋め込みが近い記事を [(id, 類似度)] で返す（DB には触れないのでスレッドに逃がせる）"""
     try:
-        client = get_gemini_client()
-    except ValueError as e:
-        return {"error": str(e), "parsed_query": None, "results": []}
+        return get_store().search(query, k=SEMANTIC_CANDIDATES + KEYWORD_CANDIDATES, priority=INTERACTIVE)
+    except Exception as e:
+        logger.error(f"Error in semantic search: {e}")
+        return []
+
+def semantic_candidates(base, hits, exclude_ids):
+    """hits のうちフィルタ条件を満たす記事を [(Article, 類似度)] で返す"""
+    similarity = {i: s for i, s in hits if i not in exclude_ids and s > 0}
+    if not similarity:
+        return []
+    articles = base.filter(Article.id.in_(list(similarity))).all()
+    articles.sort(key=lambda a: similarity[a.id], reverse=True)
+    return [(a, similarity[a.id]) for a in articles[:SEMANTIC_CANDIDATES]]
+
+def find_candidates(db, parsed, query, hits=None):
+    """解析済みクエリから再ランキング候補を集める。
 
-    # 1. Parse query
-    prompt_parse = f"""
+    戻り値: (プロンプト用の候補 dict のリスト, id -> 全列の dict)。
+    ここで読み込んだ行をそのまま最後まで使い回す（再取得しない）。
+    hits を渡さなければ意味検索もここで行う。
+    """
+    base = db.query(Article)
+    
+    if parsed.get("source_type"):
+        base = base.filter(Article.source_type == parsed["source_type"])
+    if parsed.get("category"):
+        base = base.filter(Article.category == parsed["category"])
+        
+    # キーワードはいずれかを含む記事を FTS で検索し、bm25 の関連度順に候補を取る
+    keywords = parsed.get("keywords") or []
+    q, rank = apply_search(base, keywords, operator="OR")
+    if rank is not None:
+        # 候補の ID を先に決め、記事とスニペットは候補の分だけ読む
+        ids = ranked_ids(q, rank, Article.score.desc(), KEYWORD_CANDIDATES)
+        by_id = {a.id: a for a in db.query(Article).filter(Article.id.in_(ids))}
+        articles = [by_id[i] for i in ids]
+        snips = snippets(db, ids, keywords, operator="OR")
+    else:
+        articles = q.order_by(Article.score.desc()).limit(KEYWORD_CANDIDATES).all()
+        snips = {}
+    article_dicts = []
+    rows_by_id = {}
+    for a in articles:
+        article_dicts.append(dict(candidate_dict(a), snippet=snips.get(a.id)))
+        rows_by_id[a.id] = article_to_dict(a)
+    
+    # キーワードを含まない記事も、埋め込みの近さで再ランキングの候補に加える
+    if hits is None:
+        hits = semantic_hits(query)
+    for a, sim in semantic_candidates(base, hits, set(rows_by_id)):
+        article_dicts.append(dict(candidate_dict(a), semantic_score=round(sim, 4)))
+        rows_by_id[a.id] = article_to_dict(a)
+    return article_dicts, rows_by_id
+
+def parse_prompt(query):
+    return f"""
     以下の自然言語クエリから検索条件をJSONで抽出してください。
     クエリ: "{query}"
     
@@ -30,62 +136,10 @@ def search_articles(query: str):
     }}
     JSONのみを出力してください。Markdownバッククォートを含む場合は取り除いてください。
     """
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt_parse
-        )
-        result_text = response.text.strip()
-        if result_text.startswith("```json"):
-            result_text = result_text[7:-3].strip()
-        elif result_text.startswith("```"):
-            result_text = result_text[3:-3].strip()
-        
-        parsed = json.loads(result_text)
-    except Exception as e:
-        print(f"Error parsing query: {e}")
-        parsed = {"keywords": [query], "source_type": None, "category": None}
-        
-    # 2. Search DB
-    db = SessionLocal()
-    try:
-        q = db.query(Article)
-        
-        if parsed.get("source_type"):
-            q = q.filter(Article.source_type == parsed["source_type"])
-        if parsed.get("category"):
-            q = q.filter(Article.category == parsed["category"])
-            
-        filters = []
-        for kw in parsed.get("keywords", []):
-            kw_filter = or_(
-                Article.title.icontains(kw),
-                Article.summary_ja.icontains(kw),
-                Article.full_text.icontains(kw),
-                Article.transcript.icontains(kw)
-            )
-            filters.append(kw_filter)
-            
-        if filters:
-            q = q.filter(or_(*filters))
-            
-        articles = q.order_by(Article.score.desc()).limit(20).all()
-        article_dicts = []
-        for a in articles:
-            article_dicts.append({
-                "id": a.id, "title": a.title, "summary_ja": a.summary_ja,
-                "score": a.score, "source_type": a.source_type, "url": a.url
-            })
-            
-    finally:
-        db.close()
-        
-    if not article_dicts:
-        return {"parsed_query": parsed, "results": []}
-        
-    # 3. Re-rank with Gemini
+
+def rank_prompt(query, article_dicts):
     articles_json = json.dumps(article_dicts, ensure_ascii=False)
-    prompt_rank = f"""
+    return f"""
     ユーザーのクエリと検索結果のリストがあります。
     クエリに最も関連する順に結果を再ランキングし、各結果について短い関連度ノート(なぜ関連しているか)を付けてください。
     
@@ -98,43 +152,79 @@ def search_articles(query: str):
         {{"id": 記事ID, "relevance_note": "関連している理由", "rank_score": 0〜100のスコア}}
     ]
     """
+
+def default_parsed(query):
+    return {"keywords": [query], "source_type": None, "category": None}
+
+def merge_ranked(ranked, rows_by_id):
+    final_results = []
+    for r in ranked:
+        try:
+            a_dict = rows_by_id.get(int(r["id"]))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if a_dict:
+            a_dict = dict(a_dict)
+            a_dict["relevance_note"] = r.get("relevance_note", "")
+            a_dict["ai_rank_score"] = r.get("rank_score", 0)
+            final_results.append(a_dict)
+    final_results.sort(key=lambda x: x.get("ai_rank_score", 0), reverse=True)
+    return final_results
+
+def unranked_results(article_dicts, rows_by_id):
+    final_results = []
+    for c in article_dicts:
+        ad = dict(rows_by_id[c["id"]])
+        ad["relevance_note"] = "AI ranking failed"
+        ad["ai_rank_score"] = c["score"]
+        final_results.append(ad)
+    return final_results
+
+async def search_articles_async(query: str):
+    """自然言語クエリで記事を検索する（Gemini でクエリ解析 → FTS・意味検索で候補 → Gemini で再ランキング）。
+
+    非同期で、Gemini の応答待ちの間はリクエストスレッドを占有しない。
+    """
     try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=prompt_rank
-        )
-        rank_text = response.text.strip()
-        if rank_text.startswith("```json"):
-            rank_text = rank_text[7:-3].strip()
-        elif rank_text.startswith("```"):
-            rank_text = rank_text[3:-3].strip()
-            
-        ranked = json.loads(rank_text)
-        
-        # Merge back
-        final_results = []
-        db = SessionLocal()
-        for r in ranked:
-            a = db.query(Article).filter(Article.id == r["id"]).first()
-            if a:
-                a_dict = {c.name: getattr(a, c.name) for c in a.__table__.columns}
-                a_dict["relevance_note"] = r.get("relevance_note", "")
-                a_dict["ai_rank_score"] = r.get("rank_score", 0)
-                final_results.append(a_dict)
-        db.close()
-        final_results.sort(key=lambda x: x.get("ai_rank_score", 0), reverse=True)
-        return {"parsed_query": parsed, "results": final_results}
-        
+        get_gemini_client()
+    except ValueError as e:
+        return {"error": str(e), "parsed_query": None, "results": []}
+
+    # クエリ解析と並行して、クエリの埋め込み検索を始めておく
+    hits_task = asyncio.create_task(asyncio.to_thread(semantic_hits, query))
+
+    norm_query = normalize(query)
+    parsed = cached(parsed_query_cache, "parsed_query", norm_query)
+    if parsed is None:
+        with SEARCH_PHASE_SECONDS.time(phase="parse"):
+            try:
+                result_text = await generate_text_async(parse_prompt(query), priority=INTERACTIVE)
+                parsed = json.loads(strip_code_fence(result_text))
+                parsed_query_cache.set(norm_query, parsed)
+            except Exception as e:
+                logger.error(f"Error parsing query: {e}")
+                parsed = default_parsed(query)
+
+    with SEARCH_PHASE_SECONDS.time(phase="candidates"):
+        hits = await hits_task
+        async with AsyncSessionLocal() as db:
+            article_dicts, rows_by_id = await db.run_sync(find_candidates, parsed, query, hits)
+            version = await db.run_sync(search_cache_version)
+
+    if not article_dicts:
+        return {"parsed_query": parsed, "results": []}
+
+    rank_key = (version, norm_query, tuple(sorted(rows_by_id)))
+    try:
+        ranked = cached(rerank_cache, "rerank", rank_key)
+        if ranked is None:
+            with SEARCH_PHASE_SECONDS.time(phase="rank"):
+                rank_text = await generate_text_async(rank_prompt(query, article_dicts), priority=INTERACTIVE)
+                ranked = json.loads(strip_code_fence(rank_text))
+            if isinstance(ranked, list):
+                rerank_cache.set(rank_key, ranked)
+        return {"parsed_query": parsed, "results": merge_ranked(ranked, rows_by_id)}
+
     except Exception as e:
-        print(f"Error ranking: {e}")
-        db = SessionLocal()
-        final_results = []
-        for a_dict in article_dicts:
-            a = db.query(Article).filter(Article.id == a_dict["id"]).first()
-            if a:
-                ad = {c.name: getattr(a, c.name) for c in a.__table__.columns}
-                ad["relevance_note"] = "AI ranking failed"
-                ad["ai_rank_score"] = a_dict["score"]
-                final_results.append(ad)
-        db.close()
-        return {"parsed_query": parsed, "results": final_results}
+        logger.error(f"Error ranking: {e}")
+        return {"parsed_query": parsed, "results": unranked_results(article_dicts, rows_by_id)}
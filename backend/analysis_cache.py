@@ -0,0 +1,62 @@
+import os
+import re
+import hashlib
+import datetime
+import unicodedata
+from sqlalchemy.dialects.sqlite import insert
+from models import AnalysisCache
+
+ANALYSIS_CACHE_TTL_DAYS = int(os.environ.get("ANALYSIS_CACHE_TTL_DAYS", "30"))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "20000"))
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+def normalize(text):
+    # 再採点で全記事に対して呼ぶため、不要な変換は飛ばす（結果は NFKC → タグ除去 → 空白の畳み込み → 小文字化と同じ）
+    text = text or ""
+    if not unicodedata.is_normalized("NFKC", text):
+        text = unicodedata.normalize("NFKC", text)
+    if "<" in text:
+        text = _TAG_RE.sub(" ", text)
+    return " ".join(text.split()).lower()
+
+def content_key(title, text, text_chars=1500):
+    """Gemini に実際に送る範囲（タイトル＋本文先頭）を正規化したハッシュ"""
+    payload = normalize(title) + "\n" + normalize((text or "")[:text_chars])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get_cached(db, keys):
+    """有効期限内のキャッシュを {key: analysis} で返す"""
+    keys = list(set(keys))
+    if not keys:
+        return {}
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=ANALYSIS_CACHE_TTL_DAYS)
+    rows = db.query(AnalysisCache).filter(
+        AnalysisCache.content_hash.in_(keys),
+        AnalysisCache.created_at >= cutoff
+    ).all()
+    now = datetime.datetime.now()
+    for r in rows:
+        r.last_used_at = now
+        r.hits = (r.hits or 0) + 1
+    return {r.content_hash: r.analysis for r in rows}
+
+def store(db, key, analysis):
+    """分析結果を書き込む。複数のワーカーが同じ内容を同時に分析しても衝突しないよう upsert にする"""
+    now = datetime.datetime.now()
+    stmt = insert(AnalysisCache).values(content_hash=key, analysis=analysis, created_at=now, last_used_at=now, hits=0)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[AnalysisCache.content_hash],
+        set_={"analysis": stmt.excluded.analysis, "created_at": now, "last_used_at": now}
+    ))
+
+def evict(db):
+    """期限切れと、上限を超えた古い（最終利用が古い）エントリを削除する"""
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=ANALYSIS_CACHE_TTL_DAYS)
+    removed = db.query(AnalysisCache).filter(AnalysisCache.created_at < cutoff).delete(synchronize_session=False)
+    overflow = db.query(AnalysisCache).count() - ANALYSIS_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale = db.query(AnalysisCache.content_hash).order_by(AnalysisCache.last_used_at.asc()).limit(overflow).subquery()
+        removed += db.query(AnalysisCache).filter(AnalysisCache.content_hash.in_(stale.select())).delete(synchronize_session=False)
+    db.commit()
+    return removed
@@ -0,0 +1,705 @@
+"""オフラインのベンチマーク。実際のフィードや Gemini に触れずに、収集のスループットと API のレイテンシを測る。
+
+- 合成コーパス: 記事を1万〜100万件規模で DB に入れる（動画には実際に近い長さの字幕を付ける）
+- 疑似フィードサーバー: RSS / YouTube 形式のフィードをローカルで返す（応答の遅延を指定できる）
+- スタブ genai: google.genai.Client の代わりに決まった応答を返す（遅延・429 を指定できる）
+
+DB・ベクトル索引・フィードは一時ディレクトリに作り、計測は段階毎に別プロセスで行う
+（接続設定やリミッタはモジュール読み込み時に決まるため）。
+
+usage:
+  python bench.py collect [--sources 40] [--youtube 10] [--feed-latency 0.05] [--llm-latency 0.3] [--rate-limit-every 0]
+  python bench.py api [--articles 10000] [--requests 200] [--concurrency 8]
+  python bench.py all [--json result.json] [--baseline base.json]
+  python bench.py seed --articles 100000   # DATABASE_PATH の DB に合成記事を追加する（手元での計測用）
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+from types import SimpleNamespace
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+
+from bench_read_latency import percentile
+
+COMPANIES = ["OpenAI", "Google", "Anthropic", "Meta", "Microsoft", "NVIDIA", "Mistral", "xAI", "Apple", "Amazon",
+             "ソフトバンク", "Preferred Networks", "Sakana AI"]
+PRODUCTS = ["GPT-5", "Gemini 2.5", "Llama 4", "Copilot", "Claude", "Sora", "Grok", "Qwen", "DeepSeek-R1", "Stable Diffusion"]
+VERBS = ["releases", "announces", "open-sources", "launches", "benchmarks", "acquires", "updates", "previews"]
+TOPICS = ["model", "agent", "benchmark", "inference", "training", "dataset", "reasoning", "multimodal", "open-source",
+          "GPU", "latency", "context window", "fine-tuning", "RAG", "safety", "evaluation", "robotics", "diffusion",
+          "token", "pricing", "API", "release", "paper", "startup", "funding", "regulation"]
+JA_WORDS = ["生成AI", "大規模言語モデル", "エージェント", "推論", "学習", "評価", "発表", "公開", "企業", "開発者",
+            "性能", "安全性", "画像生成", "研究", "資金調達", "規制", "半導体"]
+CATEGORIES = ["LLM", "画像生成", "エージェント", "開発ツール", "研究", "ビジネス", "全般"]
+PRIORITIES = [("BREAKING", 1), ("HOT", 4), ("HIGH", 15), ("MEDIUM", 40), ("LOW", 40)]
+SEARCH_QUERIES = ["OpenAI の新しいモデル", "エージェントの評価", "画像生成の研究", "GPU 不足と推論コスト",
+                  "open-source LLM benchmark", "資金調達したスタートアップ", "Gemini multimodal", "RAG の精度",
+                  "ロボティクス", "規制と安全性"]
+
+# 字幕の長さ（文字数）の中央値。英語の話速 150 語/分で 10 分強の動画に相当する。長さは対数正規分布
+TRANSCRIPT_MEDIAN_CHARS = 12000
+TRANSCRIPT_MAX_CHARS = 150000
+SEED_BATCH_SIZE = 2000
+
+# ========================
+# 合成テキスト
+# ========================
+
+class TextPool:
+    """合成本文の素。大きな文章を1つ作っておき、任意の位置から切り出す（記事毎に文章を作らない）。
+
+    語は Zipf 分布で選ぶ（実際の文章と同じく、少数の語が頻出し大半の語はまれ）。
+    分野の語（TOPICS など）は文に時々混ぜるだけなので、全文検索の語がすべての記事に当たることはない。
+    """
+
+    def __init__(self, seed=0, chars=600000, vocabulary=5000):
+        rng = random.Random(seed)
+        syllables = [c + v for c in "kstnhmyrwgzdbp" for v in "aiueo"]
+        words = sorted({"".join(rng.choice(syllables) for _ in range(rng.randint(1, 4))) for _ in range(vocabulary)})
+        rng.shuffle(words)
+        weights = [1.0 / (rank + 1) for rank in range(len(words))]
+        domain = TOPICS + COMPANIES + PRODUCTS
+        parts, size = [], 0
+        while size < chars:
+            if rng.random() < 0.15:
+                s = "".join(rng.choice(JA_WORDS) + rng.choice(["は", "の", "を", "が", "と"]) for _ in range(rng.randint(3, 8))) + "。"
+            else:
+                sentence = rng.choices(words, weights, k=rng.randint(8, 18))
+                if rng.random() < 0.3:
+                    sentence[rng.randrange(len(sentence))] = rng.choice(domain)
+                s = " ".join(sentence).capitalize() + ". "
+            parts.append(s)
+            size += len(s)
+        self.text = "".join(parts)
+
+    def take(self, rng, length):
+        length = min(length, len(self.text))
+        start = rng.randrange(0, len(self.text) - length + 1)
+        return self.text[start:start + length]
+
+def transcript_length(rng, median=TRANSCRIPT_MEDIAN_CHARS):
+    return max(500, min(TRANSCRIPT_MAX_CHARS, int(rng.lognormvariate(math.log(median), 0.8))))
+
+def synthetic_title(rng):
+    title = f"{rng.choice(COMPANIES)} {rng.choice(VERBS)} {rng.choice(PRODUCTS)} {rng.choice(TOPICS)}"
+    if rng.random() < 0.4:
+        title += f" — {rng.choice(JA_WORDS)}の{rng.choice(JA_WORDS)}"
+    return title
+
+def video_id_for(key):
+    return hashlib.sha1(key.encode("utf-8")).digest()[:8].hex()[:11]
+
+# ========================
+# 合成コーパス
+# ========================
+
+def seed_corpus(count, video_ratio=0.3, transcript_chars=TRANSCRIPT_MEDIAN_CHARS, sources=50, days=90,
+                seed=0, embeddings=True):
+    """合成記事を count 件追加し、集計カウンタ・フィード・ベクトル索引を作り直す。戻り値: 追加にかかった秒数"""
+    import datetime
+    from sqlalchemy import insert, func
+    from database import SessionLocal, init_db, engine
+    from models import Article, CustomSource
+    from search_index import bulk_load
+    from scoring import total_score
+    from stats import reconcile
+    from feed import render_feeds
+    init_db()
+    rng = random.Random(seed)
+    pool = TextPool(seed)
+    db = SessionLocal()
+    try:
+        bench_sources = []
+        for i in range(sources):
+            kind = "youtube" if i < sources * video_ratio else "rss"
+            s = CustomSource(type=kind, url=f"UCbench{i:04d}" if kind == "youtube" else f"https://bench.invalid/rss/{i}.xml",
+                             display_name=f"Bench {kind} {i}", enabled=False)
+            db.add(s)
+            bench_sources.append(s)
+        db.commit()
+        bench_sources = [(s.id, s.type, s.display_name) for s in bench_sources]
+        videos = [s for s in bench_sources if s[1] == "youtube"]
+        feeds = [s for s in bench_sources if s[1] == "rss"]
+        offset = db.query(func.max(Article.id)).scalar() or 0
+        now = datetime.datetime.now()
+        labels, weights = zip(*PRIORITIES)
+
+        start = time.perf_counter()
+        report_every = max(SEED_BATCH_SIZE, count // 10)
+        next_report = report_every
+        rows = []
+        with bulk_load(engine):
+            for i in range(count):
+                is_video = videos and (not feeds or rng.random() < video_ratio)
+                source_id, source_type, source_name = rng.choice(videos if is_video else feeds)
+                details = {"relevance": rng.randint(0, 40), "reliability": rng.randint(0, 30),
+                           "freshness": rng.randint(0, 20), "virality": rng.randint(0, 10)}
+                published = now - datetime.timedelta(seconds=rng.uniform(0, days * 86400))
+                key = f"{offset + i}"
+                rows.append({
+                    "title": synthetic_title(rng),
+                    "summary": pool.take(rng, rng.randint(200, 800)),
+                    "summary_ja": pool.take(rng, rng.randint(80, 200)),
+                    "business_point": pool.take(rng, 60),
+                    # 動画は字幕列にだけ本文を持つ（収集と同じ形）
+                    "full_text": None if is_video else pool.take(rng, rng.randint(1500, 8000)),
+                    "transcript": pool.take(rng, transcript_length(rng, transcript_chars)) if is_video else None,
+                    "url": f"https://www.youtube.com/watch?v={video_id_for(key)}&bench={key}" if is_video
+                           else f"https://news.bench.invalid/{key}",
+                    "source_name": source_name, "source_type": source_type, "source_id": source_id,
+                    "category": rng.choice(CATEGORIES),
+                    "tags": rng.sample(TOPICS, rng.randint(2, 4)),
+                    "company_tags": rng.sample(COMPANIES, rng.randint(0, 2)),
+                    "priority_label": rng.choices(labels, weights)[0],
+                    "trust_level": rng.choice(["HIGH", "MEDIUM", "LOW"]),
+                    "trust_reason": "",
+                    "score": total_score(details, 0, 0.0),
+                    "score_details": details,
+                    "published_at": published,
+                    "fetched_at": published + datetime.timedelta(minutes=rng.randint(1, 120)),
+                    "is_clipped": rng.random() < 0.01,
+                    "clip_folder": None,
+                })
+                if len(rows) >= SEED_BATCH_SIZE or i == count - 1:
+                    db.execute(insert(Article), rows)
+                    db.commit()
+                    rows = []
+                    done = i + 1
+                    if done >= next_report or done == count:
+                        next_report += report_every
+                        print(f"[BENCH] 合成記事 {done}/{count}件（{done / (time.perf_counter() - start):.0f}件/秒）")
+        seconds = time.perf_counter() - start
+
+        reconcile(db)
+        render_feeds(db)
+        if embeddings:
+            from embeddings import get_store
+            get_store().rebuild(db, batch_size=500)
+        return seconds
+    finally:
+        db.close()
+
+# ========================
+# 疑似フィードサーバー
+# ========================
+
+class FeedServer:
+    """RSS / YouTube 形式のフィードを返すローカル HTTP サーバー。
+
+    /rss/<n>.xml と /youtube?channel_id=UCbench<n> に、それぞれ items 件の記事を新しい順で返す。
+    POST /_advance で全フィードに1件ずつ新着を足す。ETag 付きで返し、変わっていなければ 304。
+    """
+
+    def __init__(self, latency=0.0, items=10, port=0, seed=0):
+        self.latency = latency
+        self.items = items
+        self.seed = seed
+        self.generation = 0
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+        self._pool = TextPool(seed, chars=200000)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if self.path == "/_advance":
+                    with server._lock:
+                        server.generation += 1
+                self.send_response(204)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+                body = server.render(self.path)
+                with server._lock:
+                    server.requests += 1
+                if body is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/xml; charset=utf-8")
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _entries(self, feed):
+        newest = self.generation + self.items
+        for idx in range(newest - 1, newest - 1 - self.items, -1):
+            rng = random.Random(f"{self.seed}:{feed}:{idx}")
+            yield idx, rng
+
+    def render(self, path):
+        parsed = urlparse(path)
+        if parsed.path.startswith("/rss/"):
+            feed = parsed.path[len("/rss/"):].removesuffix(".xml")
+            items = "".join(
+                f"<item><title>{escape(synthetic_title(rng))}</title>"
+                f"<link>https://news.bench.invalid/{feed}/{idx}</link>"
+                f"<description>{escape(self._pool.take(rng, rng.randint(300, 3000)))}</description></item>"
+                for idx, rng in self._entries(feed)
+            )
+            return (f'<?xml version="1.0" encoding="utf-8"?><rss version="2.0"><channel><title>Bench {feed}</title>'
+                    f"{items}</channel></rss>").encode("utf-8")
+        if parsed.path == "/youtube":
+            channel = parse_qs(parsed.query).get("channel_id", [""])[0]
+            if not channel:
+                return None
+            entries = "".join(
+                f"<entry><title>{escape(synthetic_title(rng))}</title>"
+                f'<link rel="alternate" href="https://www.youtube.com/watch?v={video_id_for(f"{channel}:{idx}")}"/>'
+                f"<yt:videoId>{video_id_for(f'{channel}:{idx}')}</yt:videoId>"
+                f"<media:group><media:description>{escape(self._pool.take(rng, rng.randint(100, 600)))}</media:description></media:group>"
+                f"</entry>"
+                for idx, rng in self._entries(channel)
+            )
+            return ('<?xml version="1.0" encoding="utf-8"?><feed xmlns="http://www.w3.org/2005/Atom" '
+                    'xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns:media="http://search.yahoo.com/mrss/">'
+                    f"<title>{escape(channel)}</title>{entries}</feed>").encode("utf-8")
+        return None
+
+def stub_transcripts(latency=0.0, none_ratio=0.1, median=TRANSCRIPT_MEDIAN_CHARS, seed=0):
+    """transcripts.fetch_transcript を、動画 ID から決まる合成字幕を返す関数に置き換える"""
+    import transcripts
+    pool = TextPool(seed + 1)
+
+    def fetch(vid):
+        if latency:
+            time.sleep(latency)
+        rng = random.Random(f"transcript:{vid}")
+        if rng.random() < none_ratio:
+            return "", transcripts.NONE
+        return pool.take(rng, transcript_length(rng, median)), transcripts.OK
+
+    transcripts.fetch_transcript = fetch
+
+# ========================
+# スタブ genai
+# ========================
+
+class StubRateLimitError(Exception):
+    def __init__(self):
+        super().__init__("429 RESOURCE_EXHAUSTED (bench stub)")
+
+class StubGenAI:
+    """google.genai.Client の代わり。プロンプトの形から、収集・AI 検索が期待する JSON を決定的に返す。
+
+    latency: 1回の応答にかかる秒数
+    rate_limit_every: N 回に1回 429 を返す（0 で返さない）
+    quota_rpm: 直近60秒の呼び出しがこれを超えたら 429 を返す（0 で制限なし）
+    """
+
+    def __init__(self, latency=0.3, rate_limit_every=0, quota_rpm=0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.quota_rpm = quota_rpm
+        self.calls = 0
+        self.rate_limited = 0
+        self.tokens = 0
+        self._recent = []
+        self._lock = threading.Lock()
+        self.models = SimpleNamespace(generate_content=self._generate, embed_content=self._embed)
+        self.aio = SimpleNamespace(models=SimpleNamespace(generate_content=self._generate_async))
+
+    def _admit(self, text):
+        from gemini import estimate_tokens
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            self._recent = [t for t in self._recent if now - t < 60]
+            limited = (self.rate_limit_every and self.calls % self.rate_limit_every == 0) or \
+                      (self.quota_rpm and len(self._recent) >= self.quota_rpm)
+            if limited:
+                self.rate_limited += 1
+                raise StubRateLimitError()
+            self._recent.append(now)
+            self.tokens += estimate_tokens(text)
+
+    def _generate(self, model=None, contents=""):
+        self._admit(contents)
+        time.sleep(self.latency)
+        return SimpleNamespace(text=self.respond(contents))
+
+    async def _generate_async(self, model=None, contents=""):
+        self._admit(contents)
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text=self.respond(contents))
+
+    def _embed(self, model=None, contents=()):
+        from embeddings import HashingEmbedder, GEMINI_EMBED_DIM
+        self._admit(" ".join(contents))
+        time.sleep(self.latency)
+        vectors = HashingEmbedder(GEMINI_EMBED_DIM).embed(list(contents))
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=v.tolist()) for v in vectors])
+
+    @staticmethod
+    def _analysis(key):
+        rng = random.Random(key)
+        return {
+            "summary_ja": f"{key[:40]} の要約",
+            "tags": rng.sample(TOPICS, 3), "company_tags": rng.sample(COMPANIES, 1),
+            "category": rng.choice(CATEGORIES), "priority_label": rng.choices(*zip(*PRIORITIES))[0],
+            "trust_level": "MEDIUM", "trust_reason": "ベンチマーク", "business_point": "ベンチマーク",
+            "score_details": {"relevance": rng.randint(10, 40), "reliability": rng.randint(10, 30),
+                              "freshness": rng.randint(5, 20), "virality": rng.randint(0, 10)},
+        }
+
+    def respond(self, prompt):
+        if "記事一覧:\n" in prompt:
+            payload = json.loads(prompt.split("記事一覧:\n", 1)[1].split("\n\n必ず", 1)[0])
+            return json.dumps([dict(self._analysis(p["title"]), id=p["id"]) for p in payload], ensure_ascii=False)
+        if "箇条書きのみで回答" in prompt:
+            return "\n".join(f"- 要点{i}" for i in range(1, 4))
+        if "自然言語クエリから検索条件" in prompt:
+            query = prompt.split('クエリ: "', 1)[1].split('"', 1)[0]
+            return json.dumps({"keywords": query.split()[:3], "source_type": None, "category": None}, ensure_ascii=False)
+        if "再ランキング" in prompt:
+            results, _ = json.JSONDecoder().raw_decode(prompt.split("検索結果:", 1)[1].strip())
+            return json.dumps([{"id": r["id"], "relevance_note": "関連", "rank_score": 100 - i}
+                               for i, r in enumerate(results)], ensure_ascii=False)
+        title = prompt.split("タイトル: ", 1)[1].split("\n", 1)[0] if "タイトル: " in prompt else prompt[:40]
+        return json.dumps(self._analysis(title), ensure_ascii=False)
+
+    def summary(self):
+        return {"llm_calls": self.calls, "rate_limited": self.rate_limited, "llm_tokens": self.tokens}
+
+def install_stub(latency, rate_limit_every=0, quota_rpm=0):
+    """gemini モジュールの共有クライアントをスタブに差し替える"""
+    os.environ["GEMINI_API_KEY"] = "bench"
+    import gemini
+    stub = StubGenAI(latency, rate_limit_every, quota_rpm)
+    gemini._client = stub
+    return stub
+
+# ========================
+# 収集のベンチマーク（子プロセス）
+# ========================
+
+def run_collect(args):
+    import requests
+    from database import SessionLocal, init_db
+    from models import Article, CustomSource
+    from collector import collect_data
+    init_db()
+    stub = install_stub(args.llm_latency, args.rate_limit_every, args.quota_rpm)
+    stub_transcripts(args.transcript_latency)
+    servers = args.servers.split(",")
+
+    db = SessionLocal()
+    db.query(CustomSource).delete()
+    for i in range(args.sources + args.youtube):
+        base = servers[i % len(servers)]
+        if i < args.youtube:
+            db.add(CustomSource(type="youtube", url=f"UCbench{i:04d}", display_name=f"Bench YouTube {i}", enabled=True))
+        else:
+            db.add(CustomSource(type="rss", url=f"{base}/rss/{i}.xml", display_name=f"Bench RSS {i}", enabled=True))
+    db.commit()
+
+    runs = []
+    for label in ("cold", "unchanged", "new items"):
+        if label == "new items":
+            for base in servers:
+                requests.post(f"{base}/_advance", timeout=5)
+        before_articles = db.query(Article).count()
+        before = stub.summary()
+        start = time.perf_counter()
+        stages = collect_data()
+        seconds = time.perf_counter() - start
+        saved = db.query(Article).count() - before_articles
+        after = stub.summary()
+        runs.append(dict(
+            {k: after[k] - before[k] for k in after},
+            run=label, seconds=round(seconds, 3), saved=saved,
+            articles_per_second=round(saved / seconds, 2) if seconds else 0.0, stages=stages,
+        ))
+    db.close()
+    return runs
+
+# ========================
+# API のベンチマーク
+# ========================
+
+def endpoint_requests(rng):
+    """(名前, 次のリクエストを作る関数)。関数は (method, path, json) を返す"""
+    return [
+        ("GET /api/articles", lambda: ("GET", rng.choice([
+            "/api/articles", "/api/articles?sort=published", f"/api/articles?category={rng.choice(CATEGORIES)}",
+            "/api/articles?days=30&min_score=60", f"/api/articles?priority={rng.choice(PRIORITIES)[0]}",
+        ]), None)),
+        ("GET /api/articles?search", lambda: ("GET", f"/api/articles?search={rng.choice(TOPICS + JA_WORDS)}", None)),
+        ("GET /api/timeline", lambda: ("GET", rng.choice(["/api/timeline", "/api/timeline?days=30"]), None)),
+        ("POST /api/search/ai", lambda: ("POST", "/api/search/ai", {"query": rng.choice(SEARCH_QUERIES)})),
+        ("GET /api/stats", lambda: ("GET", "/api/stats", None)),
+        ("GET /feed/public", lambda: ("GET", rng.choice(["/feed/public", f"/feed/public?category={rng.choice(CATEGORIES)}"]), None)),
+    ]
+
+def load_endpoint(base_url, make_request, count, concurrency, warmup=5):
+    """make_request で作ったリクエストを concurrency 本の並列で count 回送り、レイテンシ（ミリ秒）を集める"""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    local = threading.local()
+
+    def send():
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        method, path, body = make_request()
+        start = time.perf_counter()
+        resp = session.request(method, base_url + path, json=body, timeout=60)
+        _ = resp.content
+        return (time.perf_counter() - start) * 1000, resp.status_code < 400
+
+    for _ in range(warmup):
+        send()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: send(), range(count)))
+    wall = time.perf_counter() - start
+    latencies = [ms for ms, _ in results]
+    return {
+        "requests": count, "errors": sum(1 for _, ok in results if not ok),
+        "p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2),
+        "p99": round(percentile(latencies, 99), 2), "max": round(max(latencies), 2),
+        "rps": round(count / wall, 1),
+    }
+
+def wait_ready(base_url, proc, timeout=120):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("API サーバーが起動前に終了しました")
+        try:
+            if requests.get(base_url + "/api/stats", timeout=2).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("API サーバーが起動しません")
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# ========================
+# 親プロセス: 実行と表示
+# ========================
+
+def child_env(tmp, args):
+    return dict(
+        os.environ, DATABASE_PATH=os.path.join(tmp, "bench.db"), EMBEDDING_DIR=os.path.join(tmp, "embeddings"),
+        FEED_DIR=os.path.join(tmp, "feeds"), EMBEDDER="hashing", GEMINI_RPM=str(args.rpm),
+        PIPELINE_REPORT_SECONDS="0", PYTHONUNBUFFERED="1",
+    )
+
+def run_child(phase, env, extra, verbose=False):
+    """bench.py --phase を子プロセスで実行し、結果ファイルの JSON を返す"""
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_path = f.name
+    try:
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--phase", phase, "--result", result_path] + extra,
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=None if verbose else subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+        )
+        if out.returncode != 0:
+            raise RuntimeError(f"{phase} に失敗しました\n{(out.stdout or '')[-4000:]}")
+        with open(result_path) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_path)
+
+def bench_collect(args):
+    servers = [FeedServer(args.feed_latency, args.items).start() for _ in range(args.hosts)]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            extra = ["--servers", ",".join(s.base_url for s in servers)] + passthrough(args)
+            env = dict(child_env(tmp, args), YOUTUBE_FEED_URL=f"{servers[0].base_url}/youtube")
+            runs = run_child("collect", env, extra, args.verbose)
+    finally:
+        for s in servers:
+            s.stop()
+    from pipeline import format_stats
+    print(f"\n## 収集（RSS {args.sources} + YouTube {args.youtube} ソース, フィード遅延 {args.feed_latency}s, "
+          f"LLM 遅延 {args.llm_latency}s）")
+    print(f"{'run':<10} {'seconds':>8} {'saved':>6} {'art/s':>7} {'llm':>5} {'429':>5} {'tokens':>8}")
+    for r in runs:
+        print(f"{r['run']:<10} {r['seconds']:>8.2f} {r['saved']:>6} {r['articles_per_second']:>7.2f} "
+              f"{r['llm_calls']:>5} {r['rate_limited']:>5} {r['llm_tokens']:>8}")
+    if args.verbose:
+        for r in runs:
+            print(f"\n[{r['run']}]\n" + format_stats(r["stages"]))
+    return runs
+
+def bench_api(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = child_env(tmp, args)
+        seed_result = run_child("seed", env, ["--articles", str(args.articles)] + passthrough(args), args.verbose)
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--phase", "serve", "--port", str(port)] + passthrough(args),
+            env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+            stdout=None if args.verbose else subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        results = {}
+        try:
+            wait_ready(base_url, server)
+            rng = random.Random(args.seed)
+            for name, make_request in endpoint_requests(rng):
+                results[name] = load_endpoint(base_url, make_request, args.requests, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    print(f"\n## API（記事 {args.articles}件, 投入 {seed_result['seconds']:.1f}s, 並列 {args.concurrency}, "
+          f"AI 検索の LLM 遅延 {args.llm_latency}s）")
+    print(f"{'endpoint':<26} {'n':>5} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'req/s':>7}")
+    for name, r in results.items():
+        print(f"{name:<26} {r['requests']:>5} {r['errors']:>4} {r['p50']:>7.1f}ms {r['p95']:>7.1f}ms "
+              f"{r['p99']:>7.1f}ms {r['max']:>7.1f}ms {r['rps']:>7.1f}")
+    return {"articles": args.articles, "seed_seconds": seed_result["seconds"], "endpoints": results}
+
+def compare(result, baseline, tolerance):
+    """基準より遅くなった項目を返す（収集は cold 実行の秒数、API は p95）"""
+    regressions = []
+    base_runs = {r["run"]: r for r in baseline.get("collect", [])}
+    for r in result.get("collect", []):
+        b = base_runs.get(r["run"])
+        if r["run"] == "cold" and b and r["seconds"] > b["seconds"] * (1 + tolerance):
+            regressions.append(f"collect {r['run']}: {b['seconds']:.2f}s -> {r['seconds']:.2f}s")
+    base_api = baseline.get("api", {}).get("endpoints", {})
+    for name, r in result.get("api", {}).get("endpoints", {}).items():
+        b = base_api.get(name)
+        if b and r["p95"] > b["p95"] * (1 + tolerance):
+            regressions.append(f"{name} p95: {b['p95']:.1f}ms -> {r['p95']:.1f}ms")
+    return regressions
+
+def passthrough(args):
+    """子プロセスに渡す共通オプション"""
+    return ["--llm-latency", str(args.llm_latency), "--rate-limit-every", str(args.rate_limit_every),
+            "--quota-rpm", str(args.quota_rpm), "--transcript-latency", str(args.transcript_latency),
+            "--sources", str(args.sources), "--youtube", str(args.youtube),
+            "--video-ratio", str(args.video_ratio), "--transcript-chars", str(args.transcript_chars),
+            "--seed", str(args.seed)] + ([] if args.embeddings else ["--no-embeddings"])
+
+def run_phase(args):
+    if args.phase == "collect":
+        result = run_collect(args)
+    elif args.phase == "seed":
+        result = {"seconds": seed_corpus(args.articles, args.video_ratio, args.transcript_chars,
+                                         seed=args.seed, embeddings=args.embeddings)}
+    elif args.phase == "serve":
+        import uvicorn
+        install_stub(args.llm_latency, args.rate_limit_every, args.quota_rpm)
+        import main
+        uvicorn.run(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+        return
+    with open(args.result, "w") as f:
+        json.dump(result, f, ensure_ascii=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="オフラインのベンチマーク（合成コーパス・疑似フィード・スタブ LLM）")
+    parser.add_argument("command", nargs="?", default="all", choices=["all", "collect", "api", "seed"])
+    parser.add_argument("--articles", type=int, default=10000, help="API 計測用の合成記事数（seed では追加する件数）")
+    parser.add_argument("--video-ratio", type=float, default=0.3, help="合成記事のうち字幕付き動画の割合")
+    parser.add_argument("--transcript-chars", type=int, default=TRANSCRIPT_MEDIAN_CHARS, help="字幕の長さの中央値（文字）")
+    parser.add_argument("--no-embeddings", dest="embeddings", action="store_false", help="ベクトル索引を作らない")
+    parser.add_argument("--requests", type=int, default=200, help="エンドポイント毎のリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--sources", type=int, default=40, help="RSS ソース数")
+    parser.add_argument("--youtube", type=int, default=10, help="YouTube ソース数")
+    parser.add_argument("--items", type=int, default=10, help="フィード1件あたりの記事数")
+    parser.add_argument("--hosts", type=int, default=1, help="疑似フィードサーバーの数（ホスト毎の同時接続制限を見る）")
+    parser.add_argument("--feed-latency", type=float, default=0.05, help="フィードの応答遅延（秒）")
+    parser.add_argument("--transcript-latency", type=float, default=0.2, help="字幕取得の遅延（秒）")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="スタブ LLM の応答遅延（秒）")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="スタブ LLM が N 回に1回 429 を返す")
+    parser.add_argument("--quota-rpm", type=int, default=0, help="スタブ LLM の1分あたりの上限（超えたら 429）")
+    parser.add_argument("--rpm", type=int, default=600, help="収集側リミッタの GEMINI_RPM")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="結果を JSON で保存する")
+    parser.add_argument("--baseline", help="比較する過去の結果（JSON）。悪化していれば終了コード 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなす割合")
+    parser.add_argument("--verbose", action="store_true", help="子プロセスのログと段毎の集計を表示する")
+    parser.add_argument("--phase", choices=["collect", "seed", "serve"], help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--servers", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        run_phase(args)
+        return
+    if args.command == "seed":
+        # DATABASE_PATH の DB に追加する。ソースは無効の状態で作るので収集の対象にはならない
+        from dotenv import load_dotenv
+        load_dotenv()
+        seconds = seed_corpus(args.articles, args.video_ratio, args.transcript_chars, seed=args.seed, embeddings=args.embeddings)
+        print(f"[BENCH] 合成記事 {args.articles}件を追加（{seconds:.1f}秒）")
+        return
+
+    result = {}
+    if args.command in ("all", "collect"):
+        result["collect"] = bench_collect(args)
+    if args.command in ("all", "api"):
+        result["api"] = bench_api(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print("\n[REGRESSION] 基準より遅くなりました:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print("\n基準との比較: 悪化なし")
+
+if __name__ == "__main__":
+    main()
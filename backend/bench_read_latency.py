@@ -0,0 +1,154 @@
+"""収集（記事の保存）が走っている最中の API 読み込みレイテンシを測る。
+
+SQLite の接続設定とコミット粒度の組み合わせごとに、一時 DB で
+- 書き込み側: 別プロセスで collector.save_analyzed により合成記事を保存し続ける（Gemini は呼ばない）
+- 読み込み側: /api/articles と /api/stats のハンドラを繰り返し呼ぶ
+を同時に走らせ、読み込みの p50/p95/p99/最大 を表示する。
+
+usage: python bench_read_latency.py [--articles 400] [--seed 2000]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+# (名前, 環境変数)。旧設定は rollback journal + FULL + 記事毎コミット
+SCENARIOS = [
+    ("legacy (DELETE/FULL, commit=1)", {
+        "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_CACHE_SIZE": "",
+        "SQLITE_MMAP_SIZE": "", "SQLITE_TEMP_STORE": "", "COLLECT_COMMIT_SIZE": "1",
+    }),
+    ("WAL/NORMAL, commit=1", {"COLLECT_COMMIT_SIZE": "1"}),
+    ("WAL/NORMAL, commit=25 (default)", {"COLLECT_COMMIT_SIZE": "25"}),
+]
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def seed(count):
+    import datetime
+    from database import SessionLocal, init_db
+    from models import Article, CustomSource
+    from stats import reconcile
+    init_db()
+    db = SessionLocal()
+    source = db.query(CustomSource).first()
+    now = datetime.datetime.now()
+    db.bulk_save_objects([
+        Article(
+            title=f"seed article {i}", url=f"https://example.com/seed/{i}", summary="seed",
+            summary_ja="シード記事", full_text="seed " * 50, source_name=source.display_name,
+            source_type=source.type, category="LLM", priority_label="MEDIUM", score=float(i % 100),
+            published_at=now - datetime.timedelta(minutes=i), fetched_at=now, source_id=source.id,
+        ) for i in range(count)
+    ])
+    db.commit()
+    reconcile(db)
+    db.close()
+
+def write_articles(count, queue):
+    """collector と同じ保存経路で count 件を保存する（別プロセスで実行）"""
+    import io
+    import datetime
+    import collector
+    from database import SessionLocal
+    from dedup import DuplicateDetector
+    from models import CustomSource
+    sys.stdout = io.StringIO()
+    db = SessionLocal()
+    source = db.query(CustomSource).first()
+    detector = DuplicateDetector(db)
+    analyzed, finished_sources, failed = [], [], set()
+    analysis = {"summary_ja": "ベンチマーク", "category": "LLM", "priority_label": "HIGH",
+                "score_details": {"relevance": 30, "reliability": 20, "freshness": 10, "virality": 5}}
+    start = time.perf_counter()
+    for i in range(count):
+        url = f"https://example.com/bench/{i}"
+        item = {"title": f"bench article {i}", "url": url, "summary": "bench " * 40,
+                "published_at": datetime.datetime.now(), "canonical_url": url, "minhash": None}
+        analyzed.append(({"source": source, "item": item, "text": item["summary"], "transcript": ""}, analysis))
+        if len(analyzed) >= collector.COLLECT_COMMIT_SIZE:
+            collector.save_analyzed(db, analyzed, finished_sources, failed, detector)
+    collector.save_analyzed(db, analyzed, finished_sources, failed, detector)
+    queue.put(time.perf_counter() - start)
+    db.close()
+
+async def read_until(writer, latencies):
+    from fastapi import Response
+    from database import AsyncSessionLocal
+    import main
+    while writer.is_alive():
+        for call in (lambda db: main.get_articles(Response(), days=0, db=db), lambda db: main.get_stats(db=db)):
+            start = time.perf_counter()
+            async with AsyncSessionLocal() as db:
+                await call(db)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+def run_scenario(articles, seed_count):
+    import io
+    import asyncio
+    import contextlib
+    import multiprocessing
+    with contextlib.redirect_stdout(io.StringIO()):
+        seed(seed_count)
+    from database import engine, async_engine
+    engine.dispose()
+
+    # 収集ワーカーと API は別プロセス（GIL を共有しない）として測る
+    latencies = []
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    writer = ctx.Process(target=write_articles, args=(articles, queue))
+
+    async def run():
+        writer.start()
+        await read_until(writer, latencies)
+        writer.join()
+        await async_engine.dispose()
+
+    asyncio.run(run())
+    result = {"write_seconds": queue.get(timeout=10)}
+    result.update({
+        "reads": len(latencies),
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99), "max": max(latencies) if latencies else 0.0,
+    })
+    print(json.dumps(result))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=400, help="収集中に保存する記事数")
+    parser.add_argument("--seed", type=int, default=2000, help="事前に入れておく記事数")
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        run_scenario(args.articles, args.seed)
+        return
+
+    # 接続設定はモジュール読み込み時に決まるので、シナリオ毎に別プロセスで測る
+    print(f"{'scenario':<34} {'reads':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'write':>8}")
+    for i, (name, env) in enumerate(SCENARIOS):
+        with tempfile.TemporaryDirectory() as tmp:
+            child_env = dict(os.environ, DATABASE_PATH=os.path.join(tmp, "bench.db"),
+                             EMBEDDING_DIR=os.path.join(tmp, "embeddings"), EMBEDDER="hashing", **env)
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--scenario", str(i),
+                 "--articles", str(args.articles), "--seed", str(args.seed)],
+                env=child_env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            if out.returncode != 0:
+                print(f"{name}: failed\n{out.stderr}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{name:<34} {r['reads']:>6} {r['p50']:>6.1f}ms {r['p95']:>6.1f}ms {r['p99']:>6.1f}ms "
+                  f"{r['max']:>6.1f}ms {r['write_seconds']:>7.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,39 +1,56 @@
 import os
+import time
+import logging
 import datetime
 import json
-import feedparser
-from youtube_transcript_api import YouTubeTranscriptApi
-from google import genai
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, delete
+import metrics
 from database import SessionLocal
-from models import Article, CustomSource
+from models import Article, CustomSource, FeedCache, CollectionReport, SourceReport
+from fetcher import fetch_sources, FETCH_WORKERS
+from pipeline import Stage, Pipeline, format_stats
+import analysis_cache
+import transcripts
+from transcripts import TranscriptPrefetcher, TRANSCRIPT_WORKERS
+from dedup import DuplicateDetector
+from embeddings import get_store, embedding_text
+from ai_search import invalidate_search_cache
+from feed import render_feeds
+from stats import record_article
+from scoring import load_rules, rule_text, total_score
+from gemini import has_api_key, generate_text, strip_code_fence, estimate_tokens, is_rate_limit_error, BACKGROUND
 
-import time
-import random
+logger = logging.getLogger(__name__)
 
-def get_gemini_analysis(title: str, text: str, source_type: str) -> dict:
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key or api_key == "your_gemini_api_key_here":
-        print("[GEMINI] APIキーなし、デフォルト値使用")
-        return {}
-    
-    for attempt in range(4):  # 最大4回試行
-        try:
-            # リクエスト前に2秒ウェイト（固定）
-            time.sleep(2.0)
-            
-            client = genai.Client(api_key=api_key)
-            safe_text = (text or "")[:1500]
-            
-            prompt = f"""以下のAI/テクノロジーニュース記事を分析してJSON形式で返してください。
-            
-タイトル: {title}
-種別: {source_type}
-記事内容:
-{safe_text}
+# 1リクエストにまとめる記事数と、その入力トークン予算
+ANALYSIS_BATCH_SIZE = int(os.environ.get("ANALYSIS_BATCH_SIZE", "8"))
+ANALYSIS_BATCH_TOKENS = int(os.environ.get("ANALYSIS_BATCH_TOKENS", "6000"))
+ANALYSIS_TEXT_CHARS = 1500
+# これより長い本文（主に動画の字幕）は分割して部分毎に要約し、要約をまとめて分析する
+LONG_TEXT_CHARS = int(os.environ.get("LONG_TEXT_CHARS", "6000"))
+LONG_TEXT_CHUNK_CHARS = int(os.environ.get("LONG_TEXT_CHUNK_CHARS", "8000"))
+LONG_TEXT_MAX_CHUNKS = int(os.environ.get("LONG_TEXT_MAX_CHUNKS", "16"))
+LONG_TEXT_WORKERS = int(os.environ.get("LONG_TEXT_WORKERS", "4"))
+# 1トランザクションで保存する記事数の目安（コミット毎の fsync と書き込みロックの取得回数を減らす）
+COLLECT_COMMIT_SIZE = int(os.environ.get("COLLECT_COMMIT_SIZE", "25"))
+# 段毎の並列度。分析はリミッタが全体の枠を管理するので、応答待ちを重ねられるよう複数にする
+ANALYZE_WORKERS = int(os.environ.get("ANALYZE_WORKERS", "2"))
+# 分析・書き込みの段がバッチを埋めるために待つ最大秒数
+ANALYSIS_LINGER_SECONDS = float(os.environ.get("ANALYSIS_LINGER_SECONDS", "1.0"))
+PERSIST_LINGER_SECONDS = float(os.environ.get("PERSIST_LINGER_SECONDS", "2.0"))
+# 収集レポート（collection_reports / source_reports）を残す日数
+COLLECTION_REPORT_RETENTION_DAYS = int(os.environ.get("COLLECTION_REPORT_RETENTION_DAYS", "30"))
 
-必ず以下のJSON形式のみで回答（```不要）:
-{{
-  "summary_ja": "日本語で3行の要約",
+GEMINI_RETRIES = metrics.counter("gemini_retries_total", "429 による Gemini 呼び出しの再試行数")
+GEMINI_GAVE_UP = metrics.counter("gemini_retries_exhausted_total", "再試行しても 429 が続き、分析を諦めた回数")
+RUN_SECONDS = metrics.histogram("collector_run_duration_seconds", "収集1回の所要時間", buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600))
+STAGE_ITEMS = metrics.counter("collector_stage_items_total", "収集パイプラインの段毎の処理件数", ["stage"])
+STAGE_BUSY_SECONDS = metrics.counter("collector_stage_busy_seconds_total", "収集パイプラインの段毎の処理時間（ワーカーの合計）", ["stage"])
+SOURCE_ITEMS = metrics.counter("collector_items_total", "ソースの記事の行き先（fetched / skipped / analyzed / analysis_failed / saved）", ["result"])
+
+ANALYSIS_FIELDS = """  "summary_ja": "日本語で3行の要約",
   "tags": ["タグ1", "タグ2"],
   "company_tags": ["関連する企業名を1-3個。なければ空配列"],
   "category": "LLM または 画像生成 または エージェント または 開発ツール または 研究 または ビジネス または 全般",
@@ -41,164 +58,761 @@ def get_gemini_analysis(title: str, text: str, source_type: str) -> dict:
   "trust_level": "HIGH または MEDIUM または LOW",
   "trust_reason": "その信頼度の理由を1文で",
   "business_point": "ビジネスへの影響を1文で",
-  "score_details": {{
+  "score_details": {
       "relevance": 0-40,
       "reliability": 0-30,
       "freshness": 0-20,
       "virality": 0-10
-  }}
-}}"""
-            print(f"[GEMINI] 分析開始: {title[:50]}")
-            response = client.models.generate_content(
-                model='gemini-2.0-flash',
-                contents=prompt
-            )
-            
-            result_text = response.text.strip()
-            # JSONブロックの除去
-            for marker in ['```json', '```']:
-                if marker in result_text:
-                    parts = result_text.split(marker)
-                    if len(parts) >= 2:
-                        result_text = parts[1].split('```')[0].strip()
-                        break
-            
-            result = json.loads(result_text)
-            print(f"[GEMINI] ✓ 分析成功: category={result.get('category')}")
-            return result
-            
+  }"""
+
+def _generate_with_retry(prompt, label):
+    """429 の場合のみ再試行する（待機はリミッタが行う）。失敗時は None"""
+    for attempt in range(4):  # 最大4回試行
+        try:
+            return generate_text(prompt, priority=BACKGROUND)
         except Exception as e:
-            err = str(e)
-            if "429" in err or "RESOURCE_EXHAUSTED" in err:
-                wait = 30 * (2 ** attempt)
-                print(f"[RATE LIMIT] 429エラー、{wait}秒待機... (試行{attempt+1}/4)")
-                time.sleep(wait)
-            elif "json" in err.lower() or "JSONDecodeError" in err:
-                print(f"[GEMINI] JSONパースエラー: {err[:100]}")
-                # JSON失敗の場合は再試行しない
-                return {}
+            if is_rate_limit_error(e):
+                logger.warning(f"[RATE LIMIT] 429エラー、リミッタ待機後に再試行 (試行{attempt+1}/4)")
+                if attempt < 3:
+                    GEMINI_RETRIES.inc()
             else:
-                print(f"[GEMINI] 予期せぬエラー: {err[:200]}")
-                return {}
+                logger.warning(f"[GEMINI] 予期せぬエラー ({label}): {str(e)[:200]}")
+                return None
     
-    print("[GEMINI] 最大試行数超過、デフォルト値使用")
-    return {}
-
-def fetch_rss(url):
-    feed = feedparser.parse(url)
-    items = []
-    for entry in feed.entries[:5]: # Top 5 recent
-        items.append({
-            "title": entry.get("title", ""),
-            "url": entry.get("link", url),
-            "summary": entry.get("summary", ""),
-            "published_at": datetime.datetime.now() # Simplified
-        })
-    return items
-
-def fetch_youtube(channel_id):
-    yt_url = f"https://www.youtube.com/feeds/videos.xml?channel_id={channel_id}"
-    return fetch_rss(yt_url)
+    logger.warning("[GEMINI] 最大試行数超過、デフォルト値使用")
+    GEMINI_GAVE_UP.inc()
+    return None
+
+def _request_analysis(prompt, label):
+    result_text = _generate_with_retry(prompt, label)
+    if result_text is None:
+        return {}
     
-def get_youtube_transcript(video_id):
     try:
-        transcript = YouTubeTranscriptApi.get_transcript(video_id, languages=['en', 'ja'])
-        text = " ".join([t['text'] for t in transcript])
-        return text
+        result = json.loads(strip_code_fence(result_text))
     except Exception as e:
-        print(f"Failed to get transcript for {video_id}: {e}")
-        return ""
+        # JSON失敗の場合は再試行しない
+        logger.warning(f"[GEMINI] JSONパースエラー: {str(e)[:100]}")
+        return {}
+    logger.info(f"[GEMINI] ✓ 分析成功: category={result.get('category')}")
+    return result
+
+def get_gemini_analysis(title: str, text: str, source_type: str) -> dict:
+    if not has_api_key():
+        logger.warning("[GEMINI] APIキーなし、デフォルト値使用")
+        return {}
+    
+    safe_text = (text or "")[:ANALYSIS_TEXT_CHARS]
+    prompt = f"""以下のAI/テクノロジーニュース記事を分析してJSON形式で返してください。
+            
+タイトル: {title}
+種別: {source_type}
+記事内容:
+{safe_text}
+
+必ず以下のJSON形式のみで回答（```不要）:
+{{
+{ANALYSIS_FIELDS}
+}}"""
+    logger.info(f"[GEMINI] 分析開始: {title[:50]}")
+    return _request_analysis(prompt, title[:50])
+
+def is_long_text(text):
+    return len(text or "") > LONG_TEXT_CHARS
+
+def split_chunks(text, size=None):
+    """文の区切り（なければ空白）で size 文字程度ずつに分ける。同じ本文なら常に同じ分け方になる"""
+    size = size or LONG_TEXT_CHUNK_CHARS
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + size)
+        if end < len(text):
+            window = text[start + size // 2:end]
+            for sep in ("\n", "。", ". ", "? ", "! ", " "):
+                pos = window.rfind(sep)
+                if pos >= 0:
+                    end = start + size // 2 + pos + len(sep)
+                    break
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+def chunk_key(chunk):
+    return "chunk:" + analysis_cache.content_key("", chunk, len(chunk))
+
+def summarize_chunk(title, chunk, index, total):
+    """長文の一部を要点の箇条書きにする（map）。失敗時は None"""
+    prompt = f"""以下は「{title}」の本文・字幕の一部（{index}/{total}）です。
+この部分で述べられている主張・発表・数値・固有名詞を、日本語の箇条書き5項目以内でまとめてください。
+箇条書きのみで回答:
+
+{chunk}"""
+    text = _generate_with_retry(prompt, f"{title[:30]} part {index}/{total}")
+    return text.strip() if text and text.strip() else None
+
+def combine_chunk_notes(title, notes, source_type):
+    """部分毎の要点から記事全体の分析 JSON を作る（reduce）"""
+    parts = "\n\n".join(f"[パート{i}/{len(notes)}]\n{n}" for i, n in enumerate(notes, 1))
+    kind = "動画" if source_type == "youtube" else "記事"
+    prompt = f"""以下は長いAI/テクノロジー関連の{kind}を、パート毎に要点化したものです。
+全体を通して分析し、JSON形式で返してください。
+
+タイトル: {title}
+種別: {source_type}
+パート毎の要点:
+{parts}
 
-def score_article(details):
+必ず以下のJSON形式のみで回答（```不要）:
+{{
+{ANALYSIS_FIELDS}
+}}"""
+    logger.info(f"[GEMINI] 長文分析開始（{len(notes)}パート）: {title[:50]}")
+    return _request_analysis(prompt, title[:50])
+
+def analyze_long_texts(db, entries):
+    """長文を分割→部分毎に並列で要約→統合して分析する。
+
+    部分の要約は本文のハッシュ毎にキャッシュするので、再実行時は変わった部分だけを要約し直す。
+    戻り値: 入力と同じ順序の分析結果（一部でも要約できなかったものは {}）
+    """
+    if not has_api_key():
+        return [{} for _ in entries]
+    
+    plans = []
+    for entry in entries:
+        chunks = split_chunks(entry["text"])
+        if len(chunks) > LONG_TEXT_MAX_CHUNKS:
+            logger.info(f"[GEMINI] 長文を先頭{LONG_TEXT_MAX_CHUNKS}パートに制限: {entry['title'][:50]}")
+            chunks = chunks[:LONG_TEXT_MAX_CHUNKS]
+        plans.append([(chunk_key(c), c) for c in chunks])
+    
+    # ヒット記録の書き込みを Gemini の応答待ちより前に始めないよう autoflush を止めて引く
+    with db.no_autoflush:
+        notes = {key: row.get("notes") for key, row in
+                 analysis_cache.get_cached(db, [k for plan in plans for k, _ in plan]).items()}
+    jobs = {}
+    for entry, plan in zip(entries, plans):
+        for i, (key, chunk) in enumerate(plan, 1):
+            if not notes.get(key) and key not in jobs:
+                jobs[key] = (entry["title"], chunk, i, len(plan))
+    if notes:
+        logger.info(f"[CACHE] 長文パート: {len(notes)}/{len(notes) + len(jobs)}件ヒット")
+    
+    fresh = {}
+    with ThreadPoolExecutor(max_workers=max(1, LONG_TEXT_WORKERS), thread_name_prefix="chunk") as pool:
+        futures = {key: pool.submit(summarize_chunk, *args) for key, args in jobs.items()}
+        for key, future in futures.items():
+            if future.result():
+                fresh[key] = future.result()
+        notes.update(fresh)
+        
+        def reduce(entry, plan):
+            if not all(notes.get(key) for key, _ in plan):
+                logger.warning(f"[GEMINI] 長文の一部を要約できませんでした: {entry['title'][:50]}")
+                return {}
+            return combine_chunk_notes(entry["title"], [notes[key] for key, _ in plan], entry["source_type"])
+        results = list(pool.map(reduce, entries, plans))
+    
+    # 応答待ちがすべて終わってから書く
+    for key, text in fresh.items():
+        analysis_cache.store(db, key, {"notes": text})
+    return results
+
+def _split_batches(entries):
+    """件数とトークン予算でエントリを分割する"""
+    batch, batch_tokens = [], 0
+    for i, entry in enumerate(entries):
+        tokens = estimate_tokens(entry["title"]) + estimate_tokens(entry["text"][:ANALYSIS_TEXT_CHARS])
+        if batch and (len(batch) >= ANALYSIS_BATCH_SIZE or batch_tokens + tokens > ANALYSIS_BATCH_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+def _analyze_one_batch(entries):
+    """バッチ応答の id -> 分析結果。呼び出し自体が失敗した（429 の再試行切れなど）場合は None"""
+    articles_payload = [
+        {
+            "id": i,
+            "title": e["title"],
+            "type": e["source_type"],
+            "content": (e["text"] or "")[:ANALYSIS_TEXT_CHARS],
+        }
+        for i, e in enumerate(entries)
+    ]
+    prompt = f"""以下の{len(entries)}件のAI/テクノロジーニュース記事をそれぞれ分析し、JSON配列で返してください。
+
+記事一覧:
+{json.dumps(articles_payload, ensure_ascii=False)}
+
+必ず記事ごとに1要素、入力と同じ "id" を付けた以下のJSON配列のみで回答（```不要）:
+[
+{{
+  "id": 記事のid,
+{ANALYSIS_FIELDS}
+}}
+]"""
+    logger.info(f"[GEMINI] バッチ分析開始: {len(entries)}件")
+    result_text = _generate_with_retry(prompt, f"batch of {len(entries)}")
+    if result_text is None:
+        return None
     try:
-        return details.get("relevance", 10) + details.get("reliability", 10) + details.get("freshness", 10) + details.get("virality", 5)
-    except:
-        return 0
+        parsed = json.loads(strip_code_fence(result_text))
+    except Exception as e:
+        logger.warning(f"[GEMINI] バッチJSONパースエラー: {str(e)[:100]}")
+        return {}
+    if not isinstance(parsed, list):
+        return {}
+    
+    results = {}
+    for r in parsed:
+        if isinstance(r, dict) and isinstance(r.get("id"), int) and r.get("summary_ja"):
+            results[r.pop("id")] = r
+    return results
 
-def collect_data():
-    db = SessionLocal()
-    sources = db.query(CustomSource).filter(CustomSource.enabled == True).all()
+def get_gemini_analysis_batch(entries) -> list:
+    """複数記事をまとめて分析する。
+
+    entries は {"title", "text", "source_type"} のリスト。戻り値は入力と同じ順序の分析結果
+    （失敗した記事は {}）。バッチ応答が壊れている・欠けている記事だけを1件ずつ再分析する。
+    バッチの呼び出し自体が失敗した場合は1件ずつにはせず（枠切れの時にリクエストを増やさない）、
+    そのバッチの記事は失敗として次回の収集に回す。
+    """
+    if not has_api_key():
+        logger.warning("[GEMINI] APIキーなし、デフォルト値使用")
+        return [{} for _ in entries]
     
-    for source in sources:
+    results = [None] * len(entries)
+    for indices in _split_batches(entries):
+        if len(indices) == 1:
+            continue
+        batch_results = _analyze_one_batch([entries[i] for i in indices])
+        if batch_results is None:
+            logger.warning(f"[GEMINI] バッチ分析に失敗: {len(indices)}件を次回に回します")
+            for i in indices:
+                results[i] = {}
+            continue
+        for local_id, i in enumerate(indices):
+            if local_id in batch_results:
+                results[i] = batch_results[local_id]
+        logger.info(f"[GEMINI] ✓ バッチ分析: {len(batch_results)}/{len(indices)}件成功")
+    
+    for i, entry in enumerate(entries):
+        if results[i] is None:
+            results[i] = get_gemini_analysis(entry["title"], entry["text"], entry["source_type"])
+    return results
+
+def load_feed_validators(db):
+    return {
+        c.source_id: {"etag": c.etag, "last_modified": c.last_modified, "content_hash": c.content_hash}
+        for c in db.query(FeedCache).all()
+    }
+
+def save_feed_validators(db, source_id, validators):
+    if validators is None:
+        return
+    cache = db.query(FeedCache).filter(FeedCache.source_id == source_id).first()
+    if not cache:
+        cache = FeedCache(source_id=source_id)
+        db.add(cache)
+    cache.etag = validators.get("etag")
+    cache.last_modified = validators.get("last_modified")
+    cache.content_hash = validators.get("content_hash")
+    cache.checked_at = datetime.datetime.now()
+
+MAX_PER_SOURCE = 3
+
+def build_article(source, item, text_to_analyze, transcript, analysis, rules=None):
+    bonus = 0.0
+    if rules:
+        bonus, _ = rules.match(rule_text(item["title"], item.get("summary", ""), analysis.get("summary_ja", "要約なし"),
+                                         analysis.get("tags", []), analysis.get("company_tags", [])))
+    score = total_score(analysis.get("score_details", {}), source.priority_bonus, bonus)
+    return Article(
+        title=item["title"],
+        summary=item.get("summary", ""),
+        summary_ja=analysis.get("summary_ja", "要約なし"),
+        business_point=analysis.get("business_point", ""),
+        # 字幕を分析した動画は本文と字幕が同じなので、字幕列にだけ持つ
+        full_text=None if transcript and text_to_analyze == transcript else text_to_analyze,
+        url=item["url"],
+        source_name=source.display_name,
+        source_type=source.type,
+        category=analysis.get("category", "未分類"),
+        tags=analysis.get("tags", []),
+        company_tags=analysis.get("company_tags", []),
+        priority_label=analysis.get("priority_label", "LOW"),
+        trust_level=analysis.get("trust_level", "LOW"),
+        trust_reason=analysis.get("trust_reason", ""),
+        score=score,
+        score_details=analysis.get("score_details", {}),
+        published_at=item["published_at"],
+        fetched_at=datetime.datetime.now(),
+        transcript=transcript,
+        source_id=source.id
+    )
+
+def analyze_with_cache(db, pending, memo=None):
+    """同一内容（正規化後）の分析結果はキャッシュから再利用し、未分析の内容だけを Gemini に送る。
+
+    memo はこの実行中に得た分析結果（まだ書き込んでいないキャッシュの代わりに引く）。
+    新しく分析した記事には p["analysis_key"] を付け、save_analyzed で記事と一緒にキャッシュへ書く。
+    """
+    memo = {} if memo is None else memo
+    # 長文は全体を分析に使うので、キーも本文全体から作る
+    keys = [
+        analysis_cache.content_key(p["item"]["title"], p["text"], len(p["text"]) if is_long_text(p["text"]) else ANALYSIS_TEXT_CHARS)
+        for p in pending
+    ]
+    cached = {key: memo[key] for key in keys if key in memo}
+    lookup = [key for key in keys if key not in cached]
+    if lookup:
+        cached.update(analysis_cache.get_cached(db, lookup))
+    
+    # 同じ実行内で同一内容が複数ソースから来た場合も1回だけ分析する
+    misses = {}
+    for p, key in zip(pending, keys):
+        if key not in cached and key not in misses:
+            misses[key] = {"title": p["item"]["title"], "text": p["text"], "source_type": p["source"].type}
+    if cached:
+        logger.info(f"[CACHE] 分析キャッシュ: {len(pending) - len(misses)}/{len(pending)}件ヒット")
+    
+    # 長文の分析に失敗したものは先頭だけで分析する（キャッシュはせず次回また長文として試す）
+    fallback = set()
+    long_keys = [key for key, entry in misses.items() if is_long_text(entry["text"])]
+    if long_keys:
+        for key, analysis in zip(long_keys, analyze_long_texts(db, [misses[key] for key in long_keys])):
+            if analysis:
+                cached[key] = analysis
+            else:
+                fallback.add(key)
+    short_keys = [key for key in misses if key not in cached]
+    if short_keys:
+        fresh = get_gemini_analysis_batch([misses[key] for key in short_keys])
+        for key, analysis in zip(short_keys, fresh):
+            if analysis:
+                cached[key] = analysis
+    memo.update({key: analysis for key, analysis in cached.items() if key not in fallback})
+    for p, key in zip(pending, keys):
+        p["analysis_key"] = key if key in misses and key not in fallback else None
+    return [dict(cached[key]) if key in cached else {} for key in keys]
+
+def index_embeddings(saved):
+    # ベクトル索引の失敗で収集自体は止めない（python embeddings.py rebuild で復旧できる）
+    try:
+        get_store().add([i for i, _ in saved], [t for _, t in saved])
+    except Exception as e:
+        logger.warning(f"[EMBED] ベクトル索引の更新に失敗: {e}")
+
+def no_progress(source_id, status, **fields):
+    pass
+
+def save_analyzed(db, analyzed, finished_sources, failed_source_ids, detector, progress=no_progress, rules=None):
+    """分析済みの記事と、処理を終えたソースの取得状態を1トランザクションで保存する。
+
+    failed_source_ids は分析に失敗した記事があるソース。finished_sources に含まれたものだけ取り除く。
+    rules（scoring.KeywordRules）を渡すとキーワードルールのボーナスをスコアに加える。
+    """
+    saved = []
+    saved_titles = []
+    saved_by_source = {}
+    done = []
+    try:
+        for p, analysis in analyzed:
+            if p.get("analysis_key"):
+                analysis_cache.store(db, p["analysis_key"], analysis)
+            # 他のワーカーが別ソースから同じ URL を先に保存している場合がある
+            if db.query(Article.id).filter(Article.url == p["item"]["url"]).first():
+                logger.info(f"[SKIP] 保存済み: {p['item']['title'][:50]}")
+                continue
+            article = build_article(p["source"], p["item"], p["text"], p["transcript"], analysis, rules)
+            db.add(article)
+            db.flush()
+            detector.on_saved(db, p, article)
+            record_article(db, article)
+            saved.append((article.id, embedding_text(article.title, article.summary_ja, article.full_text or article.transcript)))
+            saved_titles.append(article.title)
+            saved_by_source[p["source"].id] = saved_by_source.get(p["source"].id, 0) + 1
+        
+        # 検証子は記事と同じか後のトランザクションで保存する（途中で落ちた場合は次回フル取得）
+        # 分析に失敗した記事があるソースは検証子を保存せず、次回も本文を取得して再試行する
+        now = datetime.datetime.now()
+        for source, validators in finished_sources:
+            if source.id not in failed_source_ids:
+                save_feed_validators(db, source.id, validators)
+            db.query(CustomSource).filter(CustomSource.id == source.id).update(
+                {"last_fetched": now}, synchronize_session=False
+            )
+            done.append((source.id, source.id in failed_source_ids))
+        db.commit()
+    finally:
+        analyzed.clear()
+        finished_sources.clear()
+    
+    for source_id, _ in done:
+        failed_source_ids.discard(source_id)
+    for title in saved_titles:
+        logger.info(f"[SAVE] 保存: {title[:50]}")
+    # 進捗の記録は別セッションで書くので、コミットして書き込みロックを手放した後に呼ぶ
+    for source_id, had_failures in done:
+        progress(source_id, "done", items_saved=saved_by_source.get(source_id, 0),
+                 error="分析に失敗した記事があります（次回再取得）" if had_failures else None)
+    # コミット後に索引する（ロールバックされた ID を索引に残さない）
+    if saved:
+        index_embeddings(saved)
+    return len(saved)
+
+class Ingest:
+    """収集1回分のパイプライン。
+
+    fetch（ソース毎に並列 HTTP）→ dedup（重複判定・件数制限）→ enrich（字幕取得）
+    → analyze（Gemini バッチ分析）→ persist（COLLECT_COMMIT_SIZE 件ずつ書き込み）
+    の各段を有界キューでつなぎ、段毎の並列度で同時に動かす。Gemini の応答を待つ間も
+    取得・字幕・書き込みが進むので、分析の枠を空けずに使い切れる。
+
+    ソースの検証子は、そのソースの記事がすべて persist に届いてから保存する。
+    ソース毎の件数・所要時間は reports に集計する（収集後に source_reports に保存）。
+    """
+
+    def __init__(self, db, progress=no_progress):
+        self.db = db  # dedup 段専用
+        self.persist_db = SessionLocal()  # persist 段専用
+        self.user_progress = progress
+        self.progress = self.track_progress
+        self.reports = {}  # source_id -> ソース毎の集計
+        self.reports_lock = threading.Lock()
+        self.started = time.monotonic()
+        self.detector = DuplicateDetector(db)
+        self.rules = load_rules(db)  # 収集中はルールを固定する（途中の変更は再採点で反映）
+        self.transcripts = TranscriptPrefetcher()
+        self.memo = {}
+        self.analyzed = []
+        self.finished_sources = []
+        self.failed_source_ids = set()
+        self.tracking = {}  # source_id -> 記事の到着状況
+        self.done_source_ids = set()  # 検証子を保存する（しない）と決めたソース
+        self.saved_total = 0
+        self.persist = Stage("persist", self.persist_batch, workers=1,
+                             batch_size=COLLECT_COMMIT_SIZE, linger=PERSIST_LINGER_SECONDS)
+        self.analyze = Stage("analyze", self.analyze_batch, workers=ANALYZE_WORKERS,
+                             batch_size=ANALYSIS_BATCH_SIZE, linger=ANALYSIS_LINGER_SECONDS)
+        self.enrich = Stage("enrich", self.enrich_batch, workers=TRANSCRIPT_WORKERS)
+        # 重複判定は同じ実行内の分析待ち記事とも比べるため、1スレッドで順に行う
+        self.dedup = Stage("dedup", self.dedup_batch, workers=1)
+
+    def source_report(self, source_id):
+        # reports_lock を持って呼ぶ
+        report = self.reports.get(source_id)
+        if report is None:
+            report = self.reports[source_id] = {
+                "source_id": source_id, "source_name": None, "fetched": 0, "not_modified": False, "skipped": 0,
+                "analyzed": 0, "analysis_failed": 0, "saved": 0, "fetch_seconds": None, "duration_seconds": None,
+                "status": "incomplete", "error": None,
+            }
+        return report
+
+    def track_progress(self, source_id, status, **fields):
+        """ソースの完了・失敗をレポートに記録してから呼び出し元の progress に渡す"""
+        if status in ("done", "failed"):
+            with self.reports_lock:
+                report = self.source_report(source_id)
+                report["status"] = status
+                report["duration_seconds"] = round(time.monotonic() - self.started, 3)
+                if "items_saved" in fields:
+                    report["saved"] = fields["items_saved"]
+                if fields.get("error"):
+                    report["error"] = fields["error"]
+        self.user_progress(source_id, status, **fields)
+
+    def run(self, sources, validators):
+        pipeline = Pipeline([self.dedup, self.enrich, self.analyze, self.persist]).start()
+        self.started = started = time.monotonic()
+        with self.reports_lock:
+            for source in sources:
+                self.source_report(source.id)["source_name"] = source.display_name
+        fetched = 0
+        logger.info(f"Fetching {len(sources)} sources concurrently")
+        for source, items, new_validators, fetch_error, seconds in fetch_sources(sources, validators):
+            fetched += 1
+            with self.reports_lock:
+                report = self.source_report(source.id)
+                report.update(fetched=len(items or []), not_modified=items is None, fetch_seconds=round(seconds, 3))
+            if fetch_error:
+                logger.error(f"fetching source {source.url}: {fetch_error}")
+                self.progress(source.id, "failed", error=f"fetch: {fetch_error}"[:500])
+                continue
+            if items is None:
+                # 304 または本文ハッシュが前回と同一: パースも重複チェックも不要
+                logger.info(f"[{source.type.upper()}] {source.display_name}: 変更なし")
+                self.progress(source.id, "running", items_found=0)
+            else:
+                logger.info(f"[{source.type.upper()}] {source.display_name}: {len(items)}件取得")
+                self.progress(source.id, "running", items_found=len(items))
+            self.dedup.put((source, items, new_validators))
+        fetch_seconds = time.monotonic() - started
+        stats = pipeline.close()
+        self.transcripts.close()
         try:
-            print(f"Fetching source: {source.display_name} ({source.url})")
-            items = []
-            if source.type == "rss":
-                items = fetch_rss(source.url)
-            elif source.type == "youtube":
-                items = fetch_youtube(source.url)
-                
-            print(f"[{source.type.upper()}] {source.display_name}: {len(items)}件取得")
-                
-            MAX_PER_SOURCE = 3
-            saved_count = 0
-                
-            for item in items:
-                if saved_count >= MAX_PER_SOURCE:
-                    print(f"[LIMIT] {source.display_name}: 最大{MAX_PER_SOURCE}件に達しました")
-                    break
+            # 保存段の最後の書き込みより後に取得し終えた字幕
+            if self.transcripts.flush(self.persist_db):
+                self.persist_db.commit()
+        except Exception as e:
+            logger.error(f"saving transcript cache: {e}")
+            self.persist_db.rollback()
+        self.persist_db.close()
+        logger.info(self.transcripts.summary())
+
+        for source_id in self.tracking:
+            logger.error(f"source {source_id}: 記事の一部が保存段に届かなかったため検証子を保存しません")
+        wall = max(1e-6, fetch_seconds)
+        fetch_stats = {"stage": "fetch", "workers": FETCH_WORKERS, "items": fetched, "batches": fetched, "errors": 0,
+                       "busy_seconds": round(fetch_seconds, 3), "utilization": None,
+                       "throughput": round(fetched / wall, 3), "backlog": 0, "max_backlog": 0}
+        stats = [fetch_stats] + stats
+        for s in stats:
+            STAGE_ITEMS.inc(s["items"], stage=s["stage"])
+            STAGE_BUSY_SECONDS.inc(s["busy_seconds"], stage=s["stage"])
+        for report in self.reports.values():
+            for result in ("fetched", "skipped", "analyzed", "analysis_failed", "saved"):
+                if report[result]:
+                    SOURCE_ITEMS.inc(report[result], result=result)
+        return stats
+
+    def dedup_batch(self, batch):
+        for source, items, validators in batch:
+            queued = []
+            error = None
+            try:
+                for item in items or []:
+                    if len(queued) >= MAX_PER_SOURCE:
+                        logger.info(f"[LIMIT] {source.display_name}: 最大{MAX_PER_SOURCE}件に達しました")
+                        # 残りの新着を次回も取得するよう、今回の検証子（304・本文ハッシュ）は保存しない
+                        validators = None
+                        break
                     
-                # Check exist
-                if db.query(Article).filter(Article.url == item["url"]).first():
-                    print(f"[SKIP] 重複スキップ: {item['title'][:50]}")
-                    continue
+                    # Check exist
+                    if self.db.query(Article.id).filter(Article.url == item["url"]).first():
+                        logger.info(f"[SKIP] 重複スキップ: {item['title'][:50]}")
+                        continue
                     
-                text_to_analyze = item["summary"]
-                transcript = ""
-                
-                if source.type == "youtube":
-                    video_id = item["url"].split("v=")[-1]
-                    if video_id:
-                        transcript = get_youtube_transcript(video_id)
-                        if transcript:
-                            text_to_analyze = transcript
-                
-                analysis = get_gemini_analysis(item["title"], text_to_analyze, source.type)
-                if not analysis:
-                    print(f"[SKIP] {item['title'][:50]} due to analysis failure.")
-                    continue
-                
-                score = score_article(analysis.get("score_details", {}))
-                
-                article = Article(
-                    title=item["title"],
-                    summary=item.get("summary", ""),
-                    summary_ja=analysis.get("summary_ja", "要約なし"),
-                    business_point=analysis.get("business_point", ""),
-                    full_text=text_to_analyze,
-                    url=item["url"],
-                    source_name=source.display_name,
-                    source_type=source.type,
-                    category=analysis.get("category", "未分類"),
-                    tags=analysis.get("tags", []),
-                    company_tags=analysis.get("company_tags", []),
-                    priority_label=analysis.get("priority_label", "LOW"),
-                    trust_level=analysis.get("trust_level", "LOW"),
-                    trust_reason=analysis.get("trust_reason", ""),
-                    score=score,
-                    score_details=analysis.get("score_details", {}),
-                    published_at=item["published_at"],
-                    fetched_at=datetime.datetime.now(),
-                    transcript=transcript,
-                    source_id=source.id
-                )
-                db.add(article)
-                db.commit()
-                print(f"[SAVE] 保存: {article.title[:50]}")
-                saved_count += 1
-                
-            source.last_fetched = datetime.datetime.now()
+                    # URL 正規化と MinHash による準重複は正規記事へのエイリアスとして記録する
+                    ref, reason, score = self.detector.check(self.db, item)
+                    if ref is not None and self.detector.link(self.db, ref, item["url"], reason, score, source.id):
+                        logger.info(f"[SKIP] 準重複スキップ ({reason}, {score:.2f}): {item['title'][:50]}")
+                        continue
+                    
+                    p = {"source": source, "item": item, "text": item["summary"], "transcript": ""}
+                    if source.type == "youtube":
+                        p["video_id"] = transcripts.video_id(item["url"])
+                    self.detector.register_pending(p)
+                    queued.append(p)
+                # 既存記事へのエイリアス
+                if self.db.new:
+                    self.db.commit()
+                # 新着の動画の字幕は、分析の順番を待たずにまとめて取りに行く
+                self.transcripts.prefetch(self.db, [p["video_id"] for p in queued if p.get("video_id")])
+            except Exception as e:
+                import traceback
+                logger.error(f"processing source {source.url}: {e}")
+                traceback.print_exc()
+                self.db.rollback()
+                error = str(e)[:500]
+                self.progress(source.id, "failed", error=error)
+            with self.reports_lock:
+                self.source_report(source.id)["skipped"] = len(items or []) - len(queued)
+            for p in queued:
+                self.enrich.put(p)
+            self.persist.put(("source", source, validators, len(queued), error))
+
+    def enrich_batch(self, batch):
+        for p in batch:
+            if p.get("video_id"):
+                transcript = self.transcripts.get(p["video_id"])
+                if transcript:
+                    p["transcript"] = transcript
+                    p["text"] = transcript
+            self.analyze.put(p)
+
+    def analyze_batch(self, batch):
+        db = SessionLocal()
+        try:
+            analyses = analyze_with_cache(db, batch, self.memo)
+            # キャッシュのヒット記録と長文パートの要約だけを書く（Gemini の応答待ちの間は書き込みロックを持たない）
             db.commit()
-            
         except Exception as e:
             import traceback
-            print(f"[ERROR] processing source {source.url}: {e}")
+            logger.error(f"analyzing batch: {e}")
+            traceback.print_exc()
+            db.rollback()
+            analyses = [{} for _ in batch]
+        finally:
+            db.close()
+        for p, analysis in zip(batch, analyses):
+            if not analysis:
+                logger.warning(f"[SKIP] {p['item']['title'][:50]} due to analysis failure.")
+            self.persist.put(("item", p, analysis))
+
+    def persist_batch(self, batch):
+        items = []
+        for message in batch:
+            if message[0] == "item":
+                _, p, analysis = message
+                items.append(p)
+                state = self.tracking.setdefault(p["source"].id, {"arrived": 0})
+                state["arrived"] += 1
+                with self.reports_lock:
+                    self.source_report(p["source"].id)["analyzed" if analysis else "analysis_failed"] += 1
+                if analysis:
+                    self.analyzed.append((p, analysis))
+                else:
+                    self.failed_source_ids.add(p["source"].id)
+                    self.refetch_aliases(p)
+            else:
+                _, source, validators, count, error = message
+                state = self.tracking.setdefault(source.id, {"arrived": 0})
+                state.update(source=source, validators=validators, expected=count, error=error)
+        
+        # 記事がすべて届いたソースは、この書き込みで検証子を保存できる
+        for source_id, state in list(self.tracking.items()):
+            if "expected" in state and state["arrived"] >= state["expected"]:
+                del self.tracking[source_id]
+                self.done_source_ids.add(source_id)
+                if state["error"]:
+                    self.failed_source_ids.discard(source_id)
+                    continue
+                self.finished_sources.append((state["source"], state["validators"]))
+        if not self.analyzed and not self.finished_sources:
+            return
+        
+        finishing = [source for source, _ in self.finished_sources]
+        try:
+            self.transcripts.flush(self.persist_db)
+            self.saved_total += save_analyzed(self.persist_db, self.analyzed, self.finished_sources,
+                                              self.failed_source_ids, self.detector, self.progress, self.rules)
+        except Exception as e:
+            import traceback
+            logger.error(f"saving analyzed articles: {e}")
             traceback.print_exc()
+            self.persist_db.rollback()
+            # 失われた記事のソースは検証子を保存せず、次回もう一度取得する
+            for p in items:
+                self.failed_source_ids.add(p["source"].id)
+                self.refetch_aliases(p)
+            for source in finishing:
+                self.failed_source_ids.discard(source.id)
+                self.progress(source.id, "failed", error=str(e)[:500])
+
+    def refetch_aliases(self, p):
+        """保存されなかった記事の重複として読み飛ばした記事を、次回それ自体の記事として取り直させる。
+
+        まだ処理中のソースは検証子を保存しない。既に検証子を保存したソースは消して、次回フル取得させる。
+        """
+        source_ids = self.detector.on_failed(p)
+        if not source_ids:
+            return
+        logger.warning(f"[DEDUP] 保存されなかった記事の重複を次回再取得: {p['item']['title'][:50]}（{len(source_ids)}ソース）")
+        finished = []
+        for source_id in source_ids:
+            if source_id in self.done_source_ids:
+                finished.append(source_id)
+            else:
+                self.failed_source_ids.add(source_id)
+        if finished:
+            try:
+                self.persist_db.query(FeedCache).filter(FeedCache.source_id.in_(finished)).delete(synchronize_session=False)
+                self.persist_db.commit()
+            except Exception as e:
+                logger.error(f"clearing feed validators: {e}")
+                self.persist_db.rollback()
+
+def save_collection_report(db, reports, stats, started_at, finished_at, job_ids=None):
+    """収集1回分の集計を collection_reports / source_reports に保存し、保存期間を過ぎたものを消す。
+
+    job_ids はワーカーから呼ばれた場合の source_id -> ジョブ ID。戻り値: レポート ID
+    """
+    reports = sorted(reports, key=lambda r: r["source_id"])
+    report = CollectionReport(
+        started_at=started_at,
+        finished_at=finished_at,
+        duration_seconds=round((finished_at - started_at).total_seconds(), 3),
+        source_count=len(reports),
+        items_fetched=sum(r["fetched"] for r in reports),
+        items_skipped=sum(r["skipped"] for r in reports),
+        items_analyzed=sum(r["analyzed"] for r in reports),
+        items_saved=sum(r["saved"] for r in reports),
+        stages=stats,
+    )
+    db.add(report)
+    db.flush()
+    db.add_all(SourceReport(report_id=report.id, job_id=(job_ids or {}).get(r["source_id"]), **r) for r in reports)
+    cutoff = finished_at - datetime.timedelta(days=COLLECTION_REPORT_RETENTION_DAYS)
+    old_ids = select(CollectionReport.id).where(CollectionReport.started_at < cutoff).scalar_subquery()
+    db.execute(delete(SourceReport).where(SourceReport.report_id.in_(old_ids)))
+    db.execute(delete(CollectionReport).where(CollectionReport.started_at < cutoff))
+    db.commit()
+    return report.id
+
+def collect_data(source_ids=None, progress=no_progress, job_ids=None):
+    """有効なソースを収集する。source_ids を渡すとそのソースだけを対象にする。
+
+    progress(source_id, status, **fields) はソース毎の進捗（running / done / failed）を受け取る。
+    ソース毎の件数・所要時間は収集レポートとして保存する（job_ids: source_id -> ジョブ ID）。
+    戻り値: 段毎の処理件数・スループット・滞留のリスト
+    """
+    started_at = datetime.datetime.now()
+    db = SessionLocal()
+    q = db.query(CustomSource).filter(CustomSource.enabled == True)
+    if source_ids is not None:
+        q = q.filter(CustomSource.id.in_(list(source_ids)))
+    sources = q.all()
+    # ソースは各段のスレッドから読むだけなので、セッションから切り離して期限切れ（再読込）を起こさない
+    for source in sources:
+        db.expunge(source)
+    validators = load_feed_validators(db)
+    
+    ingest = Ingest(db, progress)
+    stats = ingest.run(sources, validators)
+    logger.info("[PIPELINE] 段毎の集計\n" + format_stats(stats))
+    finished_at = datetime.datetime.now()
+    RUN_SECONDS.observe((finished_at - started_at).total_seconds())
+    try:
+        report_id = save_collection_report(db, ingest.reports.values(), stats, started_at, finished_at, job_ids)
+        logger.info(f"[REPORT] 収集レポート{report_id}を保存")
+    except Exception as e:
+        logger.error(f"saving collection report: {e}")
+        db.rollback()
+    
+    try:
+        analysis_cache.evict(db)
+    except Exception as e:
+        logger.error(f"evicting analysis cache: {e}")
+    try:
+        transcripts.evict(db)
+    except Exception as e:
+        logger.error(f"evicting transcript cache: {e}")
             
+    if ingest.saved_total:
+        try:
+            invalidate_search_cache(db)
+        except Exception as e:
+            logger.error(f"invalidating search cache: {e}")
+            db.rollback()
+        try:
+            render_feeds(db)
+        except Exception as e:
+            logger.error(f"rendering feeds: {e}")
     db.close()
-    print("Collection finished.")
+    logger.info("Collection finished.")
+    return stats
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
+    from database import init_db
     load_dotenv()
+    metrics.setup_logging()
+    # 古い DB でも、収集が使うテーブルとマイグレーションを先に用意する
+    init_db()
     collect_data()
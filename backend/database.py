@@ -1,24 +1,91 @@
 import os
 import sys
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+import logging
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
 
 # Ensure we can import models when run directly
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from models import Base
+import metrics
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
 DATABASE_PATH = os.getenv("DATABASE_PATH", "/data/ai_knowledge_hub.db")
 db_dir = os.path.dirname(os.path.abspath(DATABASE_PATH))
 os.makedirs(db_dir, exist_ok=True)
-print(f"[DB] データベースパス: {os.path.abspath(DATABASE_PATH)}")
 DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+# 接続プールの大きさ。同時に DB を読むリクエスト数の上限になる
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# 接続毎に流す PRAGMA。空文字にした項目は設定しない（SQLite の既定値のまま）
+# WAL: 収集中の書き込みと API の読み込みが互いを待たない。NORMAL: WAL ではコミット毎の fsync を省いても壊れない
+SQLITE_PRAGMAS = [
+    ("journal_mode", os.environ.get("SQLITE_JOURNAL_MODE", "WAL")),
+    ("synchronous", os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")),
+    # 負の値は KiB 指定（既定 64MiB）
+    ("cache_size", os.environ.get("SQLITE_CACHE_SIZE", "-65536")),
+    ("mmap_size", os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    ("busy_timeout", os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    ("temp_store", os.environ.get("SQLITE_TEMP_STORE", "MEMORY")),
+]
+
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            if value:
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+event.listen(engine, "connect", apply_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期 API 用（aiosqlite）。書き込みと収集処理は同期 engine 側で行う。
+# aiosqlite の既定は NullPool（毎回接続を開く）なので、明示的にプールを使う
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+)
+event.listen(async_engine.sync_engine, "connect", apply_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# コミット（フラッシュを含む）の所要時間。同期・非同期どちらのセッションも Session のイベントを通る
+DB_COMMIT_SECONDS = metrics.histogram("db_commit_duration_seconds", "セッションのコミットにかかった時間（フラッシュを含む）")
+
+@event.listens_for(Session, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = time.perf_counter()
+
+@event.listens_for(Session, "after_commit")
+def _commit_finished(session):
+    start = session.info.pop("commit_started", None)
+    if start is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start)
+
+@event.listens_for(Session, "after_rollback")
+def _commit_aborted(session):
+    session.info.pop("commit_started", None)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -26,8 +93,16 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    from search_index import ensure_fts
+    from migrations import run_migrations
+    ensure_fts(engine)
+    run_migrations(engine)
     
     db = SessionLocal()
     from models import CustomSource
@@ -50,8 +125,11 @@ def init_db():
             source = CustomSource(type=stype, url=url, display_name=name, enabled=True)
             db.add(source)
         db.commit()
+    from stats import ensure_initialized
+    ensure_initialized(db)
     db.close()
-    print(f"Database initialized at {DATABASE_PATH}")
+    logger.info(f"[DB] データベースを初期化: {os.path.abspath(DATABASE_PATH)}")
 
 if __name__ == "__main__":
+    metrics.setup_logging()
     init_db()
@@ -0,0 +1,238 @@
+import os
+import re
+import array
+import random
+import hashlib
+import datetime
+import threading
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from analysis_cache import normalize
+from models import Article, ArticleAlias, ArticleFingerprint
+
+DEDUP_WINDOW_DAYS = int(os.environ.get("DEDUP_WINDOW_DAYS", "30"))
+# MinHash で推定した Jaccard 類似度がこれ以上なら同一記事とみなす
+DEDUP_MIN_SIMILARITY = float(os.environ.get("DEDUP_MIN_SIMILARITY", "0.7"))
+# 特徴量が少なすぎる短文は誤判定しやすいため URL 一致のみで判定する
+DEDUP_MIN_FEATURES = 6
+
+_NUM_PERM = 64
+_BANDS = 16  # 16バンド x 4行: 類似度 0.5 前後から候補に上がる
+_ROWS = _NUM_PERM // _BANDS
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(_NUM_PERM)]
+
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "mc_cid", "mc_eid", "ref", "ref_src", "ref_url", "si", "igshid", "cmpid"}
+MOBILE_PREFIXES = ("www.", "m.", "mobile.", "amp.")
+
+_WORD_RE = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u9fff]+")
+_CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]")
+_ARXIV_RE = re.compile(r"^/(?:abs|pdf)/([^/]+?)(?:v\d+)?(?:\.pdf)?/?$")
+
+def canonicalize_url(url):
+    """トラッキングパラメータ・モバイル用サブドメイン・arXiv の abs/pdf 差などを吸収した URL"""
+    try:
+        parts = urlsplit((url or "").strip())
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    for prefix in MOBILE_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+            break
+    path = parts.path or "/"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    ]
+
+    if host == "youtu.be":
+        host, query, path = "youtube.com", [("v", path.strip("/"))], "/watch"
+    elif host == "youtube.com" and path.startswith("/shorts/"):
+        query, path = [("v", path.split("/")[2])], "/watch"
+    elif host in ("arxiv.org", "export.arxiv.org"):
+        m = _ARXIV_RE.match(path)
+        if m:
+            host, path, query = "arxiv.org", f"/abs/{m.group(1)}", []
+
+    if host == "youtube.com":
+        query = [(k, v) for k, v in query if k == "v"]
+    if len(path) > 1:
+        path = path.rstrip("/")
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+def features(text):
+    """英数字は単語、日本語は文字バイグラムを特徴量にする"""
+    feats = []
+    for token in _WORD_RE.findall(normalize(text)):
+        if _CJK_RE.match(token):
+            feats.extend(token[i:i + 2] for i in range(max(1, len(token) - 1)))
+        else:
+            feats.append(token)
+    return feats
+
+def minhash(text):
+    """特徴量集合の MinHash 署名（32bit x 64）。特徴量が少なければ None"""
+    feats = set(features(text))
+    if len(feats) < DEDUP_MIN_FEATURES:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in feats]
+    return tuple(
+        min(((a * h + b) % _PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMS
+    )
+
+def similarity(sig_a, sig_b):
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / _NUM_PERM
+
+def signature_to_db(sig):
+    return array.array("I", sig).tobytes() if sig is not None else None
+
+def signature_from_db(blob):
+    return tuple(array.array("I", blob)) if blob else None
+
+def fingerprint_text(title, summary):
+    return f"{title or ''} {summary or ''}"
+
+def _is_failed(ref):
+    return isinstance(ref, dict) and ref.get("failed", False)
+
+class MinHashIndex:
+    """バンド分割による MinHash の近傍検索インデックス（LSH）"""
+
+    def __init__(self, min_similarity=DEDUP_MIN_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.buckets = [{} for _ in range(_BANDS)]
+
+    def _bands(self, sig):
+        return [sig[i * _ROWS:(i + 1) * _ROWS] for i in range(_BANDS)]
+
+    def add(self, sig, ref):
+        for i, band in enumerate(self._bands(sig)):
+            self.buckets[i].setdefault(band, []).append((sig, ref))
+
+    def query(self, sig, skip=None):
+        """最も類似した登録済み ref と類似度を返す。なければ (None, None)。skip(ref) が真の ref は候補にしない"""
+        best, best_score = None, None
+        seen = set()
+        for i, band in enumerate(self._bands(sig)):
+            for other, ref in self.buckets[i].get(band, ()):
+                if id(other) in seen:
+                    continue
+                seen.add(id(other))
+                if skip and skip(ref):
+                    continue
+                score = similarity(sig, other)
+                if score >= self.min_similarity and (best_score is None or score > best_score):
+                    best, best_score = ref, score
+        return best, best_score
+
+class DuplicateDetector:
+    """収集1回分の重複判定。
+
+    既存記事は article_id、同じ実行内で分析待ちの記事は pending の dict を ref として登録する。
+    check / register_pending は重複判定の段だけが呼ぶ。link と on_saved / on_failed は保存の段と並行に
+    呼ばれるため、分析待ちの dict への書き込みはロックで守る。
+    保存されなかった（failed の付いた）分析待ちの記事は、以後の重複判定の相手にしない。
+    """
+
+    def __init__(self, db, window_days=DEDUP_WINDOW_DAYS):
+        self.index = MinHashIndex()
+        self.pending_urls = {}
+        self._lock = threading.Lock()
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=window_days)
+        rows = db.query(ArticleFingerprint.article_id, ArticleFingerprint.minhash).filter(
+            ArticleFingerprint.created_at >= cutoff
+        ).all()
+        for article_id, blob in rows:
+            sig = signature_from_db(blob)
+            if sig is not None:
+                self.index.add(sig, article_id)
+        self._backfill(db, cutoff)
+
+    def _backfill(self, db, cutoff):
+        # この機能より前に保存された記事にも指紋を付ける
+        missing = db.query(Article.id, Article.url, Article.title, Article.summary).outerjoin(
+            ArticleFingerprint, ArticleFingerprint.article_id == Article.id
+        ).filter(ArticleFingerprint.article_id == None, Article.fetched_at >= cutoff).all()
+        for article_id, url, title, summary in missing:
+            sig = minhash(fingerprint_text(title, summary))
+            db.add(ArticleFingerprint(
+                article_id=article_id, canonical_url=canonicalize_url(url),
+                minhash=signature_to_db(sig), created_at=datetime.datetime.now()
+            ))
+            if sig is not None:
+                self.index.add(sig, article_id)
+        if missing:
+            db.commit()
+
+    def check(self, db, item):
+        """重複なら (ref, reason, similarity)、そうでなければ (None, None, None)。
+
+        item には canonical_url と minhash を書き込み、後続の register/save で使う。
+        """
+        canonical = canonicalize_url(item["url"])
+        item["canonical_url"] = canonical
+        item["minhash"] = minhash(fingerprint_text(item.get("title"), item.get("summary")))
+
+        pending = self.pending_urls.get(canonical)
+        if pending is not None and not pending.get("failed"):
+            return pending, "url", 1.0
+        alias = db.query(ArticleAlias.article_id).filter(ArticleAlias.url.in_([item["url"], canonical])).first()
+        if alias:
+            return alias[0], "url", 1.0
+        fp = db.query(ArticleFingerprint.article_id).filter(ArticleFingerprint.canonical_url == canonical).first()
+        if fp:
+            return fp[0], "url", 1.0
+
+        if item["minhash"] is not None:
+            ref, score = self.index.query(item["minhash"], skip=_is_failed)
+            if ref is not None:
+                return ref, "minhash", score
+        return None, None, None
+
+    def register_pending(self, p):
+        self.pending_urls[p["item"]["canonical_url"]] = p
+        if p["item"].get("minhash") is not None:
+            self.index.add(p["item"]["minhash"], p)
+
+    def link(self, db, ref, url, reason, score, source_id=None):
+        """重複 URL を正規記事に紐付ける。ref が分析待ちなら保存時にまとめて書く。
+
+        check の後に ref が保存されないと決まっていた場合は紐付けずに False を返す（呼び出し側で新着として扱う）。
+        """
+        if isinstance(ref, dict):
+            with self._lock:
+                if ref.get("failed"):
+                    return False
+                if "article_id" not in ref:
+                    ref.setdefault("aliases", []).append((url, reason, score, source_id))
+                    return True
+                ref = ref["article_id"]
+        if not db.query(ArticleAlias).filter(ArticleAlias.url == url).first():
+            db.add(ArticleAlias(url=url, article_id=ref, reason=reason, similarity=score, created_at=datetime.datetime.now()))
+        return True
+
+    def on_saved(self, db, p, article):
+        with self._lock:
+            p["article_id"] = article.id
+            aliases = p.pop("aliases", [])
+            p["saved_aliases"] = aliases
+        db.add(ArticleFingerprint(
+            article_id=article.id, canonical_url=p["item"]["canonical_url"],
+            minhash=signature_to_db(p["item"].get("minhash")), created_at=datetime.datetime.now()
+        ))
+        for url, reason, score, _ in aliases:
+            self.link(db, article.id, url, reason, score)
+
+    def on_failed(self, p):
+        """分析の失敗・保存のロールバックで保存されなかった記事を、以後の重複判定の相手から外す。
+
+        戻り値: この記事の重複として読み飛ばした記事のソース ID の集合（次回もう一度取得させる）
+        """
+        with self._lock:
+            p["failed"] = True
+            p.pop("article_id", None)
+            aliases = p.pop("saved_aliases", []) + p.pop("aliases", [])
+        return {source_id for _, _, _, source_id in aliases if source_id is not None}
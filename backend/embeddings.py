@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import fcntl
+import hashlib
+import threading
+import numpy as np
+from database import DATABASE_PATH
+from dedup import features
+from gemini import has_api_key, embed_texts, BACKGROUND
+
+EMBEDDER = os.environ.get("EMBEDDER", "auto") # auto, gemini, hashing
+EMBEDDING_DIR = os.environ.get(
+    "EMBEDDING_DIR", os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "embeddings")
+)
+HASHING_DIM = int(os.environ.get("HASHING_EMBED_DIM", "512"))
+GEMINI_EMBED_DIM = int(os.environ.get("GEMINI_EMBED_DIM", "768"))
+EMBED_TEXT_CHARS = 1000
+
+def embedding_text(title, summary_ja, text):
+    return f"{title or ''}\n{summary_ja or ''}\n{(text or '')[:EMBED_TEXT_CHARS]}"
+
+def _normalize_rows(m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+class HashingEmbedder:
+    """外部APIを使わない決定的な埋め込み（特徴量ハッシュ + 対数TF）。オフライン/テスト用"""
+
+    def __init__(self, dim=HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts, priority=BACKGROUND):
+        m = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, t in enumerate(texts):
+            counts = {}
+            for f in features(t):
+                counts[f] = counts.get(f, 0) + 1
+            for f, c in counts.items():
+                h = int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big")
+                sign = 1.0 if h >> 63 else -1.0
+                m[row, h % self.dim] += sign * (1.0 + np.log(c))
+        return _normalize_rows(m)
+
+class GeminiEmbedder:
+    def __init__(self, dim=GEMINI_EMBED_DIM):
+        self.dim = dim
+        self.name = f"gemini-{dim}"
+
+    def embed(self, texts, priority=BACKGROUND):
+        vectors = embed_texts(texts, priority=priority)
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32))
+
+def get_embedder():
+    if EMBEDDER == "gemini" or (EMBEDDER == "auto" and has_api_key()):
+        return GeminiEmbedder()
+    return HashingEmbedder()
+
+class VectorStore:
+    """記事ベクトルをメモリマップした float32 行列として保持し、内積で top-k を返す。
+
+    ファイル構成: vectors.f32（capacity x dim）, ids.i64（capacity）, meta.json。
+    書き込みは追記のみで、meta.json の count を最後に置き換えるため、読み手は
+    count までの行だけを見れば書き込み途中の行を読まない。
+    """
+
+    def __init__(self, path=EMBEDDING_DIR, embedder=None):
+        self.path = path
+        self.embedder = embedder or get_embedder()
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self._vectors = None
+        self._ids = None
+        self._count = 0
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._file("meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_meta(self, meta):
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._file("meta.json"))
+
+    def _compatible(self, meta):
+        return meta and meta["embedder"] == self.embedder.name and meta["dim"] == self.embedder.dim
+
+    def _refresh(self):
+        """meta.json が更新されていればメモリマップを開き直す"""
+        try:
+            mtime = os.stat(self._file("meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            self._vectors, self._ids, self._count = None, None, 0
+            return
+        if mtime == self._meta_mtime:
+            return
+        meta = self._read_meta()
+        self._meta_mtime = mtime
+        if not self._compatible(meta) or meta["count"] == 0:
+            self._vectors, self._ids, self._count = None, None, 0
+            return
+        dim, cap = meta["dim"], meta["capacity"]
+        self._vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(cap, dim))
+        self._ids = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r", shape=(cap,))
+        self._count = meta["count"]
+
+    def add(self, ids, texts):
+        if not ids:
+            return
+        vectors = self.embedder.embed(texts)
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(self._file("write.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            meta = self._read_meta()
+            if not self._compatible(meta):
+                # 埋め込み方式が変わった場合は作り直す（既存記事は rebuild で再計算）
+                meta = {"embedder": self.embedder.name, "dim": self.embedder.dim, "count": 0, "capacity": 0}
+            dim, count, cap = meta["dim"], meta["count"], meta["capacity"]
+            needed = count + len(ids)
+            if needed > cap:
+                cap = max(1024, cap * 2, needed)
+                for name, itemsize in (("vectors.f32", 4 * dim), ("ids.i64", 8)):
+                    with open(self._file(name), "ab") as f:
+                        f.truncate(cap * itemsize)
+            vec_map = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(cap, dim))
+            id_map = np.memmap(self._file("ids.i64"), dtype=np.int64, mode="r+", shape=(cap,))
+            vec_map[count:needed] = vectors
+            id_map[count:needed] = np.asarray(ids, dtype=np.int64)
+            vec_map.flush()
+            id_map.flush()
+            del vec_map, id_map
+            meta.update(count=needed, capacity=cap)
+            self._write_meta(meta)
+
+    def search(self, query, k=20, priority=BACKGROUND):
+        """[(article_id, cosine類似度)] を類似度の高い順に返す"""
+        with self._lock:
+            self._refresh()
+            if self._count == 0:
+                return []
+            vectors, ids, count = self._vectors, self._ids, self._count
+        q = self.embedder.embed([query], priority=priority)[0]
+        scores = np.asarray(vectors[:count] @ q)
+        # 同じ記事が再追加されている場合に備えて多めに取り、ID で重複を除く
+        top_n = min(count, k * 2)
+        top = np.argpartition(-scores, top_n - 1)[:top_n]
+        top = top[np.argsort(-scores[top])]
+        results, seen = [], set()
+        for i in top:
+            article_id = int(ids[i])
+            if article_id not in seen:
+                seen.add(article_id)
+                results.append((article_id, float(scores[i])))
+            if len(results) >= k:
+                break
+        return results
+
+    def rebuild(self, db, batch_size=100):
+        from sqlalchemy import func
+        from models import Article
+        with self._lock:
+            for name in ("meta.json", "vectors.f32", "ids.i64"):
+                try:
+                    os.remove(self._file(name))
+                except FileNotFoundError:
+                    pass
+            self._meta_mtime = None
+        total = 0
+        ids, texts = [], []
+        # 字幕のみの動画は字幕を本文として使う。使う先頭部分だけを読む
+        body = func.substr(func.coalesce(Article.full_text, Article.transcript), 1, EMBED_TEXT_CHARS)
+        q = db.query(Article.id, Article.title, Article.summary_ja, body).order_by(Article.id)
+        for article_id, title, summary_ja, text in q.yield_per(batch_size):
+            ids.append(article_id)
+            texts.append(embedding_text(title, summary_ja, text))
+            if len(ids) >= batch_size:
+                self.add(ids, texts)
+                total += len(ids)
+                ids, texts = [], []
+        self.add(ids, texts)
+        return total + len(ids)
+
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = VectorStore()
+    return _store
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        db = SessionLocal()
+        n = get_store().rebuild(db)
+        db.close()
+        print(f"Embedded {n} articles into {EMBEDDING_DIR}")
+    else:
+        print("usage: python embeddings.py rebuild")
@@ -1,34 +1,184 @@
+"""NotebookLM に読み込ませるためのテキストエクスポート。
+
+記事は yield_per で少しずつ読みながら1件ずつファイルに書き出すので、記事数が増えてもメモリ使用量は一定。
+NotebookLM のソース1件あたりの上限に収まるよう、EXPORT_SHARD_BYTES を超える前に次のファイルに分ける。
+--incremental では前回のエクスポートの透かし（書き出した最後の記事 ID）より後の記事だけを書き出す。
+
+usage: python export_for_notebooklm.py [--incremental] [--shard-bytes N] [--out DIR]
+"""
 import os
 import json
+import argparse
+import datetime
+from sqlalchemy import select, func, desc
 from database import SessionLocal
-from models import Article, CustomSource
+from models import Article
+
+EXPORT_DIR = os.environ.get(
+    "EXPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "notebooklm_export")
+)
+# 1ファイルの上限（バイト）。NotebookLM はソース1件あたりの語数に上限があるため小さめにしておく
+EXPORT_SHARD_BYTES = int(os.environ.get("EXPORT_SHARD_BYTES", "2000000"))
+EXPORT_BATCH_SIZE = 200
+STATE_FILE = "export_state.json"
+
+SEPARATOR = "=" * 80 + "\n\n"
+EXPORT_COLUMNS = (
+    Article.id, Article.title, Article.source_name, Article.source_type, Article.url, Article.category,
+    Article.published_at, Article.summary, Article.full_text, Article.transcript,
+)
+
+def export_header(part=None):
+    title = "# AI Knowledge Hub - Export for NotebookLM" + (f" (part {part})" if part else "")
+    return (
+        f"{title}\n\n"
+        "This document contains all fetched AI trends, articles, and video transcripts, ready for NotebookLM analysis.\n\n"
+        + SEPARATOR
+    )
+
+def export_statement(since_id=None, until_id=None):
+    """書き出す記事の列だけを選ぶ（ORM オブジェクトを作らない）。
+
+    全件は公開日の新しい順（ix_articles_published_at を辿る）、差分は追加された順（主キー順）。
+    どちらも索引の順に読むので SQLite 側で並べ替え用に全件を溜めない。
+    """
+    stmt = select(*EXPORT_COLUMNS)
+    if until_id is not None:
+        stmt = stmt.where(Article.id <= until_id)
+    if since_id is None:
+        return stmt.order_by(desc(Article.published_at), Article.id)
+    return stmt.where(Article.id > since_id).order_by(Article.id)
+
+def format_article(row):
+    text = f"## Title: {row.title}\n"
+    text += f"**Source:** {row.source_name} ({row.source_type})\n"
+    text += f"**URL:** {row.url}\n"
+    text += f"**Category:** {row.category}\n"
+    text += f"**Published Date:** {row.published_at}\n\n"
+    text += f"### Summary\n{row.summary}\n\n"
+    body = row.full_text or row.transcript
+    if body:
+        text += f"### Full Text / Transcript\n{body}\n\n"
+    return text + SEPARATOR
+
+def iter_rows(db, since_id=None, until_id=None):
+    return db.execute(export_statement(since_id, until_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+
+class ShardWriter:
+    """上限サイズごとにファイルを切り替えて書き出す。記事の途中では切らない。
+
+    書き込み中のファイルは .part として置き、閉じた時に本来の名前にする。
+    """
+
+    def __init__(self, out_dir, prefix, shard_bytes):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_bytes = shard_bytes
+        self.files = []
+        self._f = None
+        self._size = 0
+
+    def _open(self):
+        part = len(self.files) + 1
+        path = os.path.join(self.out_dir, f"{self.prefix}_{part:03d}.txt")
+        self.files.append(path)
+        self._f = open(path + ".part", "w", encoding="utf-8")
+        self._size = 0
+        self._write(export_header(part))
+
+    def _write(self, text):
+        self._f.write(text)
+        self._size += len(text.encode("utf-8"))
+
+    def write_article(self, text):
+        size = len(text.encode("utf-8"))
+        if self._f is not None and self._size + size > self.shard_bytes:
+            self._close_current()
+        if self._f is None:
+            self._open()
+        self._write(text)
+
+    def _close_current(self):
+        self._f.close()
+        os.replace(self.files[-1] + ".part", self.files[-1])
+        self._f = None
+
+    def close(self):
+        if self._f is not None:
+            self._close_current()
+
+    def abort(self):
+        """途中で失敗した場合に、この回に書いたファイルをすべて消す"""
+        if self._f is not None:
+            self._f.close()
+            os.remove(self.files.pop() + ".part")
+            self._f = None
+        for path in self.files:
+            os.remove(path)
+        self.files = []
+
+def read_state(out_dir):
+    try:
+        with open(os.path.join(out_dir, STATE_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_state(out_dir, state):
+    tmp = os.path.join(out_dir, STATE_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(out_dir, STATE_FILE))
+
+def export_for_notebooklm(incremental=False, out_dir=None, shard_bytes=None):
+    """記事をファイルに書き出し、書き出したファイルのパスのリストを返す。
+
+    開始時点の最大記事 ID までを書き出し、すべて書けた場合だけ透かしを進める
+    （途中で失敗しても次回の差分エクスポートで同じ範囲をやり直す）。
+    """
+    out_dir = out_dir or EXPORT_DIR
+    shard_bytes = shard_bytes or EXPORT_SHARD_BYTES
+    os.makedirs(out_dir, exist_ok=True)
+    state = read_state(out_dir)
+    since_id = state.get("last_article_id", 0) if incremental else None
 
-def export_for_notebooklm():
     db = SessionLocal()
-    articles = db.query(Article).order_by(Article.published_at.desc()).all()
-    
-    export_content = "# AI Knowledge Hub - Export for NotebookLM\n\n"
-    export_content += "This document contains all fetched AI trends, articles, and video transcripts, ready for NotebookLM analysis.\n\n"
-    export_content += "=" * 80 + "\n\n"
-    
-    for article in articles:
-        export_content += f"## Title: {article.title}\n"
-        export_content += f"**Source:** {article.source_name} ({article.source_type})\n"
-        export_content += f"**URL:** {article.url}\n"
-        export_content += f"**Category:** {article.category}\n"
-        export_content += f"**Published Date:** {article.published_at}\n\n"
-        export_content += f"### Summary\n{article.summary}\n\n"
-        
-        if article.full_text:
-            export_content += f"### Full Text / Transcript\n{article.full_text}\n\n"
-        
-        export_content += "=" * 80 + "\n\n"
-        
-    export_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "notebooklm_export.txt")
-    with open(export_path, "w", encoding="utf-8") as f:
-        f.write(export_content)
-        
-    print(f"Exported {len(articles)} articles to {export_path}")
+    try:
+        until_id = db.execute(select(func.max(Article.id))).scalar() or 0
+        if incremental and until_id <= since_id:
+            print(f"新しい記事はありません（透かし: 記事ID {since_id}）")
+            return []
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        prefix = f"notebooklm_{'since' + str(since_id) if incremental else 'full'}_{stamp}"
+        writer = ShardWriter(out_dir, prefix, shard_bytes)
+        count = 0
+        try:
+            # 全件の場合も開始時点の最大 ID で区切る（書き出し中に保存された記事は次回の差分に入る）
+            for row in iter_rows(db, since_id, until_id):
+                writer.write_article(format_article(row))
+                count += 1
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+    finally:
+        db.close()
+
+    write_state(out_dir, {
+        "last_article_id": until_id,
+        "exported_at": datetime.datetime.now().isoformat(),
+        "mode": "incremental" if incremental else "full",
+        "files": [os.path.basename(p) for p in writer.files],
+    })
+    print(f"Exported {count} articles to {len(writer.files)} file(s) in {out_dir}")
+    return writer.files
 
 if __name__ == "__main__":
-    export_for_notebooklm()
+    from dotenv import load_dotenv
+    load_dotenv()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", help="前回のエクスポート以降の記事だけを書き出す")
+    parser.add_argument("--shard-bytes", type=int, help="1ファイルの上限バイト数")
+    parser.add_argument("--out", help="出力ディレクトリ")
+    args = parser.parse_args()
+    export_for_notebooklm(incremental=args.incremental, out_dir=args.out, shard_bytes=args.shard_bytes)
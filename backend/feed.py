@@ -1,26 +1,259 @@
+"""公開 Atom フィード。
+
+フィードは収集で記事が増えた時に全種類（全体・カテゴリ別・優先度別）をまとめて描画し、
+FEED_DIR にファイルとして置く。Web プロセスは meta.json の更新時刻だけを見て
+メモリ上の本文を差し替えるので、フィードへのアクセスでは DB を読まない。
+"""
+import os
+import re
+import json
+import fcntl
+import hashlib
 import datetime
+import threading
+from email.utils import format_datetime, parsedate_to_datetime
+from xml.sax.saxutils import escape, quoteattr
+from sqlalchemy import desc, literal_column
+from database import DATABASE_PATH, SessionLocal
+from migrations import FEED_MIN_SCORE
+from models import Article
+
+FEED_DIR = os.environ.get("FEED_DIR", os.path.join(os.path.dirname(os.path.abspath(DATABASE_PATH)), "feeds"))
+FEED_SIZE = int(os.environ.get("FEED_SIZE", "50"))
+# フィードリーダーに再取得まで待ってもらう秒数（変わっていなければ 304 を返す）
+FEED_MAX_AGE = int(os.environ.get("FEED_MAX_AGE", "300"))
+PUBLIC_BASE_URL = os.environ.get("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+
+FEED_CATEGORIES = ("LLM", "画像生成", "エージェント", "開発ツール", "研究", "ビジネス", "全般")
+FEED_PRIORITIES = ("BREAKING", "HOT", "HIGH", "MEDIUM", "LOW")
+
+# XML 1.0 で使えない制御文字
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def _clean(value):
+    return _INVALID_XML_RE.sub("", "" if value is None else str(value))
+
+class XMLWriter:
+    """要素を開いた順に書き出す XML ライター。テキストと属性値は必ずエスケープする。
+
+    write には str を受け取る関数（ファイルの write やリストの append）を渡す。
+    """
+
+    def __init__(self, write, indent="  "):
+        self._write = write
+        self._indent = indent
+        self._stack = []
 
-def generate_atom_feed(articles):
-    feed = '<?xml version="1.0" encoding="utf-8"?>\n'
-    feed += '<feed xmlns="http://www.w3.org/2005/Atom">\n'
-    feed += '  <title>AI Knowledge Hub Public Feed</title>\n'
-    feed += '  <link href="http://localhost:8000/feed/public" rel="self"/>\n'
-    feed += f'  <updated>{datetime.datetime.now(datetime.timezone.utc).isoformat()}</updated>\n'
-    feed += '  <id>http://localhost:8000/feed/public</id>\n'
-    
+    def declaration(self):
+        self._write('<?xml version="1.0" encoding="utf-8"?>\n')
+
+    def _open_tag(self, tag, attrs):
+        attrs = "".join(f" {k}={quoteattr(_clean(v))}" for k, v in (attrs or {}).items() if v is not None)
+        return f"{self._indent * len(self._stack)}<{tag}{attrs}"
+
+    def start(self, tag, attrs=None):
+        self._write(self._open_tag(tag, attrs) + ">\n")
+        self._stack.append(tag)
+
+    def end(self):
+        tag = self._stack.pop()
+        self._write(f"{self._indent * len(self._stack)}</{tag}>\n")
+
+    def element(self, tag, text=None, attrs=None):
+        if text is None:
+            self._write(self._open_tag(tag, attrs) + "/>\n")
+        else:
+            self._write(self._open_tag(tag, attrs) + f">{escape(_clean(text))}</{tag}>\n")
+
+def _timestamp(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.isoformat()
+
+def write_atom_feed(write, articles, title, feed_url, updated=None):
+    """記事を1件ずつ Atom として書き出す。articles はイテレータでもよい（全件をメモリに載せない）"""
+    w = XMLWriter(write)
+    w.declaration()
+    w.start("feed", {"xmlns": "http://www.w3.org/2005/Atom"})
+    w.element("title", title)
+    w.element("link", attrs={"href": feed_url, "rel": "self"})
+    w.element("updated", _timestamp(updated or datetime.datetime.now(datetime.timezone.utc)))
+    w.element("id", feed_url)
     for article in articles:
-        feed += '  <entry>\n'
-        feed += f'    <title>{article.title}</title>\n'
-        feed += f'    <link href="{article.url}"/>\n'
-        feed += f'    <id>{article.url}</id>\n'
-        updated_time = article.published_at.isoformat() if article.published_at else datetime.datetime.now(datetime.timezone.utc).isoformat()
-        if not updated_time.endswith('Z') and '+' not in updated_time:
-             updated_time += 'Z'
-        feed += f'    <updated>{updated_time}</updated>\n'
-        feed += f'    <summary>{article.summary_ja or article.summary or ""}</summary>\n'
-        content = f"Score: {article.score}<br/>Business Point: {article.business_point}<br/>Tags: {','.join(article.tags or [])}"
-        feed += f'    <content type="html"><![CDATA[{content}]]></content>\n'
-        feed += '  </entry>\n'
-        
-    feed += '</feed>'
-    return feed
+        w.start("entry")
+        w.element("title", article.title)
+        w.element("link", attrs={"href": article.url})
+        w.element("id", article.url)
+        w.element("updated", _timestamp(article.published_at or article.fetched_at) or _timestamp(updated))
+        w.element("summary", article.summary_ja or article.summary or "")
+        content = f"Score: {article.score}<br/>Business Point: {escape(_clean(article.business_point))}<br/>Tags: {escape(','.join(article.tags or []))}"
+        w.element("content", content, {"type": "html"})
+        w.end()
+    w.end()
+
+def feed_articles(db, category=None, priority=None, limit=FEED_SIZE):
+    # 部分インデックス ix_articles_feed を使えるよう、掲載基準はバインド変数ではなくリテラルで渡す
+    q = db.query(Article).filter(Article.score >= literal_column(str(FEED_MIN_SCORE)))
+    if category:
+        q = q.filter(Article.category == category)
+    if priority:
+        q = q.filter(Article.priority_label == priority)
+    return q.order_by(desc(Article.published_at)).limit(limit).yield_per(100)
+
+def variant_name(category=None, priority=None):
+    if category:
+        return f"category:{category}"
+    if priority:
+        return f"priority:{priority}"
+    return "public"
+
+def variants():
+    """(名前, category, priority, タイトル, URL)"""
+    base = f"{PUBLIC_BASE_URL}/feed/public"
+    yield "public", None, None, "AI Knowledge Hub Public Feed", base
+    for c in FEED_CATEGORIES:
+        yield variant_name(category=c), c, None, f"AI Knowledge Hub - {c}", f"{base}?category={c}"
+    for p in FEED_PRIORITIES:
+        yield variant_name(priority=p), None, p, f"AI Knowledge Hub - {p}", f"{base}?priority={p}"
+
+def _read_meta():
+    try:
+        with open(os.path.join(FEED_DIR, "meta.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def render_feeds(db):
+    """全種類のフィードを描画してファイルに置き換える。
+
+    ファイル名に ETag を含め、同じ名前のファイルを書き換えない（読み手が ETag と本文を取り違えない）。
+    内容が前回と同じフィードは ETag と Last-Modified を変えない（リーダーは 304 のまま）。
+    戻り値: 内容が変わったフィードの数
+    """
+    os.makedirs(FEED_DIR, exist_ok=True)
+    with open(os.path.join(FEED_DIR, "write.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        previous = (_read_meta() or {}).get("feeds", {})
+        feeds = {}
+        changed = 0
+        for name, category, priority, title, url in variants():
+            articles = list(feed_articles(db, category, priority))
+            # 本文が同じなら同じバイト列になるよう、更新日時は掲載記事の最新日時にする
+            latest = max((a.published_at or a.fetched_at for a in articles if a.published_at or a.fetched_at), default=None)
+            tmp = os.path.join(FEED_DIR, f"render-{os.getpid()}.tmp")
+            digest = hashlib.sha256()
+            with open(tmp, "w", encoding="utf-8") as f:
+                def write(s):
+                    digest.update(s.encode("utf-8"))
+                    f.write(s)
+                write_atom_feed(write, articles, title, url, latest or datetime.datetime(2000, 1, 1))
+            etag = f'"{digest.hexdigest()[:32]}"'
+            old = previous.get(name)
+            if old and old["etag"] == etag and os.path.exists(os.path.join(FEED_DIR, old["file"])):
+                os.remove(tmp)
+                feeds[name] = old
+                continue
+            file_name = hashlib.sha1(name.encode("utf-8")).hexdigest()[:12] + "-" + etag.strip('"')[:16] + ".xml"
+            os.replace(tmp, os.path.join(FEED_DIR, file_name))
+            feeds[name] = {"file": file_name, "etag": etag, "count": len(articles),
+                           "last_modified": format_datetime(datetime.datetime.now(datetime.timezone.utc), usegmt=True)}
+            changed += 1
+        tmp = os.path.join(FEED_DIR, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"rendered_at": datetime.datetime.now().isoformat(), "feeds": feeds}, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(FEED_DIR, "meta.json"))
+        # 直前の世代は、古い meta を読んだばかりの読み手のために1回分残す
+        keep = {f["file"] for f in feeds.values()} | {f["file"] for f in previous.values()}
+        for file_name in os.listdir(FEED_DIR):
+            if file_name.endswith(".xml") and file_name not in keep:
+                os.remove(os.path.join(FEED_DIR, file_name))
+    print(f"[FEED] フィードを描画: {len(feeds)}種類（変更 {changed}件）")
+    return changed
+
+_render_lock = threading.Lock()
+
+def ensure_rendered():
+    """まだ一度も描画されていなければ描画する（デプロイ直後の最初のリクエスト用）"""
+    with _render_lock:
+        if rendered_feeds.ready():
+            return
+        db = SessionLocal()
+        try:
+            render_feeds(db)
+        finally:
+            db.close()
+
+class RenderedFeeds:
+    """描画済みフィードのプロセス内キャッシュ。meta.json が置き換わった時だけ読み直す"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta_mtime = None
+        self._feeds = {}
+        self._bodies = {}  # etag -> bytes
+
+    def _refresh(self):
+        try:
+            mtime = os.stat(os.path.join(FEED_DIR, "meta.json")).st_mtime_ns
+        except FileNotFoundError:
+            self._meta_mtime, self._feeds, self._bodies = None, {}, {}
+            return
+        if mtime == self._meta_mtime:
+            return
+        meta = _read_meta() or {}
+        self._feeds = meta.get("feeds", {})
+        etags = {f["etag"] for f in self._feeds.values()}
+        self._bodies = {etag: body for etag, body in self._bodies.items() if etag in etags}
+        self._meta_mtime = mtime
+
+    def ready(self):
+        with self._lock:
+            self._refresh()
+            return bool(self._feeds)
+
+    def get(self, name):
+        """(本文, ETag, Last-Modified)。描画されていなければ None"""
+        with self._lock:
+            self._refresh()
+            info = self._feeds.get(name)
+            if not info:
+                return None
+            body = self._bodies.get(info["etag"])
+            if body is None:
+                try:
+                    with open(os.path.join(FEED_DIR, info["file"]), "rb") as f:
+                        body = f.read()
+                except FileNotFoundError:
+                    return None
+                self._bodies[info["etag"]] = body
+            return body, info["etag"], info["last_modified"]
+
+rendered_feeds = RenderedFeeds()
+
+def not_modified(etag, last_modified, if_none_match=None, if_modified_since=None):
+    """条件付き GET が変更なし（304）で済むか。If-None-Match があればそちらを優先する"""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        # 弱い比較（W/ 付きも同じ ETag とみなす）
+        return "*" in tags or etag in [t[2:] if t.startswith("W/") else t for t in tags]
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+if __name__ == "__main__":
+    import sys
+    from dotenv import load_dotenv
+    load_dotenv()
+    if sys.argv[1:] == ["render"]:
+        db = SessionLocal()
+        try:
+            render_feeds(db)
+        finally:
+            db.close()
+    else:
+        print("usage: python feed.py render")
@@ -0,0 +1,125 @@
+import os
+import time
+import datetime
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import feedparser
+import requests
+
+import metrics
+
+# 同時取得数・ホスト毎の同時接続数・タイムアウト（秒）
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", "8"))
+FETCH_PER_HOST = int(os.environ.get("FETCH_PER_HOST", "2"))
+FETCH_TIMEOUT = float(os.environ.get("FETCH_TIMEOUT", "15"))
+# YouTube チャンネルのフィード（ベンチマークではローカルの疑似サーバーに向ける）
+YOUTUBE_FEED_URL = os.environ.get("YOUTUBE_FEED_URL", "https://www.youtube.com/feeds/videos.xml")
+
+# source はソース ID（ソース数は数十程度なので系列数は増えすぎない）
+FETCH_SECONDS = metrics.histogram("feed_fetch_duration_seconds", "ソース1件の取得にかかった時間（ホスト毎の同時接続待ちを含む）", ["source", "type"])
+FETCH_RESULTS = metrics.counter("feed_fetch_total", "ソースの取得結果（ok / not_modified / error）", ["source", "type", "result"])
+
+USER_AGENT = "AIKnowledgeHub/1.0 (+https://github.com/AniseHanashiro/ai-knowledge-hub)"
+
+_host_locks = {}
+_host_locks_guard = threading.Lock()
+
+def _host_semaphore(url):
+    host = urlparse(url).netloc.lower()
+    with _host_locks_guard:
+        sem = _host_locks.get(host)
+        if sem is None:
+            sem = threading.BoundedSemaphore(FETCH_PER_HOST)
+            _host_locks[host] = sem
+        return sem
+
+def feed_url_for(source_type, url):
+    if source_type == "youtube":
+        return f"{YOUTUBE_FEED_URL}?channel_id={url}"
+    return url
+
+def parse_entries(feed, url):
+    items = []
+    for entry in feed.entries[:5]: # Top 5 recent
+        items.append({
+            "title": entry.get("title", ""),
+            "url": entry.get("link", url),
+            "summary": entry.get("summary", ""),
+            "published_at": datetime.datetime.now() # Simplified
+        })
+    return items
+
+def fetch_feed(url, validators=None, timeout=None):
+    """条件付きGETでフィードを取得する。
+
+    validators は前回の {"etag", "last_modified", "content_hash"}。
+    304 もしくは本文ハッシュが前回と同じ場合は items に None を返し、パースを省略する。
+    戻り値: (items or None, 新しい validators)
+    """
+    validators = validators or {}
+    headers = {"User-Agent": USER_AGENT}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    # feedparser.parse(url) はタイムアウトを持たないため、本体は requests で取得する
+    with _host_semaphore(url):
+        resp = requests.get(url, timeout=timeout or FETCH_TIMEOUT, headers=headers)
+    if resp.status_code == 304:
+        return None, dict(validators)
+    resp.raise_for_status()
+
+    content_hash = hashlib.sha256(resp.content).hexdigest()
+    new_validators = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "content_hash": content_hash,
+    }
+    if content_hash == validators.get("content_hash"):
+        return None, new_validators
+
+    feed = feedparser.parse(resp.content, response_headers=dict(resp.headers))
+    return parse_entries(feed, url), new_validators
+
+def fetch_source(source_type, url, validators=None, timeout=None):
+    if source_type not in ("rss", "youtube"):
+        return [], {}
+    return fetch_feed(feed_url_for(source_type, url), validators, timeout=timeout)
+
+def _timed_fetch(source_id, source_type, url, validators, timeout):
+    """(items, validators, error, 秒数)。例外も戻り値にして、失敗したソースの所要時間も記録する"""
+    start = time.perf_counter()
+    try:
+        items, new_validators = fetch_source(source_type, url, validators, timeout)
+        error = None
+        result = "not_modified" if items is None else "ok"
+    except Exception as e:
+        items, new_validators, error, result = [], None, e, "error"
+    seconds = time.perf_counter() - start
+    FETCH_SECONDS.observe(seconds, source=source_id, type=source_type)
+    FETCH_RESULTS.inc(source=source_id, type=source_type, result=result)
+    return items, new_validators, error, seconds
+
+def fetch_sources(sources, validators=None, max_workers=None, timeout=None):
+    """全ソースを並列取得し、完了した順に (source, items, validators, error, 秒数) を返すジェネレータ。
+
+    validators は source.id -> 前回の条件付きGET情報。items が None のソースは変更なし。
+    ワーカーには ORM オブジェクトではなく type/url の値だけを渡すため、
+    呼び出し側のセッションは取得スレッドから触られない。
+    """
+    sources = list(sources)
+    if not sources:
+        return
+    validators = validators or {}
+    workers = max(1, min(max_workers or FETCH_WORKERS, len(sources)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="fetch") as pool:
+        futures = {
+            pool.submit(_timed_fetch, s.id, s.type, s.url, validators.get(s.id), timeout): s
+            for s in sources
+        }
+        for future in as_completed(futures):
+            yield (futures[future],) + future.result()
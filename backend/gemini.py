@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+from google import genai
+import metrics
+from rate_limiter import TokenBucketLimiter, INTERACTIVE, BACKGROUND
+
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_RPM = int(os.environ.get("GEMINI_RPM", "15"))
+GEMINI_TPM = int(os.environ.get("GEMINI_TPM", "1000000"))
+GEMINI_EMBED_MODEL = os.environ.get("GEMINI_EMBED_MODEL", "text-embedding-004")
+# worker.py を別プロセスで動かす場合の収集側の枠。残りを Web（AI 検索）に割り当て、合計が GEMINI_RPM/TPM を超えないようにする
+GEMINI_WORKER_RPM = int(os.environ.get("GEMINI_WORKER_RPM", str(max(1, GEMINI_RPM * 6 // 10))))
+GEMINI_WORKER_TPM = int(os.environ.get("GEMINI_WORKER_TPM", str(max(1, GEMINI_TPM * 6 // 10))))
+
+# プロセス内の collector と ai_search の全 Gemini 呼び出しで共有する。
+# Web プロセス内でワーカーを動かす構成（EMBEDDED_WORKER=1）では全体の枠を1つのリミッタで分け合い、対話的な検索を優先する
+limiter = TokenBucketLimiter(GEMINI_RPM, GEMINI_TPM)
+
+def split_budget(role):
+    """Web とワーカーが別プロセスの場合に、このプロセスのリミッタを割り当て分に絞る。
+
+    リミッタはプロセス毎なので、絞らないと両方が GEMINI_RPM を使い切れてしまう（合計で2倍）。
+    role: "worker"（収集）または "web"（AI 検索）
+    """
+    if role == "worker":
+        rpm, tpm = GEMINI_WORKER_RPM, GEMINI_WORKER_TPM
+    else:
+        rpm, tpm = max(1, GEMINI_RPM - GEMINI_WORKER_RPM), max(1, GEMINI_TPM - GEMINI_WORKER_TPM)
+    limiter.set_rates(rpm, tpm)
+    print(f"[GEMINI] {role} プロセスの枠: {rpm} RPM / {tpm} TPM（全体 {GEMINI_RPM} RPM / {GEMINI_TPM} TPM）")
+
+_client = None
+_client_lock = threading.Lock()
+
+# op: generate / embed、priority: interactive（検索）/ background（収集）
+GEMINI_SECONDS = metrics.histogram("gemini_request_duration_seconds", "Gemini API の応答時間（リミッタの待ちを除く）", ["op", "priority"])
+GEMINI_REQUESTS = metrics.counter("gemini_requests_total", "Gemini API の呼び出し数（outcome: ok / rate_limited / error）", ["op", "priority", "outcome"])
+GEMINI_TOKENS = metrics.counter("gemini_tokens_total", "Gemini API のトークン数（応答の usage、なければ見積もり）", ["op", "kind"])
+LIMITER_WAIT_SECONDS = metrics.histogram("gemini_limiter_wait_seconds", "リミッタの枠が空くまでの待ち時間", ["priority"])
+
+def _priority_label(priority):
+    return "interactive" if priority == INTERACTIVE else "background"
+
+def _record(op, priority, start, error=None, response=None, prompt_tokens=0):
+    labels = {"op": op, "priority": _priority_label(priority)}
+    GEMINI_SECONDS.observe(time.perf_counter() - start, **labels)
+    if error is not None:
+        GEMINI_REQUESTS.inc(outcome="rate_limited" if is_rate_limit_error(error) else "error", **labels)
+        return
+    GEMINI_REQUESTS.inc(outcome="ok", **labels)
+    usage = getattr(response, "usage_metadata", None)
+    GEMINI_TOKENS.inc(getattr(usage, "prompt_token_count", None) or prompt_tokens, op=op, kind="prompt")
+    output_tokens = getattr(usage, "candidates_token_count", None)
+    if output_tokens is None and op == "generate":
+        output_tokens = estimate_tokens(getattr(response, "text", None))
+    if output_tokens:
+        GEMINI_TOKENS.inc(output_tokens, op=op, kind="output")
+
+def has_api_key():
+    api_key = os.environ.get("GEMINI_API_KEY")
+    return bool(api_key) and api_key != "your_gemini_api_key_here"
+
+def get_client():
+    """プロセス内で共有する genai.Client を返す（呼び出し毎に作り直さない）"""
+    global _client
+    if not has_api_key():
+        raise ValueError("Valid GEMINI_API_KEY is required.")
+    with _client_lock:
+        if _client is None:
+            _client = genai.Client(api_key=os.environ["GEMINI_API_KEY"])
+        return _client
+
+def is_rate_limit_error(e):
+    err = str(e)
+    return "429" in err or "RESOURCE_EXHAUSTED" in err
+
+def generate_text(prompt, model=None, priority=BACKGROUND):
+    """リミッタの枠を取ってから生成する。429 はリミッタに報告したうえで呼び出し元へ送出する"""
+    client = get_client()
+    tokens = estimate_tokens(prompt)
+    with LIMITER_WAIT_SECONDS.time(priority=_priority_label(priority)):
+        limiter.acquire(tokens, priority=priority)
+    start = time.perf_counter()
+    try:
+        response = client.models.generate_content(
+            model=model or GEMINI_MODEL,
+            contents=prompt
+        )
+    except Exception as e:
+        _record("generate", priority, start, error=e)
+        if is_rate_limit_error(e):
+            limiter.report_rate_limited()
+        raise
+    _record("generate", priority, start, response=response, prompt_tokens=tokens)
+    limiter.report_success()
+    return response.text.strip()
+
+async def generate_text_async(prompt, model=None, priority=BACKGROUND):
+    """generate_text の非同期版（API 応答待ちの間スレッドを占有しない）"""
+    client = get_client()
+    tokens = estimate_tokens(prompt)
+    with LIMITER_WAIT_SECONDS.time(priority=_priority_label(priority)):
+        await limiter.acquire_async(tokens, priority=priority)
+    start = time.perf_counter()
+    try:
+        response = await client.aio.models.generate_content(
+            model=model or GEMINI_MODEL,
+            contents=prompt
+        )
+    except Exception as e:
+        _record("generate", priority, start, error=e)
+        if is_rate_limit_error(e):
+            limiter.report_rate_limited()
+        raise
+    _record("generate", priority, start, response=response, prompt_tokens=tokens)
+    limiter.report_success()
+    return response.text.strip()
+
+def embed_texts(texts, model=None, priority=BACKGROUND):
+    """テキストのリストを埋め込みベクトル（float のリスト）のリストに変換する"""
+    client = get_client()
+    tokens = sum(estimate_tokens(t) for t in texts)
+    with LIMITER_WAIT_SECONDS.time(priority=_priority_label(priority)):
+        limiter.acquire(tokens, priority=priority)
+    start = time.perf_counter()
+    try:
+        response = client.models.embed_content(
+            model=model or GEMINI_EMBED_MODEL,
+            contents=list(texts)
+        )
+    except Exception as e:
+        _record("embed", priority, start, error=e)
+        if is_rate_limit_error(e):
+            limiter.report_rate_limited()
+        raise
+    _record("embed", priority, start, response=response, prompt_tokens=tokens)
+    limiter.report_success()
+    return [e.values for e in response.embeddings]
+
+def strip_code_fence(text):
+    # JSONブロックの除去
+    for marker in ['```json', '```']:
+        if marker in text:
+            parts = text.split(marker)
+            if len(parts) >= 2:
+                return parts[1].split('```')[0].strip()
+    return text
+
+def estimate_tokens(text):
+    # 日英混在テキストの大まかな見積もり（厳密なトークナイズはしない）
+    return len(text or "") // 3 + 1
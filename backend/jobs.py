@@ -0,0 +1,201 @@
+import os
+import datetime
+from sqlalchemy import update, exists, and_, desc
+from sqlalchemy.orm import aliased, defer
+from models import CollectionRun, CollectionJob, CustomSource, CollectionReport, SourceReport
+
+# ワーカーがジョブを保持できる時間。ハートビートで延長し、切れたジョブは他のワーカーが引き継ぐ
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE = (QUEUED, RUNNING)
+
+def enqueue_collection(db, source_ids=None):
+    """有効なソース毎に収集ジョブを積む。
+
+    キュー待ち・実行中のジョブがあるソースには積まない（連打しても収集は重ならない）。
+    戻り値: (run or None, 新しく積んだジョブ数, 既に実行待ち・実行中だったソース数)
+    """
+    q = db.query(CustomSource.id).filter(CustomSource.enabled == True)
+    if source_ids is not None:
+        q = q.filter(CustomSource.id.in_(source_ids))
+    wanted = [sid for (sid,) in q.all()]
+    active = {sid for (sid,) in db.query(CollectionJob.source_id).filter(
+        CollectionJob.status.in_(ACTIVE), CollectionJob.source_id.in_(wanted)
+    ).all()}
+    new_ids = [sid for sid in wanted if sid not in active]
+    if not new_ids:
+        return None, 0, len(active)
+
+    now = datetime.datetime.now()
+    run = CollectionRun(created_at=now, job_count=len(new_ids))
+    db.add(run)
+    db.flush()
+    for sid in new_ids:
+        db.add(CollectionJob(run_id=run.id, source_id=sid, status=QUEUED, attempts=0, created_at=now))
+    db.commit()
+    return run, len(new_ids), len(active)
+
+def claim_jobs(db, worker_id, limit):
+    """キュー待ちのジョブを最大 limit 件取得して実行中にする。
+
+    同じソースのジョブが他のワーカーでリース中なら取得しない。判定と更新は1つの UPDATE で行うので、
+    複数のワーカーが同時に取りに来ても同じジョブ・同じソースを二重に実行しない。
+    """
+    now = datetime.datetime.now()
+    lease = now + datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+    candidates = [jid for (jid,) in db.query(CollectionJob.id).filter(
+        CollectionJob.status == QUEUED
+    ).order_by(CollectionJob.id).limit(limit * 4).all()]
+
+    other = aliased(CollectionJob)
+    claimed = []
+    for jid in candidates:
+        result = db.execute(
+            update(CollectionJob).where(
+                CollectionJob.id == jid,
+                CollectionJob.status == QUEUED,
+                ~exists().where(and_(
+                    other.source_id == CollectionJob.source_id,
+                    other.status == RUNNING,
+                    other.lease_expires_at > now
+                ))
+            ).values(
+                status=RUNNING, worker_id=worker_id, lease_expires_at=lease,
+                attempts=CollectionJob.attempts + 1, started_at=now, error=None
+            ).execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            claimed.append(jid)
+            if len(claimed) >= limit:
+                break
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(CollectionJob).filter(CollectionJob.id.in_(claimed)).order_by(CollectionJob.id).all()
+
+def renew_leases(db, worker_id, job_ids):
+    """リースを延長する。戻り値: まだ自分が保持しているジョブ ID の集合"""
+    if not job_ids:
+        return set()
+    lease = datetime.datetime.now() + datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+    db.execute(
+        update(CollectionJob).where(
+            CollectionJob.id.in_(list(job_ids)),
+            CollectionJob.worker_id == worker_id,
+            CollectionJob.status == RUNNING
+        ).values(lease_expires_at=lease).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return {jid for (jid,) in db.query(CollectionJob.id).filter(
+        CollectionJob.id.in_(list(job_ids)),
+        CollectionJob.worker_id == worker_id,
+        CollectionJob.status == RUNNING
+    ).all()}
+
+def update_job(db, job_id, worker_id, **values):
+    """自分が保持している実行中のジョブだけを更新する（リースを失ったワーカーの書き込みは捨てる）"""
+    if values.get("status") in (DONE, FAILED):
+        values["finished_at"] = datetime.datetime.now()
+        values["lease_expires_at"] = None
+    result = db.execute(
+        update(CollectionJob).where(
+            CollectionJob.id == job_id,
+            CollectionJob.worker_id == worker_id,
+            CollectionJob.status == RUNNING
+        ).values(**values).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return bool(result.rowcount)
+
+def requeue_expired(db):
+    """リースが切れた実行中ジョブ（ワーカーが落ちた等）をキューに戻す。試行回数を超えたら失敗にする"""
+    now = datetime.datetime.now()
+    expired = and_(CollectionJob.status == RUNNING, CollectionJob.lease_expires_at < now)
+    failed = db.execute(
+        update(CollectionJob).where(expired, CollectionJob.attempts >= JOB_MAX_ATTEMPTS).values(
+            status=FAILED, finished_at=now, lease_expires_at=None, error="lease expired"
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    requeued = db.execute(
+        update(CollectionJob).where(expired).values(
+            status=QUEUED, worker_id=None, lease_expires_at=None
+        ).execution_options(synchronize_session=False)
+    ).rowcount
+    db.commit()
+    if failed or requeued:
+        print(f"[JOB] リース切れ: {requeued}件を再キュー、{failed}件を失敗に")
+    return requeued
+
+def job_to_dict(job):
+    return {
+        "id": job.id, "run_id": job.run_id, "source_id": job.source_id, "status": job.status,
+        "attempts": job.attempts, "worker_id": job.worker_id,
+        "items_found": job.items_found, "items_saved": job.items_saved, "error": job.error,
+        "created_at": job.created_at, "started_at": job.started_at, "finished_at": job.finished_at,
+    }
+
+SOURCE_REPORT_FIELDS = (
+    "source_id", "source_name", "job_id", "status", "fetched", "not_modified", "skipped",
+    "analyzed", "analysis_failed", "saved", "fetch_seconds", "duration_seconds", "error",
+)
+
+def source_report_to_dict(report):
+    return {name: getattr(report, name) for name in SOURCE_REPORT_FIELDS}
+
+def report_to_dict(report, sources=None):
+    data = {
+        "id": report.id, "started_at": report.started_at, "finished_at": report.finished_at,
+        "duration_seconds": report.duration_seconds, "source_count": report.source_count,
+        "items_fetched": report.items_fetched, "items_skipped": report.items_skipped,
+        "items_analyzed": report.items_analyzed, "items_saved": report.items_saved,
+    }
+    if sources is not None:
+        data["stages"] = report.stages
+        data["sources"] = [source_report_to_dict(s) for s in sources]
+    return data
+
+def list_reports(db, limit=20):
+    """新しい順の収集レポート（ソース毎の内訳なし）"""
+    return [report_to_dict(r) for r in db.query(CollectionReport).options(defer(CollectionReport.stages)).order_by(desc(CollectionReport.id)).limit(limit).all()]
+
+def report_detail(db, report_id):
+    """収集レポートとソース毎の内訳（時間のかかったソース順）。見つからなければ None"""
+    report = db.get(CollectionReport, report_id)
+    if not report:
+        return None
+    sources = db.query(SourceReport).filter(SourceReport.report_id == report_id).all()
+    sources.sort(key=lambda s: s.duration_seconds or 0, reverse=True)
+    return report_to_dict(report, sources)
+
+def job_reports(db, job_ids):
+    """ジョブ ID -> そのジョブの最新の試行のソース別レポート"""
+    reports = {}
+    if job_ids:
+        for report in db.query(SourceReport).filter(SourceReport.job_id.in_(list(job_ids))).order_by(SourceReport.id):
+            reports[report.job_id] = source_report_to_dict(report)
+    return reports
+
+def run_status(db, run_id):
+    """実行単位の進捗。見つからなければ None"""
+    run = db.get(CollectionRun, run_id)
+    if not run:
+        return None
+    jobs = db.query(CollectionJob).filter(CollectionJob.run_id == run_id).order_by(CollectionJob.id).all()
+    counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED)}
+    for job in jobs:
+        counts[job.status] = counts.get(job.status, 0) + 1
+    finished = counts[DONE] + counts[FAILED]
+    reports = job_reports(db, [job.id for job in jobs])
+    return {
+        "id": run.id,
+        "created_at": run.created_at,
+        "status": "finished" if finished == len(jobs) else (RUNNING if counts[RUNNING] or finished else QUEUED),
+        "progress": {"total": len(jobs), "finished": finished, **counts,
+                     "items_saved": sum(job.items_saved or 0 for job in jobs)},
+        "jobs": [{**job_to_dict(job), "report": reports.get(job.id)} for job in jobs],
+    }
@@ -1,20 +1,31 @@
 import os
+import json
+import asyncio
 import datetime
-from fastapi import FastAPI, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Response, Query, Header
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response, FileResponse
-from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, load_only
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, func, literal_column, select
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 
-from database import get_db, init_db
+from database import get_db, get_async_db, init_db, async_engine, AsyncSessionLocal, SessionLocal
 import models
-from ai_search import search_articles
-from collector import collect_data
-from feed import generate_atom_feed
+from ai_search import search_articles_async, invalidate_search_cache
+import jobs
+from feed import render_feeds, rendered_feeds, ensure_rendered, not_modified, variant_name, FEED_CATEGORIES, FEED_PRIORITIES, FEED_MAX_AGE
+from search_index import apply_search, ranked_ids, snippets
+from export_for_notebooklm import export_header, export_statement, format_article, EXPORT_BATCH_SIZE
+from pagination import keyset_page, encode_cursor, InvalidCursor
+from stats import read_stats, record_source
+from scoring import schedule_rescore, rule_terms
+from gemini import split_budget
+import metrics
 
+metrics.setup_logging()
 app = FastAPI(title="AI Knowledge Hub")
 
 app.add_middleware(
@@ -23,11 +34,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# CORS の後に追加する（外側で動くので、プリフライトを含む全リクエストを計る）
+app.add_middleware(metrics.TimingMiddleware)
+
+# Web プロセス内で収集ワーカーを動かす。既定の railway.json は uvicorn だけの1サービス構成なので既定で有効。
+# python worker.py を別に起動する構成（Procfile の worker など）では 0 にする
+EMBEDDED_WORKER = os.environ.get("EMBEDDED_WORKER", "1") == "1"
 
 @app.on_event("startup")
 def on_startup():
     init_db()
+    if EMBEDDED_WORKER:
+        import worker
+        worker.start_in_thread()
+    else:
+        # 収集は別プロセスのワーカーが行うので、Gemini の枠はワーカーの分を除いた残りだけを使う
+        split_budget("web")
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # プール中の aiosqlite 接続（各々スレッドを持つ）を閉じる
+    await async_engine.dispose()
 
 os.makedirs("static", exist_ok=True)
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -37,13 +66,45 @@ class SourceCreate(BaseModel):
     source_type: Optional[str] = None
 
 class SourceUpdate(BaseModel):
-    enabled: bool
+    enabled: Optional[bool] = None
+    priority_bonus: Optional[float] = None
 
 class ATSearchRequest(BaseModel):
     query: str
 
 class KeywordCreate(BaseModel):
     terms: List[str]
+    condition: str = "OR"  # OR: いずれかの語 / AND: すべての語
+    excludes: List[str] = []
+    bonus: float = 0.0
+    enabled: bool = True
+
+class ArticleCard(BaseModel):
+    """一覧表示用の軽量スキーマ。full_text / transcript は含めない（詳細は /api/articles/{id}）"""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    title: str
+    summary_ja: Optional[str] = None
+    business_point: Optional[str] = None
+    url: str
+    source_name: Optional[str] = None
+    source_type: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[list] = None
+    company_tags: Optional[list] = None
+    priority_label: Optional[str] = None
+    trust_level: Optional[str] = None
+    score: Optional[float] = None
+    published_at: Optional[datetime.datetime] = None
+    is_clipped: Optional[bool] = None
+    clip_folder: Optional[str] = None
+    snippet: Optional[str] = None
+
+CARD_FIELDS = [name for name in ArticleCard.model_fields if name != "snippet"]
+CARD_COLUMNS = [getattr(models.Article, name) for name in CARD_FIELDS]
+SORT_COLUMNS = {"score": models.Article.score, "published": models.Article.published_at}
+PAGE_SIZE = 20
 
 # ========================
 # Frontend Routes
@@ -59,18 +120,31 @@ def serve_html(page: str):
 # ========================
 # API Endpoints
 # ========================
-@app.get("/api/articles")
-def get_articles(
+# 読み取り系のエンドポイントは async def とし、クエリ本体は同期 Session で書いて
+# AsyncSession.run_sync から呼ぶ（DB 待ちの間もイベントループを塞がない）
+@app.get("/api/articles", response_model=List[ArticleCard])
+async def get_articles(
+    response: Response,
     category: Optional[str] = None,
     priority: Optional[str] = None,
     source_type: Optional[str] = None,
     days: Optional[int] = 7,
     min_score: Optional[int] = None,
     search: Optional[str] = None,
+    sort: str = "score",
+    cursor: Optional[str] = None,
     offset: int = 0,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    q = db.query(models.Article)
+    """次ページは X-Next-Cursor ヘッダのカーソルを cursor に渡して取得する（search 時のみ offset）"""
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail="sort must be 'score' or 'published'")
+    return await db.run_sync(
+        list_articles, response, category, priority, source_type, days, min_score, search, sort, cursor, offset
+    )
+
+def list_articles(db, response, category, priority, source_type, days, min_score, search, sort, cursor, offset):
+    q = db.query(models.Article).options(load_only(*CARD_COLUMNS))
     if category:
         q = q.filter(models.Article.category == category)
     if priority:
@@ -83,16 +157,24 @@ def get_articles(
     if min_score:
         q = q.filter(models.Article.score >= min_score)
     if search:
-        q = q.filter(
-            models.Article.title.icontains(search) | 
-            models.Article.summary_ja.icontains(search)
-        )
-        
-    return q.order_by(desc(models.Article.score)).offset(offset).limit(20).all()
+        # 空白区切りの語はすべて含む記事を FTS で検索し、bm25 の関連度順に返す
+        terms = search.split()
+        q, rank = apply_search(q, terms, operator="AND")
+        if rank is not None:
+            # ページの ID を先に決め、記事の列とスニペットはその分だけ読む
+            ids = ranked_ids(q, rank, desc(models.Article.score), PAGE_SIZE, offset)
+            articles = {a.id: a for a in db.query(models.Article).options(load_only(*CARD_COLUMNS)).filter(models.Article.id.in_(ids))}
+            snips = snippets(db, ids, terms, operator="AND")
+            return [dict({name: getattr(articles[i], name) for name in CARD_FIELDS}, snippet=snips.get(i)) for i in ids]
+    
+    if offset and not cursor:
+        # 旧クライアント向け。深いページほど遅くなるため cursor を推奨
+        return q.order_by(desc(SORT_COLUMNS[sort]), desc(models.Article.id)).offset(offset).limit(PAGE_SIZE).all()
+    return cursor_page(response, lambda: keyset_page(q, SORT_COLUMNS[sort], models.Article.id, cursor, PAGE_SIZE))
 
 @app.get("/api/articles/{id}")
-def get_article(id: int, db: Session = Depends(get_db)):
-    a = db.query(models.Article).filter(models.Article.id == id).first()
+async def get_article(id: int, db: AsyncSession = Depends(get_async_db)):
+    a = await db.get(models.Article, id)
     if not a:
         raise HTTPException(status_code=404, detail="Not found")
     return a
@@ -118,13 +200,14 @@ def unclip_article(id: int, db: Session = Depends(get_db)):
     return {"success": True}
 
 @app.post("/api/search/ai")
-def ai_search_endpoint(req: ATSearchRequest):
-    res = search_articles(req.query)
+async def ai_search_endpoint(req: ATSearchRequest):
+    # Gemini の応答待ちの間もワーカースレッドを占有しない
+    res = await search_articles_async(req.query)
     return res
 
 @app.get("/api/sources")
-def get_sources(db: Session = Depends(get_db)):
-    return db.query(models.CustomSource).all()
+async def get_sources(db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: s.query(models.CustomSource).all())
 
 @app.post("/api/sources")
 def add_source(req: SourceCreate, db: Session = Depends(get_db)):
@@ -133,6 +216,7 @@ def add_source(req: SourceCreate, db: Session = Depends(get_db)):
         stype = "youtube" if "youtube.com" in req.url or "v=" in req.url or req.url.startswith("UC") else "rss"
     s = models.CustomSource(url=req.url, type=stype, enabled=True, display_name=req.url)
     db.add(s)
+    record_source(db, 1)
     db.commit()
     return s
 
@@ -141,8 +225,15 @@ def update_source(id: int, req: SourceUpdate, db: Session = Depends(get_db)):
     s = db.query(models.CustomSource).filter(models.CustomSource.id == id).first()
     if not s:
         raise HTTPException(status_code=404)
-    s.enabled = req.enabled
+    if req.enabled is not None:
+        s.enabled = req.enabled
+    rescore = req.priority_bonus is not None and req.priority_bonus != s.priority_bonus
+    if req.priority_bonus is not None:
+        s.priority_bonus = req.priority_bonus
     db.commit()
+    db.refresh(s)
+    if rescore:
+        rescore_articles(source_ids=[id])
     return s
 
 @app.delete("/api/sources/{id}")
@@ -151,18 +242,47 @@ def delete_source(id: int, db: Session = Depends(get_db)):
     if not s:
         raise HTTPException(status_code=404)
     db.delete(s)
+    db.query(models.FeedCache).filter(models.FeedCache.source_id == id).delete()
+    record_source(db, -1)
     db.commit()
     return {"success": True}
 
 @app.get("/api/keywords")
-def get_keywords(db: Session = Depends(get_db)):
-    return db.query(models.Keyword).all()
+async def get_keywords(db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: s.query(models.Keyword).all())
+
+def _after_rescore(db, changed):
+    if changed:
+        invalidate_search_cache(db)
+        render_feeds(db)
+
+def rescore_articles(source_ids=None, terms=None):
+    """ルール・ボーナスの変更を既存記事に反映する（バックグラウンドで再採点し、続けての変更はまとめる）。
+
+    再採点するのは source_ids のソースの記事と、terms（変更前後のルールの語）を含む記事だけ。
+    """
+    schedule_rescore(SessionLocal, after=_after_rescore, source_ids=source_ids, terms=terms)
 
 @app.post("/api/keywords")
 def add_keyword(req: KeywordCreate, db: Session = Depends(get_db)):
-    k = models.Keyword(terms=req.terms)
+    k = models.Keyword(**req.model_dump())
     db.add(k)
     db.commit()
+    db.refresh(k)
+    rescore_articles(terms=rule_terms(k))
+    return k
+
+@app.put("/api/keywords/{id}")
+def update_keyword(id: int, req: KeywordCreate, db: Session = Depends(get_db)):
+    k = db.query(models.Keyword).filter(models.Keyword.id == id).first()
+    if not k:
+        raise HTTPException(status_code=404)
+    old_terms = rule_terms(k)
+    for field, value in req.model_dump().items():
+        setattr(k, field, value)
+    db.commit()
+    db.refresh(k)
+    rescore_articles(terms=old_terms | rule_terms(k))
     return k
 
 @app.delete("/api/keywords/{id}")
@@ -170,49 +290,215 @@ def delete_keyword(id: int, db: Session = Depends(get_db)):
     k = db.query(models.Keyword).filter(models.Keyword.id == id).first()
     if not k:
         raise HTTPException(status_code=404)
+    terms = rule_terms(k)
     db.delete(k)
     db.commit()
+    rescore_articles(terms=terms)
     return {"success": True}
 
+def card_json(row):
+    """ArticleCard と同じ JSON を行から直接組み立てる（1回に数百件あるので pydantic を通さない）"""
+    card = {name: getattr(row, name) for name in CARD_FIELDS}
+    if card["published_at"] is not None:
+        card["published_at"] = card["published_at"].isoformat()
+    return card
+
+def group_heads_statement(group_col, filters, per_group, descending):
+    """グループ毎の先頭 per_group+1 件（published_at DESC, id DESC）と件数を1回のクエリで読む文。
+
+    1件多く読むのは続きがあるか（next_cursor を返すか）を知るため。
+    窓関数は id と並び順の列だけで計算し、カードの列は残った行だけ読む（ORM のオブジェクトは作らない）。
+    """
+    order = (desc(models.Article.published_at), desc(models.Article.id))
+    heads = select(
+        models.Article.id.label("id"),
+        group_col.label("grp"),
+        func.row_number().over(partition_by=group_col, order_by=order).label("rn"),
+        func.count().over(partition_by=group_col).label("cnt"),
+    ).where(*filters).subquery()
+    return select(*CARD_COLUMNS, heads.c.grp, heads.c.cnt).join(
+        heads, heads.c.id == models.Article.id
+    ).where(heads.c.rn <= per_group + 1).order_by(heads.c.grp.desc() if descending else heads.c.grp, heads.c.rn)
+
+def stream_groups(list_key, key_name, stmt, per_group):
+    """group_heads_statement の結果をグループが変わる毎に JSON として逐次書き出す。
+
+    行は1グループ分ずつしか保持しない。
+    ストリーミング中は依存性注入のセッションが閉じている可能性があるため専用のセッションを使う。
+    """
+    def item(key, count, rows):
+        next_cursor = None
+        if len(rows) > per_group:
+            rows = rows[:per_group]
+            next_cursor = encode_cursor(rows[-1].published_at, rows[-1].id)
+        return json.dumps({key_name: key, "count": count, "articles": [card_json(a) for a in rows], "next_cursor": next_cursor},
+                          ensure_ascii=False)
+
+    async def generate():
+        async with AsyncSessionLocal() as db:
+            yield '{"' + list_key + '": ['
+            first, key, count, rows = True, None, 0, []
+            result = await db.stream(stmt)
+            async for row in result:
+                if rows and row.grp != key:
+                    yield ("" if first else ",") + item(key, count, rows)
+                    first, rows = False, []
+                key, count = row.grp, row.cnt
+                rows.append(row)
+            if rows:
+                yield ("" if first else ",") + item(key, count, rows)
+            yield "]}"
+    return StreamingResponse(generate(), media_type="application/json")
+
+def parse_day(day: str):
+    try:
+        return datetime.datetime.strptime(day, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="day must be YYYY-MM-DD")
+
+def timeline_day_page(db, day, cursor=None, limit=PAGE_SIZE):
+    start = parse_day(day)
+    q = db.query(models.Article).options(load_only(*CARD_COLUMNS)).filter(
+        models.Article.published_at >= start,
+        models.Article.published_at < start + datetime.timedelta(days=1)
+    )
+    return keyset_page(q, models.Article.published_at, models.Article.id, cursor, limit)
+
+# フォルダ未指定（NULL）のクリップは "default" フォルダに入れる。
+# リテラルで書く（バインド変数にすると式インデックス ix_articles_clipped_folder と一致しない）
+CLIP_FOLDER = func.coalesce(models.Article.clip_folder, literal_column("'default'"))
+
+def clip_folder_page(db, folder, cursor=None, limit=PAGE_SIZE):
+    q = db.query(models.Article).options(load_only(*CARD_COLUMNS)).filter(
+        models.Article.is_clipped == True,
+        CLIP_FOLDER == folder
+    )
+    return keyset_page(q, models.Article.published_at, models.Article.id, cursor, limit)
+
+def cursor_page(response, page_fn):
+    try:
+        rows, next_cursor = page_fn()
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 @app.get("/api/timeline")
-def get_timeline(days: int = 7, db: Session = Depends(get_db)):
-    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
-    articles = db.query(models.Article).filter(models.Article.published_at >= cutoff).order_by(desc(models.Article.published_at)).all()
-    
-    result = {}
-    for a in articles:
-        if not a.published_at: continue
-        d_str = a.published_at.strftime("%Y-%m-%d")
-        if d_str not in result:
-            result[d_str] = []
-        result[d_str].append(a)
-    return result
+async def get_timeline(days: int = 7, per_day: int = Query(PAGE_SIZE, ge=1, le=100)):
+    """日毎の件数と先頭 per_day 件。続きは /api/timeline/{day}?cursor= で取得する"""
+    # 日の途中で切ると最初の日の件数が /api/timeline/{day}（1日分）と合わないため、その日の0時から数える
+    cutoff = datetime.datetime.combine((datetime.datetime.now() - datetime.timedelta(days=days)).date(), datetime.time.min)
+    stmt = group_heads_statement(func.date(models.Article.published_at), [models.Article.published_at >= cutoff], per_day, True)
+    return stream_groups("days", "date", stmt, per_day)
+
+@app.get("/api/timeline/{day}", response_model=List[ArticleCard])
+async def get_timeline_day(day: str, response: Response, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: cursor_page(response, lambda: timeline_day_page(s, day, cursor)))
 
 @app.get("/api/clips")
-def get_clips(db: Session = Depends(get_db)):
-    clipped = db.query(models.Article).filter(models.Article.is_clipped == True).all()
-    res = {}
-    for c in clipped:
-        f = c.clip_folder or "default"
-        if f not in res: res[f] = []
-        res[f].append(c)
-    return res
+async def get_clips(per_folder: int = Query(PAGE_SIZE, ge=1, le=100)):
+    """フォルダ毎の件数と先頭 per_folder 件。続きは /api/clips/{folder}?cursor= で取得する"""
+    stmt = group_heads_statement(CLIP_FOLDER, [models.Article.is_clipped == True], per_folder, False)
+    return stream_groups("folders", "folder", stmt, per_folder)
+
+@app.get("/api/clips/{folder}", response_model=List[ArticleCard])
+async def get_clip_folder(folder: str, response: Response, cursor: Optional[str] = None, db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(lambda s: cursor_page(response, lambda: clip_folder_page(s, folder, cursor)))
 
 @app.get("/api/stats")
-def get_stats(db: Session = Depends(get_db)):
-    total_articles = db.query(models.Article).count()
-    total_sources = db.query(models.CustomSource).count()
-    today_cutoff = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_articles = db.query(models.Article).filter(models.Article.published_at >= today_cutoff).count()
-    return {"articles": total_articles, "sources": total_sources, "today_articles": today_articles}
+async def get_stats(db: AsyncSession = Depends(get_async_db)):
+    # 記事保存・ソース増減の度に更新しているカウンタを読むだけ（COUNT(*) はしない）
+    return await db.run_sync(read_stats)
 
 @app.get("/feed/public")
-def get_public_feed(db: Session = Depends(get_db)):
-    articles = db.query(models.Article).filter(models.Article.score >= 55).order_by(desc(models.Article.published_at)).limit(50).all()
-    feed = generate_atom_feed(articles)
-    return Response(content=feed, media_type="application/xml")
+async def get_public_feed(
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+):
+    """収集時に描画済みのフィードを返す（DB は読まない）。category / priority で絞った版も同じく描画済み"""
+    if category and priority:
+        raise HTTPException(status_code=400, detail="category と priority は同時に指定できません")
+    if (category and category not in FEED_CATEGORIES) or (priority and priority not in FEED_PRIORITIES):
+        raise HTTPException(status_code=404, detail="Not found")
+    if not rendered_feeds.ready():
+        await asyncio.to_thread(ensure_rendered)
+    cached = rendered_feeds.get(variant_name(category, priority))
+    if cached is None:
+        raise HTTPException(status_code=503, detail="フィードを準備中です")
+    body, etag, last_modified = cached
+    headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": f"public, max-age={FEED_MAX_AGE}"}
+    if not_modified(etag, last_modified, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/xml", headers=headers)
+
+@app.get("/api/export/notebooklm")
+async def download_notebooklm_export(since_id: Optional[int] = Query(None, ge=0)):
+    """NotebookLM 用のテキストを逐次ダウンロードさせる。since_id を渡すとそれより後に追加された記事だけ"""
+    async def generate():
+        async with AsyncSessionLocal() as db:
+            buffer = [export_header()]
+            size = 0
+            result = await db.stream(export_statement(since_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+            async for row in result:
+                text = format_article(row)
+                buffer.append(text)
+                size += len(text)
+                if size >= 65536:
+                    yield "".join(buffer)
+                    buffer, size = [], 0
+            yield "".join(buffer)
+    name = f"notebooklm_export{'_since' + str(since_id) if since_id is not None else ''}.txt"
+    return StreamingResponse(generate(), media_type="text/plain",
+                             headers={"Content-Disposition": f'attachment; filename="{name}"'})
 
 @app.post("/api/collect")
-def run_collection(background_tasks: BackgroundTasks):
-    background_tasks.add_task(collect_data)
-    return {"message": "Collection started in background"}
+def run_collection(db: Session = Depends(get_db)):
+    """ソース毎の収集ジョブをキューに積む（実行はワーカー）。実行待ち・実行中のソースには積まない"""
+    run, queued, skipped = jobs.enqueue_collection(db)
+    if run is None:
+        return {"message": "Collection already queued or running", "run_id": None, "queued": 0, "skipped": skipped}
+    return {"message": "Collection queued", "run_id": run.id, "queued": queued, "skipped": skipped}
+
+@app.get("/api/collect/reports")
+async def list_collection_reports(limit: int = Query(20, ge=1, le=200), db: AsyncSession = Depends(get_async_db)):
+    return await db.run_sync(jobs.list_reports, limit)
+
+@app.get("/api/collect/reports/{report_id}")
+async def get_collection_report(report_id: int, db: AsyncSession = Depends(get_async_db)):
+    report = await db.run_sync(jobs.report_detail, report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return report
+
+@app.get("/api/collect/{run_id}")
+async def get_collection_run(run_id: int, db: AsyncSession = Depends(get_async_db)):
+    status = await db.run_sync(jobs.run_status, run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return status
+
+@app.get("/api/jobs")
+async def list_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500), db: AsyncSession = Depends(get_async_db)):
+    def query(s):
+        q = s.query(models.CollectionJob)
+        if status:
+            q = q.filter(models.CollectionJob.status == status)
+        return [jobs.job_to_dict(job) for job in q.order_by(desc(models.CollectionJob.id)).limit(limit).all()]
+    return await db.run_sync(query)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await db.get(models.CollectionJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Not found")
+    reports = await db.run_sync(jobs.job_reports, [job_id])
+    return {**jobs.job_to_dict(job), "report": reports.get(job_id)}
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus 形式のメトリクス（このプロセス分。別プロセスのワーカーは WORKER_METRICS_PORT）"""
+    # media_type で渡すと charset が二重に付くのでヘッダで指定する
+    return Response(metrics.REGISTRY.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
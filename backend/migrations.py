@@ -0,0 +1,56 @@
+import datetime
+from sqlalchemy import text
+
+# 公開フィードの掲載基準。部分インデックスの条件と一致させるため、クエリ側でもリテラルで使う
+FEED_MIN_SCORE = 55
+
+# (名前, SQL のリスト)。適用済みの名前は schema_migrations に記録し、二度は流さない。
+# 新しい列やインデックスはここに追記する（create_all は既存テーブルを変更しないため）
+MIGRATIONS = [
+    ("0001_article_access_indexes", [
+        # /api/articles: 各フィルタで絞ってから score DESC で上位を取る
+        "CREATE INDEX IF NOT EXISTS ix_articles_score ON articles (score DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_category_score ON articles (category, score DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_priority_score ON articles (priority_label, score DESC)",
+        "CREATE INDEX IF NOT EXISTS ix_articles_source_type_score ON articles (source_type, score DESC)",
+        # /api/timeline, /api/stats, /api/articles?days=
+        "CREATE INDEX IF NOT EXISTS ix_articles_published_at ON articles (published_at DESC)",
+        # /api/clips: クリップ済みの行だけを持つ部分インデックス
+        "CREATE INDEX IF NOT EXISTS ix_articles_clipped ON articles (clip_folder) WHERE is_clipped = 1",
+        # /feed/public: 掲載基準を満たす行だけを公開日時順に
+        f"CREATE INDEX IF NOT EXISTS ix_articles_feed ON articles (published_at DESC) WHERE score >= {FEED_MIN_SCORE}",
+        "ANALYZE",
+    ]),
+    ("0002_clip_folder_page_index", [
+        # /api/clips: フォルダ毎の件数集計と、フォルダ内を公開日時順にページングする
+        "DROP INDEX IF EXISTS ix_articles_clipped",
+        "CREATE INDEX IF NOT EXISTS ix_articles_clipped_folder ON articles (clip_folder, published_at DESC) WHERE is_clipped = 1",
+    ]),
+    ("0003_dedupe_transcript_text", [
+        # 字幕を分析した動画は full_text に字幕と同じ内容を持っていた。字幕列にだけ残す
+        "UPDATE articles SET full_text = NULL WHERE transcript IS NOT NULL AND transcript != '' AND full_text = transcript",
+    ]),
+    ("0004_clip_folder_default_index", [
+        # /api/clips: フォルダ未指定（NULL）のクリップは "default" として集計・ページングする
+        "DROP INDEX IF EXISTS ix_articles_clipped_folder",
+        "CREATE INDEX IF NOT EXISTS ix_articles_clipped_folder ON articles "
+        "(coalesce(clip_folder, 'default'), published_at DESC) WHERE is_clipped = 1",
+    ]),
+]
+
+def run_migrations(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR PRIMARY KEY, applied_at DATETIME)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+        for name, statements in MIGRATIONS:
+            if name in applied:
+                continue
+            for sql in statements:
+                conn.execute(text(sql))
+            conn.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :at)"),
+                {"name": name, "at": datetime.datetime.now()}
+            )
+            print(f"[DB] マイグレーション適用: {name}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, JSON, Float, DateTime
+from sqlalchemy import Column, Integer, String, Boolean, JSON, Float, DateTime, LargeBinary
 from sqlalchemy.orm import DeclarativeBase
 
 class Base(DeclarativeBase):
@@ -54,3 +54,112 @@ class Keyword(Base):
     excludes = Column(JSON)
     bonus = Column(Float, default=0.0)
     enabled = Column(Boolean, default=True)
+
+class FeedCache(Base):
+    __tablename__ = "feed_cache"
+
+    source_id = Column(Integer, primary_key=True)
+    etag = Column(String)
+    last_modified = Column(String)
+    content_hash = Column(String)
+    checked_at = Column(DateTime)
+
+class AnalysisCache(Base):
+    __tablename__ = "analysis_cache"
+
+    content_hash = Column(String, primary_key=True)
+    analysis = Column(JSON)
+    created_at = Column(DateTime)
+    last_used_at = Column(DateTime, index=True)
+    hits = Column(Integer, default=0)
+
+class TranscriptCache(Base):
+    __tablename__ = "transcript_cache"
+
+    video_id = Column(String, primary_key=True)
+    status = Column(String, nullable=False)  # ok / none（字幕が無い・動画が非公開など）
+    transcript = Column(String)
+    fetched_at = Column(DateTime, index=True)
+
+class ArticleFingerprint(Base):
+    __tablename__ = "article_fingerprints"
+
+    article_id = Column(Integer, primary_key=True)
+    canonical_url = Column(String, index=True)
+    minhash = Column(LargeBinary)
+    created_at = Column(DateTime, index=True)
+
+class ArticleAlias(Base):
+    __tablename__ = "article_aliases"
+
+    url = Column(String, primary_key=True)
+    article_id = Column(Integer, index=True, nullable=False)
+    reason = Column(String) # url, minhash
+    similarity = Column(Float)
+    created_at = Column(DateTime)
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    dimension = Column(String, primary_key=True) # total, sources, day, category, source, version
+    key = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class CollectionRun(Base):
+    __tablename__ = "collection_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime)
+    job_count = Column(Integer, default=0)
+
+class CollectionJob(Base):
+    __tablename__ = "collection_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, index=True)
+    source_id = Column(Integer, index=True, nullable=False)
+    status = Column(String, index=True, nullable=False) # queued, running, done, failed
+    attempts = Column(Integer, default=0)
+    worker_id = Column(String)
+    lease_expires_at = Column(DateTime)
+    items_found = Column(Integer, default=0)
+    items_saved = Column(Integer, default=0)
+    error = Column(String)
+    created_at = Column(DateTime)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class CollectionReport(Base):
+    """収集1回分の集計（段毎の処理件数・所要時間は stages に保存）"""
+    __tablename__ = "collection_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime, index=True)
+    finished_at = Column(DateTime)
+    duration_seconds = Column(Float)
+    source_count = Column(Integer, default=0)
+    items_fetched = Column(Integer, default=0)
+    items_skipped = Column(Integer, default=0)
+    items_analyzed = Column(Integer, default=0)
+    items_saved = Column(Integer, default=0)
+    stages = Column(JSON)
+
+class SourceReport(Base):
+    """収集1回分のソース毎の集計"""
+    __tablename__ = "source_reports"
+
+    id = Column(Integer, primary_key=True, index=True)
+    report_id = Column(Integer, index=True, nullable=False)
+    job_id = Column(Integer, index=True)
+    source_id = Column(Integer, index=True, nullable=False)
+    source_name = Column(String)
+    fetched = Column(Integer, default=0)  # フィードから取得した記事数
+    not_modified = Column(Boolean, default=False)  # 304 または本文が前回と同一
+    skipped = Column(Integer, default=0)  # 保存済み・準重複・件数制限で除外
+    analyzed = Column(Integer, default=0)
+    analysis_failed = Column(Integer, default=0)
+    saved = Column(Integer, default=0)
+    fetch_seconds = Column(Float)
+    duration_seconds = Column(Float)  # 収集開始からそのソースの保存完了まで
+    status = Column(String)  # done, failed, incomplete
+    error = Column(String)
@@ -0,0 +1,41 @@
+import json
+import base64
+import datetime
+from sqlalchemy import or_, and_, desc
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(value, row_id):
+    if isinstance(value, datetime.datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps([value, row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if isinstance(value, dict):
+            value = datetime.datetime.fromisoformat(value["dt"])
+        return value, int(row_id)
+    except Exception as e:
+        raise InvalidCursor(f"invalid cursor: {cursor}") from e
+
+def keyset_page(q, sort_col, id_col, cursor=None, limit=20):
+    """(sort_col DESC, id DESC) のキーセットページング。
+
+    OFFSET と違い、何ページ目でも索引上の位置から読み始めるので深いページでも遅くならない。
+    sort_col は NULL を含まない列であること（collector は score / published_at を必ず設定する）。
+    戻り値: (行のリスト, 次ページのカーソル or None)
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor)
+        q = q.filter(sort_col <= value, or_(sort_col < value, and_(sort_col == value, id_col < last_id)))
+    rows = q.order_by(desc(sort_col), desc(id_col)).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
@@ -0,0 +1,146 @@
+import os
+import time
+import queue
+import threading
+
+# 段と段の間のキューの長さ。下流が詰まったら上流は待つ（メモリに溜め込まない）
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "64"))
+# 実行中に各段の滞留を表示する間隔（0 で表示しない）
+PIPELINE_REPORT_SECONDS = float(os.environ.get("PIPELINE_REPORT_SECONDS", "10"))
+
+_STOP = object()
+
+class Stage:
+    """パイプラインの1段。inbox から取り出した要素を handler に渡すスレッドを workers 本動かす。
+
+    batch_size > 1 の段は、最初の1件を受け取ってから最大 linger 秒待って batch_size 件までまとめる。
+    handler は要素のリストを受け取り、次の段へは自分で put する。
+    """
+
+    def __init__(self, name, handler, workers=1, batch_size=1, linger=0.0, maxsize=PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+        self.inbox = queue.Queue(maxsize=maxsize)
+        self.items = 0
+        self.batches = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.max_backlog = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        self.started_at = time.monotonic()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def put(self, item):
+        self.inbox.put(item)
+        backlog = self.inbox.qsize()
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+
+    def close(self):
+        """上流がすべて put し終えた後に呼ぶ。残りを処理し終えるまで待つ"""
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for t in self._threads:
+            t.join()
+        self.finished_at = time.monotonic()
+
+    def _next_batch(self):
+        first = self.inbox.get()
+        if first is _STOP:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.inbox.get(timeout=timeout) if timeout > 0 else self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # 自分の停止は、まとめた分を処理してから
+                self.inbox.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            start = time.monotonic()
+            try:
+                self.handler(batch)
+            except Exception as e:
+                # handler 側で要素毎の失敗を下流に伝える。ここに来るのは想定外の失敗のみ
+                import traceback
+                print(f"[PIPELINE] {self.name} で予期せぬエラー: {e}")
+                traceback.print_exc()
+                with self._lock:
+                    self.errors += 1
+            with self._lock:
+                self.busy += time.monotonic() - start
+                self.items += len(batch)
+                self.batches += 1
+
+    def stats(self):
+        end = self.finished_at or time.monotonic()
+        wall = max(1e-6, end - (self.started_at or end))
+        return {
+            "stage": self.name, "workers": self.workers, "items": self.items, "batches": self.batches,
+            "errors": self.errors, "busy_seconds": round(self.busy, 3),
+            "utilization": round(self.busy / (wall * self.workers), 3),
+            "throughput": round(self.items / wall, 3), "backlog": self.inbox.qsize(), "max_backlog": self.max_backlog,
+        }
+
+class Pipeline:
+    """上流から順に並べた Stage の集まり。close は上流から順に閉じる"""
+
+    def __init__(self, stages):
+        self.stages = stages
+        self._stop_report = threading.Event()
+        self._reporter = None
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        if PIPELINE_REPORT_SECONDS > 0:
+            self._reporter = threading.Thread(target=self._report_loop, daemon=True)
+            self._reporter.start()
+        return self
+
+    def close(self):
+        for stage in self.stages:
+            stage.close()
+        self._stop_report.set()
+        if self._reporter:
+            self._reporter.join()
+        return [stage.stats() for stage in self.stages]
+
+    def _report_loop(self):
+        while not self._stop_report.wait(PIPELINE_REPORT_SECONDS):
+            print("[PIPELINE] " + " | ".join(
+                f"{s.name}: 処理{s.items} 滞留{s.inbox.qsize()}" for s in self.stages
+            ))
+
+def format_stats(stats):
+    lines = [f"{'stage':<8} {'workers':>7} {'items':>6} {'errors':>6} {'busy':>8} {'util':>6} {'rate/s':>8} {'max_q':>6}"]
+    for s in stats:
+        util = "-" if s["utilization"] is None else f"{s['utilization']:.0%}"
+        lines.append(
+            f"{s['stage']:<8} {s['workers']:>7} {s['items']:>6} {s['errors']:>6} {s['busy_seconds']:>7.1f}s "
+            f"{util:>6} {s['throughput']:>8.2f} {s['max_backlog']:>6}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,144 @@
+"""各エンドポイントが実際に発行するクエリに EXPLAIN QUERY PLAN をかけ、
+インデックスを使わない全件走査 (SCAN <table>) があれば一覧を出して終了コード 1 で終わる。
+
+usage: python query_plans.py
+"""
+import re
+import sys
+import asyncio
+import datetime
+from fastapi import Response
+from sqlalchemy import event, text
+from pagination import encode_cursor
+from database import engine, async_engine, AsyncSessionLocal, init_db
+import main
+import ai_search
+import feed
+
+# 全件を返すこと自体が仕様の小さな設定テーブル
+ALLOWED_FULL_SCANS = {"custom_sources", "keywords"}
+# 主キー順に LIMIT 件だけ読む一覧（rowid を逆順に辿って打ち切るので、並べ替えがなければ全件は読まない）
+ALLOWED_ORDERED_SCANS = {"collection_jobs", "collection_reports"}
+# 全記事を読むこと自体が仕様のケース。索引の順に読む（並べ替えのために溜め込まない）ことだけを確認する
+ALLOWED_FULL_SCAN_CASES = {"GET /api/export/notebooklm"}
+
+_SCAN_RE = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+def endpoint_cases():
+    """(名前, AsyncSession を受け取って実行するコルーチン関数)"""
+    cases = [
+        ("GET /api/articles", lambda db: _articles(db=db)),
+        ("GET /api/articles?days=0", lambda db: _articles(days=0, db=db)),
+        ("GET /api/articles?category", lambda db: _articles(category="LLM", days=0, db=db)),
+        ("GET /api/articles?priority", lambda db: _articles(priority="HOT", days=0, db=db)),
+        ("GET /api/articles?source_type", lambda db: _articles(source_type="youtube", days=0, db=db)),
+        ("GET /api/articles?min_score", lambda db: _articles(min_score=60, days=0, db=db)),
+        ("GET /api/articles?category&priority&days", lambda db: _articles(category="LLM", priority="HOT", db=db)),
+        ("GET /api/articles?sort=published", lambda db: _articles(sort="published", days=0, db=db)),
+        ("GET /api/articles?cursor", lambda db: _articles(days=0, cursor=encode_cursor(50.0, 10), db=db)),
+        ("GET /api/articles?category&cursor", lambda db: _articles(category="LLM", cursor=encode_cursor(50.0, 10), db=db)),
+        ("GET /api/articles?sort=published&cursor", lambda db: _articles(
+            sort="published", days=0, cursor=encode_cursor(datetime.datetime.now(), 10), db=db)),
+        ("GET /api/articles?search", lambda db: _articles(search="OpenAI 生成AI", db=db)),
+        ("GET /api/articles?search (short)", lambda db: _articles(search="画像", db=db)),
+        ("GET /api/articles/{id}", lambda db: _ignore_404(main.get_article(1, db=db))),
+        ("GET /api/timeline", lambda db: _drain(main.get_timeline(days=7, per_day=20))),
+        ("GET /api/timeline/{day}", lambda db: main.get_timeline_day(
+            datetime.date.today().isoformat(), Response(), cursor=encode_cursor(datetime.datetime.now(), 10), db=db)),
+        ("GET /api/clips", lambda db: _drain(main.get_clips(per_folder=20))),
+        ("GET /api/clips/{folder}", lambda db: main.get_clip_folder(
+            "default", Response(), cursor=encode_cursor(datetime.datetime.now(), 10), db=db)),
+        ("GET /api/stats", lambda db: main.get_stats(db=db)),
+        ("GET /api/sources", lambda db: main.get_sources(db=db)),
+        ("GET /api/keywords", lambda db: main.get_keywords(db=db)),
+        # /feed/public はアクセス時に DB を読まない。収集後の描画で発行するクエリを見る
+        ("render feed (public)", lambda db: db.run_sync(lambda s: list(feed.feed_articles(s)))),
+        ("render feed (category)", lambda db: db.run_sync(lambda s: list(feed.feed_articles(s, category="LLM")))),
+        ("render feed (priority)", lambda db: db.run_sync(lambda s: list(feed.feed_articles(s, priority="HOT")))),
+        ("GET /api/export/notebooklm", lambda db: _drain(main.download_notebooklm_export(since_id=None))),
+        ("GET /api/export/notebooklm?since_id", lambda db: _drain(main.download_notebooklm_export(since_id=10))),
+        ("GET /api/jobs", lambda db: main.list_jobs(status=None, limit=50, db=db)),
+        ("GET /api/jobs?status", lambda db: main.list_jobs(status="running", limit=50, db=db)),
+        ("GET /api/collect/{run_id}", lambda db: _ignore_404(main.get_collection_run(1, db=db))),
+        ("GET /api/collect/reports", lambda db: main.list_collection_reports(limit=20, db=db)),
+        ("GET /api/collect/reports/{report_id}", lambda db: _ignore_404(main.get_collection_report(1, db=db))),
+        ("GET /api/jobs/{job_id}", lambda db: _ignore_404(main.get_job(1, db=db))),
+        ("POST /api/search/ai (DB step)", lambda db: db.run_sync(
+            ai_search.find_candidates, {"keywords": ["OpenAI", "画像"], "source_type": "rss", "category": None}, "OpenAI 画像", [])),
+    ]
+    return cases
+
+def _articles(**kwargs):
+    return main.get_articles(Response(), **kwargs)
+
+async def _drain(coro):
+    """StreamingResponse の本文を最後まで流して、ストリーム中のクエリも実行させる"""
+    response = await coro
+    async for _ in response.body_iterator:
+        pass
+
+async def _ignore_404(coro):
+    try:
+        await coro
+    except Exception:
+        pass
+
+def full_scans(conn, statement, parameters, tables, allow_full=False):
+    plan = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+    if allow_full:
+        return [row[-1] for row in plan if "TEMP B-TREE" in row[-1]]
+    ordered = "LIMIT" in statement and not any("TEMP B-TREE" in row[-1] for row in plan)
+    found = []
+    for row in plan:
+        m = _SCAN_RE.match(row[-1])
+        if not m or m.group(1) not in tables or m.group(1) in ALLOWED_FULL_SCANS:
+            continue
+        if ordered and m.group(1) in ALLOWED_ORDERED_SCANS:
+            continue
+        found.append(row[-1])
+    return found
+
+async def run_cases(capture_to):
+    """各ケースを実行し、(名前, 発行された SELECT のリスト) を返す"""
+    results = []
+    for name, fn in endpoint_cases():
+        capture_to.clear()
+        async with AsyncSessionLocal() as db:
+            await fn(db)
+        results.append((name, list(capture_to)))
+    await async_engine.dispose()
+    return results
+
+def check():
+    init_db()
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    with engine.connect() as conn:
+        tables = {r[0] for r in conn.execute(text("SELECT name FROM sqlite_master WHERE type='table'"))}
+
+    failures = []
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        results = asyncio.run(run_cases(captured))
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+    with engine.connect() as conn:
+        for name, statements in results:
+            for statement, parameters in statements:
+                scans = full_scans(conn, statement, parameters, tables, name in ALLOWED_FULL_SCAN_CASES)
+                status = "NG" if scans else "ok"
+                print(f"[{status}] {name}: {' / '.join(scans) if scans else 'index'}")
+                if scans:
+                    failures.append((name, statement, scans))
+
+    for name, statement, scans in failures:
+        print(f"\n--- {name}\n{statement}\n=> {scans}")
+    return not failures
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
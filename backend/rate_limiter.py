@@ -0,0 +1,123 @@
+import time
+import asyncio
+import random
+import threading
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class TokenBucketLimiter:
+    """RPM/TPM の2つのトークンバケットで呼び出しを制限するプロセス共有リミッタ。
+
+    - 429/RESOURCE_EXHAUSTED を受けたら rate_scale を半減し、一定時間すべての取得を止める
+    - 成功が続くと rate_scale を少しずつ 1.0 まで戻す（AIMD）
+    - INTERACTIVE の待機者がいる間は BACKGROUND には払い出さない
+    """
+
+    def __init__(self, rpm, tpm, min_scale=0.1, jitter=0.25):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.min_scale = min_scale
+        self.jitter = jitter
+        self.rate_scale = 1.0
+        self._requests = self.rpm
+        self._tokens = self.tpm
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._strikes = 0
+        self._waiting_interactive = 0
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        scale = self.rate_scale / 60.0
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm * scale)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm * scale)
+
+    def _wait_time(self, now, tokens):
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        scale = self.rate_scale / 60.0
+        need_req = max(0.0, 1.0 - self._requests) / (self.rpm * scale)
+        need_tok = max(0.0, tokens - self._tokens) / (self.tpm * scale)
+        return max(need_req, need_tok)
+
+    def _try_take(self, tokens, priority):
+        """枠が取れれば 0、取れなければ次に試すまでの秒数を返す（_cond を保持して呼ぶ）"""
+        now = time.monotonic()
+        self._refill(now)
+        if priority == BACKGROUND and self._waiting_interactive > 0:
+            return 0.5
+        wait = self._wait_time(now, tokens)
+        if wait <= 0:
+            self._requests -= 1.0
+            self._tokens -= tokens
+            return 0
+        # 同時に起きた待機者が揃って再試行しないようジッタを加える
+        return min(wait, 5.0) * (1.0 + random.uniform(0, self.jitter))
+
+    def acquire(self, tokens=1, priority=BACKGROUND):
+        """枠が空くまでブロックする。待機した秒数を返す"""
+        tokens = min(float(tokens), self.tpm)
+        start = time.monotonic()
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._waiting_interactive += 1
+            try:
+                while True:
+                    wait = self._try_take(tokens, priority)
+                    if wait == 0:
+                        return time.monotonic() - start
+                    self._cond.wait(wait)
+            finally:
+                if priority == INTERACTIVE:
+                    self._waiting_interactive -= 1
+                    self._cond.notify_all()
+
+    async def acquire_async(self, tokens=1, priority=BACKGROUND):
+        """acquire のイベントループ版。待機中もスレッドを占有しない"""
+        tokens = min(float(tokens), self.tpm)
+        start = time.monotonic()
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._waiting_interactive += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(tokens, priority)
+                if wait == 0:
+                    return time.monotonic() - start
+                await asyncio.sleep(wait)
+        finally:
+            if priority == INTERACTIVE:
+                with self._cond:
+                    self._waiting_interactive -= 1
+                    self._cond.notify_all()
+
+    def set_rates(self, rpm, tpm):
+        """上限を変える（プロセスの役割が決まった時に、割り当てられた分へ絞る）"""
+        with self._cond:
+            self._refill(time.monotonic())
+            self.rpm = float(rpm)
+            self.tpm = float(tpm)
+            self._requests = min(self._requests, self.rpm)
+            self._tokens = min(self._tokens, self.tpm)
+            self._cond.notify_all()
+
+    def report_rate_limited(self):
+        with self._cond:
+            now = time.monotonic()
+            self._strikes += 1
+            self.rate_scale = max(self.min_scale, self.rate_scale / 2)
+            self._requests = 0.0
+            cooldown = min(60.0, (60.0 / self.rpm) * (2 ** self._strikes))
+            self._blocked_until = max(self._blocked_until, now + cooldown * (1.0 + random.uniform(0, self.jitter)))
+            print(f"[RATE LIMIT] 429受信: レート{self.rate_scale:.2f}倍に低下、{cooldown:.0f}秒停止")
+
+    def report_success(self):
+        with self._cond:
+            self._strikes = 0
+            if self.rate_scale < 1.0:
+                self.rate_scale = min(1.0, self.rate_scale + 0.05)
+            self._cond.notify_all()
@@ -0,0 +1,267 @@
+"""記事スコア = Gemini の採点 + ソースの priority_bonus + キーワードルールのボーナス。
+
+キーワードルール（models.Keyword）は有効なものすべての語を1つの Aho-Corasick オートマトンにまとめ、
+記事のテキストを1回なめるだけで全ルールの一致を判定する。
+"""
+import threading
+from collections import deque
+from sqlalchemy import select, update, bindparam
+from analysis_cache import normalize
+from models import Article, CustomSource, Keyword
+
+RESCORE_BATCH_SIZE = 500
+
+def score_article(details):
+    try:
+        return details.get("relevance", 10) + details.get("reliability", 10) + details.get("freshness", 10) + details.get("virality", 5)
+    except (AttributeError, TypeError, ValueError):
+        # Gemini が score_details を dict 以外・数値以外で返した場合
+        return 0
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+class Matcher:
+    """複数の語を同時に探す Aho-Corasick オートマトン。
+
+    失敗遷移をたどった先の遷移まで状態毎の dict に展開しておくので、照合中に失敗遷移はたどらない
+    （根からの遷移だけは全状態に共通なので展開せず、見つからなければ根の表を引く）。
+    英数字で始まる・終わる語は単語の途中に一致しない（"ai" は "said" に一致しない）。
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._lengths = [len(p) for p in self.patterns]
+        self._bounded = [(_is_word_char(p[0]), _is_word_char(p[-1])) for p in self.patterns]
+        goto = [{}]
+        out = [[]]
+        for pid, pattern in enumerate(self.patterns):
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append([])
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state].append(pid)
+
+        # 幅優先で失敗遷移を求め、浅い状態から順に遷移表を展開する
+        fail = [0] * len(goto)
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+        delta = [{} for _ in goto]
+        for state in order:
+            table = dict(delta[fail[state]]) if fail[state] else {}
+            table.update(goto[state])
+            delta[state] = table
+        self._root = goto[0]
+        self._delta = delta
+        self._out = [tuple(o) for o in out]
+
+    def find(self, text):
+        """text に現れる語の ID の集合"""
+        found = set()
+        root, delta, out, lengths, bounded = self._root, self._delta, self._out, self._lengths, self._bounded
+        state = 0
+        for i, ch in enumerate(text):
+            state = delta[state].get(ch) or root.get(ch, 0)
+            if out[state]:
+                for pid in out[state]:
+                    if pid in found:
+                        continue
+                    start_bounded, end_bounded = bounded[pid]
+                    start = i - lengths[pid] + 1
+                    if start_bounded and start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if end_bounded and i + 1 < len(text) and _is_word_char(text[i + 1]):
+                        continue
+                    found.add(pid)
+        return found
+
+class KeywordRules:
+    """有効なキーワードルールをまとめて判定する。
+
+    condition が AND なら terms のすべて、それ以外（OR）ならいずれかを含み、
+    excludes をどれも含まない記事に bonus を加える。
+    """
+
+    def __init__(self, keywords):
+        pattern_ids = {}
+        self.rules = []  # (id, condition_all, term_ids, exclude_ids, bonus)
+        for k in keywords:
+            terms = [t for t in (normalize(t) for t in (k.terms or [])) if t]
+            if not terms or not k.bonus:
+                continue
+            term_ids = frozenset(pattern_ids.setdefault(t, len(pattern_ids)) for t in terms)
+            exclude_ids = frozenset(
+                pattern_ids.setdefault(t, len(pattern_ids)) for t in (normalize(e) for e in (k.excludes or [])) if t
+            )
+            condition_all = (k.condition or "OR").strip().upper() in ("AND", "ALL")
+            self.rules.append((k.id, condition_all, term_ids, exclude_ids, float(k.bonus)))
+        self.matcher = Matcher(sorted(pattern_ids, key=pattern_ids.get))
+        # 語 -> その語を条件に持つルール（一致した語のルールだけを評価する）
+        self._rules_by_term = {}
+        for rule in self.rules:
+            for pid in rule[2]:
+                self._rules_by_term.setdefault(pid, []).append(rule)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def match(self, text, normalized=False):
+        """(ボーナス合計, 一致したルール ID のリスト)。normalized=True なら text は正規化済み"""
+        if not self.rules:
+            return 0.0, []
+        found = self.matcher.find(text if normalized else normalize(text))
+        bonus = 0.0
+        matched = []
+        seen = set()
+        for pid in found:
+            for rule_id, condition_all, term_ids, exclude_ids, rule_bonus in self._rules_by_term.get(pid, ()):
+                if rule_id in seen:
+                    continue
+                seen.add(rule_id)
+                if condition_all and not term_ids <= found:
+                    continue
+                if exclude_ids & found:
+                    continue
+                bonus += rule_bonus
+                matched.append(rule_id)
+        return bonus, matched
+
+def load_rules(db):
+    return KeywordRules(db.query(Keyword).filter(Keyword.enabled == True).all())
+
+def rule_text(title, summary, summary_ja, tags, company_tags):
+    """ルールを当てる範囲。字幕・本文全体は見ない（再採点を軽く保つため）"""
+    return "\n".join([title or "", summary or "", summary_ja or "", " ".join(tags or []), " ".join(company_tags or [])])
+
+def total_score(details, source_bonus, keyword_bonus):
+    """分析の点数にソースとルールのボーナスを足す（負のボーナスで 0 未満にもなる）"""
+    return float(score_article(details or {})) + float(source_bonus or 0) + keyword_bonus
+
+def rule_terms(keyword):
+    """ルールの語（正規化済み）。このルールの変更で点数が変わりうるのは、これらの語を含む記事だけ"""
+    return {t for t in (normalize(t) for t in (keyword.terms or [])) if t}
+
+_SCORE_UPDATE = update(Article.__table__).where(Article.__table__.c.id == bindparam("row_id")).values(score=bindparam("new_score"))
+
+def rescore_articles(db, rules=None, source_ids=None, terms=None):
+    """記事のスコアを今のルールとソースのボーナスで計算し直し、変わった記事だけを更新する。
+
+    source_ids と terms をどちらも渡さなければ全記事。渡した場合は、そのソースの記事と、
+    terms（変更されたルールの変更前後の語）のいずれかを含む記事だけを計算し直す
+    （除外語だけを含む記事にはルールが当たらないので、除外語は見なくてよい）。
+    戻り値: 更新した記事数
+    """
+    rules = rules or load_rules(db)
+    source_bonus = dict(db.query(CustomSource.id, CustomSource.priority_bonus).all())
+    stmt = select(
+        Article.id, Article.score, Article.score_details, Article.source_id,
+        Article.title, Article.summary, Article.summary_ja, Article.tags, Article.company_tags,
+    )
+    source_ids = set(source_ids or ())
+    terms = list(terms or ())
+    full = not source_ids and not terms
+    if source_ids and not terms:
+        stmt = stmt.where(Article.source_id.in_(source_ids))
+    changes = []
+    for row in db.execute(stmt.execution_options(yield_per=RESCORE_BATCH_SIZE)):
+        text = normalize(rule_text(row.title, row.summary, row.summary_ja, row.tags, row.company_tags))
+        # 部分文字列の検査（C の速さ）で候補を絞り、候補だけをオートマトンにかける
+        if not full and row.source_id not in source_ids and not any(t in text for t in terms):
+            continue
+        bonus, _ = rules.match(text, normalized=True)
+        score = total_score(row.score_details, source_bonus.get(row.source_id), bonus)
+        if row.score is None or abs(score - row.score) > 1e-9:
+            changes.append({"row_id": row.id, "new_score": score})
+    # id と score だけの executemany でまとめて書く
+    for i in range(0, len(changes), RESCORE_BATCH_SIZE):
+        db.execute(_SCORE_UPDATE, changes[i:i + RESCORE_BATCH_SIZE])
+    db.commit()
+    return len(changes)
+
+_rescore_lock = threading.Lock()
+_rescore_thread = None
+# 次の再採点の範囲。None は予定なし、"full" は全記事、それ以外は {"source_ids": set, "terms": set}
+_rescore_pending = None
+
+def _merge_scope(pending, source_ids, terms):
+    if pending == "full" or (not source_ids and not terms):
+        return "full"
+    pending = pending or {"source_ids": set(), "terms": set()}
+    pending["source_ids"].update(source_ids or ())
+    pending["terms"].update(terms or ())
+    return pending
+
+def schedule_rescore(session_factory, after=None, source_ids=None, terms=None):
+    """再採点をバックグラウンドで行う。実行中に再度呼ばれたら、範囲をまとめて終わった後にもう1回だけ行う。
+
+    source_ids（ボーナスを変えたソース）と terms（変更したルールの変更前後の語）で範囲を絞る。
+    どちらもなければ全記事。after(db, 更新件数) は再採点の後に呼ばれる（フィードの再描画など）。
+    """
+    global _rescore_thread, _rescore_pending
+    with _rescore_lock:
+        _rescore_pending = _merge_scope(_rescore_pending, source_ids, terms)
+        if _rescore_thread is not None:
+            return
+
+        def run():
+            global _rescore_thread, _rescore_pending
+            while True:
+                with _rescore_lock:
+                    scope = _rescore_pending
+                    if scope is None:
+                        _rescore_thread = None
+                        return
+                    _rescore_pending = None
+                db = session_factory()
+                try:
+                    if scope == "full":
+                        changed = rescore_articles(db)
+                    else:
+                        changed = rescore_articles(db, source_ids=scope["source_ids"], terms=scope["terms"])
+                    print(f"[SCORE] 再採点: {changed}件のスコアを更新")
+                    if after:
+                        after(db, changed)
+                except Exception as e:
+                    print(f"[SCORE] 再採点に失敗: {e}")
+                    db.rollback()
+                finally:
+                    db.close()
+
+        _rescore_thread = threading.Thread(target=run, daemon=True, name="rescore")
+        _rescore_thread.start()
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from dotenv import load_dotenv
+    load_dotenv()
+    from database import SessionLocal
+    if sys.argv[1:] == ["rescore"]:
+        db = SessionLocal()
+        try:
+            start = time.monotonic()
+            rules = load_rules(db)
+            changed = rescore_articles(db, rules)
+            print(f"[SCORE] ルール{len(rules)}件で再採点: {changed}件を更新（{time.monotonic() - start:.2f}秒）")
+            if changed:
+                from feed import render_feeds
+                render_feeds(db)
+        finally:
+            db.close()
+    else:
+        print("usage: python scoring.py rescore")
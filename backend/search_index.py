@@ -0,0 +1,132 @@
+import sys
+from contextlib import contextmanager
+from sqlalchemy import text, or_, and_, Integer, Float
+from models import Article
+
+# trigram トークナイザは語の区切りに依存しないため日本語にもそのまま効く（3文字以上の語）
+FTS_TABLE = "articles_fts"
+FTS_COLUMNS = ("title", "summary_ja", "full_text", "transcript")
+# bm25 の列重み（タイトル・要約を本文/字幕より重く見る）
+BM25_WEIGHTS = (10.0, 5.0, 1.0, 1.0)
+MIN_TERM_CHARS = 3
+
+_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {', '.join(FTS_COLUMNS)},
+        content='articles', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_ai AFTER INSERT ON articles BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_ad AFTER DELETE ON articles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS articles_fts_au AFTER UPDATE OF {', '.join(FTS_COLUMNS)} ON articles BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {', '.join(FTS_COLUMNS)})
+        VALUES ('delete', old.id, {', '.join('old.' + c for c in FTS_COLUMNS)});
+        INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})
+        VALUES (new.id, {', '.join('new.' + c for c in FTS_COLUMNS)});
+    END""",
+]
+
+def ensure_fts(engine):
+    """FTS テーブルと同期トリガを作成する。新規作成時は既存記事から索引を構築する"""
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:name"), {"name": FTS_TABLE}
+        ).first()
+        for ddl in _DDL:
+            conn.execute(text(ddl))
+        if not exists:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"))
+
+def rebuild(engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('rebuild')"))
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')"))
+
+@contextmanager
+def bulk_load(engine):
+    """大量投入の間は挿入トリガを外し、最後に索引をまとめて作り直す（行毎に索引するより速い）。
+
+    途中で失敗しても、トリガと索引は必ず元に戻す。
+    """
+    with engine.begin() as conn:
+        conn.execute(text("DROP TRIGGER IF EXISTS articles_fts_ai"))
+    try:
+        yield
+    finally:
+        ensure_fts(engine)
+        rebuild(engine)
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+def _match_expression(terms, operator):
+    long_terms = [t for t in terms if len(t) >= MIN_TERM_CHARS]
+    return f" {operator} ".join(_quote(t) for t in long_terms) or None
+
+def _clean(terms):
+    return [t.strip() for t in terms if t and t.strip()]
+
+def apply_search(q, terms, operator="OR"):
+    """Article のクエリ q を FTS で絞り込み、(q, rank 列) を返す。
+
+    3文字未満の語は trigram で引けないため、タイトル・要約の LIKE にフォールバックする。
+    rank は bm25（小さいほど関連度が高い）。LIKE のみで一致した行は rank が NULL になる。
+    スニペットはここでは作らない（一致した全行の分を作ることになる）。ページを決めてから snippets() で作る。
+    """
+    terms = _clean(terms)
+    match = _match_expression(terms, operator)
+    short_terms = [t for t in terms if len(t) < MIN_TERM_CHARS]
+
+    fts = None
+    conditions = []
+    if match:
+        fts = text(
+            f"SELECT rowid, bm25({FTS_TABLE}, {', '.join(str(w) for w in BM25_WEIGHTS)}) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_match"
+        ).columns(rowid=Integer, rank=Float).bindparams(fts_match=match).subquery("fts")
+        q = q.outerjoin(fts, fts.c.rowid == Article.id)
+        conditions.append(fts.c.rowid != None)
+    for t in short_terms:
+        conditions.append(or_(Article.title.icontains(t), Article.summary_ja.icontains(t)))
+
+    if conditions:
+        q = q.filter(or_(*conditions) if operator == "OR" else and_(*conditions))
+    if fts is None:
+        return q, None
+    return q, fts.c.rank
+
+def ranked_ids(q, rank, tiebreak, limit, offset=0):
+    """関連度順のページの記事 ID だけを選ぶ。
+
+    記事の全列を選ぶと、一致した全行の本文・字幕を抱えたまま並べ替えることになるため、
+    並べ替えと LIMIT は ID と rank だけで行い、記事はページの分だけ後から読む。
+    """
+    q = q.with_entities(Article.id).order_by(rank.is_(None), rank, tiebreak, Article.id)
+    return [row[0] for row in q.offset(offset).limit(limit).all()]
+
+def snippets(db, ids, terms, operator="OR"):
+    """ページに載る記事の分だけ snippet() を作る。戻り値: id -> スニペット"""
+    match = _match_expression(_clean(terms), operator)
+    if not match or not ids:
+        return {}
+    rows = db.execute(
+        text(
+            f"SELECT rowid, snippet({FTS_TABLE}, -1, '【', '】', '…', 16) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :fts_match AND rowid IN ({', '.join(str(int(i)) for i in ids)})"
+        ),
+        {"fts_match": match},
+    )
+    return dict(rows.all())
+
+if __name__ == "__main__":
+    from database import engine
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        rebuild(engine)
+        print("FTS index rebuilt.")
+    else:
+        print("usage: python search_index.py rebuild")
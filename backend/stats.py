@@ -0,0 +1,83 @@
+import sys
+import datetime
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert
+from models import Article, CustomSource, StatCounter
+
+# /api/stats の日別内訳で返す日数
+STATS_DAYS = 30
+# AI 検索の再ランキング結果の世代（記事が増える毎に進める。集計ではないので reconcile では消さない）
+SEARCH_CACHE_VERSION = ("version", "search_cache")
+
+def bump(db, dimension, key, delta=1):
+    """カウンタを原子的に増減する（呼び出し元のトランザクション内で確定する）"""
+    stmt = insert(StatCounter).values(dimension=dimension, key=key or "", count=delta)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[StatCounter.dimension, StatCounter.key],
+        set_={"count": StatCounter.count + stmt.excluded.count}
+    ))
+
+def record_article(db, article, delta=1):
+    bump(db, "total", "", delta)
+    if article.published_at:
+        bump(db, "day", article.published_at.strftime("%Y-%m-%d"), delta)
+    bump(db, "category", article.category or "未分類", delta)
+    bump(db, "source", article.source_name or "", delta)
+
+def record_source(db, delta=1):
+    bump(db, "sources", "", delta)
+
+def reconcile(db):
+    """記事・ソースのテーブルから全カウンタを作り直す"""
+    db.query(StatCounter).filter(StatCounter.dimension != SEARCH_CACHE_VERSION[0]).delete()
+    rows = [("total", "", db.query(func.count(Article.id)).scalar())]
+    rows.append(("sources", "", db.query(func.count(CustomSource.id)).scalar()))
+    day_col = func.date(Article.published_at)
+    rows += [("day", d, n) for d, n in db.query(day_col, func.count()).filter(Article.published_at != None).group_by(day_col)]
+    rows += [("category", c or "未分類", n) for c, n in db.query(Article.category, func.count()).group_by(Article.category)]
+    rows += [("source", s or "", n) for s, n in db.query(Article.source_name, func.count()).group_by(Article.source_name)]
+    for dimension, key, count in rows:
+        bump(db, dimension, key, count)
+    db.commit()
+    return len(rows)
+
+def ensure_initialized(db):
+    if not db.query(StatCounter).filter(StatCounter.dimension == "total").first():
+        reconcile(db)
+
+def read_stats(db):
+    rows = db.query(StatCounter.dimension, StatCounter.key, StatCounter.count).filter(
+        StatCounter.dimension.in_(["total", "sources", "category", "source"])
+    ).all()
+    by = {"category": {}, "source": {}}
+    totals = {}
+    for dimension, key, count in rows:
+        if dimension in by:
+            if count:
+                by[dimension][key] = count
+        else:
+            totals[dimension] = count
+    
+    today = datetime.date.today()
+    first_day = (today - datetime.timedelta(days=STATS_DAYS - 1)).isoformat()
+    by_day = dict(db.query(StatCounter.key, StatCounter.count).filter(
+        StatCounter.dimension == "day", StatCounter.key >= first_day
+    ).order_by(StatCounter.key).all())
+    return {
+        "articles": totals.get("total", 0),
+        "sources": totals.get("sources", 0),
+        "today_articles": by_day.get(today.isoformat(), 0),
+        "by_day": by_day,
+        "by_category": by["category"],
+        "by_source": by["source"],
+    }
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    if len(sys.argv) > 1 and sys.argv[1] == "reconcile":
+        db = SessionLocal()
+        n = reconcile(db)
+        db.close()
+        print(f"Stats reconciled: {n} counters.")
+    else:
+        print("usage: python stats.py reconcile")
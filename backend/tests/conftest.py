@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+
+# database.py・feed.py は読み込み時にパスを決めるので、import より前に一時ディレクトリへ向ける
+_tmp = tempfile.mkdtemp(prefix="ai-knowledge-hub-test-")
+os.environ["DATABASE_PATH"] = os.path.join(_tmp, "test.db")
+os.environ["FEED_DIR"] = os.path.join(_tmp, "feeds")
+os.environ["EMBEDDING_DIR"] = os.path.join(_tmp, "embeddings")
+os.environ["EMBEDDER"] = "hashing"
+os.environ["EMBEDDED_WORKER"] = "0"
+os.environ["GEMINI_API_KEY"] = ""
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture(scope="session")
+def _initialized_db():
+    from database import init_db
+    init_db()
+
+@pytest.fixture
+def db(_initialized_db):
+    """テスト毎に記事とソースを空にしたセッション"""
+    from database import SessionLocal
+    from models import Article, CustomSource
+    session = SessionLocal()
+    session.query(Article).delete()
+    session.query(CustomSource).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
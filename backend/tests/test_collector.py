@@ -0,0 +1,34 @@
+from collector import split_chunks, is_long_text, LONG_TEXT_CHARS
+
+def test_short_text_is_one_chunk():
+    assert split_chunks("短い本文。", size=100) == ["短い本文。"]
+    assert split_chunks("", size=100) == []
+
+def test_chunks_rejoin_to_the_original_text():
+    text = "".join(f"これは{i}番目の文です。" for i in range(500))
+    chunks = split_chunks(text, size=300)
+    assert "".join(chunks) == text
+    assert all(len(c) <= 300 for c in chunks)
+    assert all(len(c) >= 150 for c in chunks[:-1])
+
+def test_chunks_end_at_sentence_boundaries():
+    text = " ".join(f"Sentence number {i} talks about models." for i in range(300))
+    chunks = split_chunks(text, size=500)
+    assert all(c.endswith(". ") for c in chunks[:-1])
+
+def test_newline_is_preferred_over_other_separators():
+    text = ("a" * 60 + ". " + "b" * 30 + "\n" + "c" * 5) * 20
+    assert all(c.endswith("\n") for c in split_chunks(text, size=150)[:-1])
+
+def test_text_without_separators_is_cut_at_size():
+    text = "x" * 1000
+    assert split_chunks(text, size=300) == ["x" * 300, "x" * 300, "x" * 300, "x" * 100]
+
+def test_split_is_deterministic():
+    text = "".join(f"段落{i}。\n" * 3 for i in range(400))
+    assert split_chunks(text, size=256) == split_chunks(text, size=256)
+
+def test_is_long_text():
+    assert not is_long_text(None)
+    assert not is_long_text("a" * LONG_TEXT_CHARS)
+    assert is_long_text("a" * (LONG_TEXT_CHARS + 1))
@@ -0,0 +1,68 @@
+import pytest
+from dedup import canonicalize_url, minhash, similarity, signature_to_db, signature_from_db, MinHashIndex
+
+@pytest.mark.parametrize("url, expected", [
+    ("http://www.example.com/post/?utm_source=x&b=2&a=1&fbclid=y", "https://example.com/post?a=1&b=2"),
+    ("https://m.example.com/", "https://example.com/"),
+    ("https://youtu.be/abc123?t=10", "https://youtube.com/watch?v=abc123"),
+    ("https://www.youtube.com/shorts/abc123", "https://youtube.com/watch?v=abc123"),
+    ("https://www.youtube.com/watch?v=abc123&list=PL1&si=x", "https://youtube.com/watch?v=abc123"),
+    ("https://arxiv.org/pdf/2401.01234v2.pdf", "https://arxiv.org/abs/2401.01234"),
+    ("http://export.arxiv.org/abs/2401.01234v1", "https://arxiv.org/abs/2401.01234"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+def test_canonicalize_url_is_idempotent():
+    url = canonicalize_url("http://www.example.com/a/b/?ref=home&x=1")
+    assert canonicalize_url(url) == url
+
+TEXT = "OpenAI releases a new reasoning model with better math and coding benchmarks for developers"
+
+def test_minhash_is_deterministic_and_close_for_near_duplicates():
+    sig = minhash(TEXT)
+    assert sig == minhash(TEXT)
+    assert similarity(sig, minhash(TEXT + " today")) >= 0.7
+    assert similarity(sig, minhash("Stability AI ships an image generation model for mobile phones and laptops")) < 0.3
+
+def test_minhash_handles_japanese():
+    a = minhash("オープンエーアイが新しい推論モデルを公開し数学とコーディングの性能が向上")
+    b = minhash("オープンエーアイが新しい推論モデルを公開、数学とコーディングの性能が向上した")
+    assert similarity(a, b) >= 0.7
+
+def test_minhash_skips_short_text():
+    assert minhash("GPT-5 released") is None
+
+def test_signature_round_trips_through_db_bytes():
+    sig = minhash(TEXT)
+    assert signature_from_db(signature_to_db(sig)) == sig
+    assert signature_to_db(None) is None and signature_from_db(None) is None
+
+def test_index_returns_best_match_above_threshold():
+    index = MinHashIndex(min_similarity=0.7)
+    index.add(minhash(TEXT), "same")
+    index.add(minhash("Stability AI ships an image generation model for mobile phones and laptops"), "other")
+    ref, score = index.query(minhash(TEXT + " today"))
+    assert ref == "same" and score >= 0.7
+    assert index.query(minhash("Google announces quantum computing chip with error correction milestones")) == (None, None)
+
+def pending(url, text=TEXT):
+    return {"item": {"url": url, "title": text, "summary": ""}}
+
+def test_duplicates_of_a_failed_pending_item_are_not_dropped(db):
+    from dedup import DuplicateDetector
+    detector = DuplicateDetector(db)
+    p = pending("https://example.com/a")
+    detector.check(db, p["item"])
+    detector.register_pending(p)
+
+    dup = pending("https://www.example.com/a/?utm_source=x")
+    ref, reason, _ = detector.check(db, dup["item"])
+    assert ref is p and reason == "url"
+    assert detector.link(db, ref, dup["item"]["url"], reason, 1.0, source_id=7)
+
+    # 分析に失敗したら、紐付けた重複のソースを返し、以後は重複の相手にしない
+    assert detector.on_failed(p) == {7}
+    assert detector.link(db, p, "https://example.com/late", "url", 1.0, source_id=8) is False
+    assert detector.check(db, pending("https://example.com/a")["item"]) == (None, None, None)
+    assert detector.check(db, pending("https://example.com/b", TEXT + " today")["item"]) == (None, None, None)
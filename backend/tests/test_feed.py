@@ -0,0 +1,61 @@
+import datetime
+from email.utils import format_datetime
+from fastapi.testclient import TestClient
+from models import Article
+from feed import render_feeds, rendered_feeds, not_modified, variant_name
+
+ETAG = '"abc"'
+LAST_MODIFIED = "Wed, 01 Jan 2026 00:00:00 GMT"
+
+def test_not_modified_by_etag():
+    assert not_modified(ETAG, LAST_MODIFIED, '"abc"')
+    assert not_modified(ETAG, LAST_MODIFIED, 'W/"abc"')
+    assert not_modified(ETAG, LAST_MODIFIED, '"x", "abc"')
+    assert not_modified(ETAG, LAST_MODIFIED, "*")
+    assert not not_modified(ETAG, LAST_MODIFIED, '"other"')
+
+def test_if_none_match_takes_precedence_over_if_modified_since():
+    assert not not_modified(ETAG, LAST_MODIFIED, '"other"', LAST_MODIFIED)
+
+def test_not_modified_by_date():
+    assert not_modified(ETAG, LAST_MODIFIED, None, LAST_MODIFIED)
+    assert not_modified(ETAG, LAST_MODIFIED, None, "Thu, 02 Jan 2026 00:00:00 GMT")
+    assert not not_modified(ETAG, LAST_MODIFIED, None, "Tue, 31 Dec 2025 00:00:00 GMT")
+    assert not not_modified(ETAG, LAST_MODIFIED, None, "yesterday")
+    assert not not_modified(ETAG, LAST_MODIFIED)
+
+def add_article(db, i, score=80.0, category="LLM"):
+    db.add(Article(title=f"記事{i}", url=f"https://example.com/{i}", summary_ja="要約", score=score, category=category,
+                   priority_label="HIGH", published_at=datetime.datetime(2026, 1, 1) + datetime.timedelta(hours=i)))
+    db.commit()
+
+def test_render_keeps_etag_until_content_changes(db):
+    add_article(db, 1)
+    render_feeds(db)
+    _, etag, last_modified = rendered_feeds.get(variant_name())
+    assert render_feeds(db) == 0
+    assert rendered_feeds.get(variant_name())[1:] == (etag, last_modified)
+
+    add_article(db, 2)
+    assert render_feeds(db) > 0
+    body, new_etag, _ = rendered_feeds.get(variant_name())
+    assert new_etag != etag
+    assert "記事2".encode("utf-8") in body
+
+def test_public_feed_answers_conditional_requests_with_304(db):
+    add_article(db, 1)
+    render_feeds(db)
+    import main
+    client = TestClient(main.app)
+    first = client.get("/feed/public")
+    assert first.status_code == 200
+    assert first.headers["content-type"].startswith("application/xml")
+    etag = first.headers["etag"]
+
+    again = client.get("/feed/public", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["etag"] == etag and not again.content
+    later = format_datetime(datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1), usegmt=True)
+    assert client.get("/feed/public", headers={"If-Modified-Since": later}).status_code == 304
+    assert client.get("/feed/public", headers={"If-None-Match": '"stale"'}).status_code == 200
+    assert client.get("/feed/public", params={"category": "LLM"}).status_code == 200
+    assert client.get("/feed/public", params={"category": "unknown"}).status_code == 404
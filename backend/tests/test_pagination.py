@@ -0,0 +1,41 @@
+import datetime
+import pytest
+from models import Article
+from pagination import keyset_page, encode_cursor, decode_cursor, InvalidCursor
+
+def seed(db, n=23):
+    base = datetime.datetime(2026, 1, 1)
+    for i in range(n):
+        db.add(Article(title=f"t{i}", url=f"https://example.com/{i}",
+                       score=float(i % 4), published_at=base + datetime.timedelta(hours=i // 3)))
+    db.commit()
+
+def walk(db, sort_col, limit):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(db.query(Article), sort_col, Article.id, cursor, limit)
+        ids.extend(r.id for r in rows)
+        if cursor is None:
+            return ids
+
+@pytest.mark.parametrize("sort_col", [Article.score, Article.published_at])
+@pytest.mark.parametrize("limit", [1, 5, 23, 50])
+def test_pages_cover_every_row_once_in_order(db, sort_col, limit):
+    seed(db)
+    expected = [a.id for a in db.query(Article).order_by(sort_col.desc(), Article.id.desc())]
+    assert walk(db, sort_col, limit) == expected
+
+def test_last_page_has_no_cursor(db):
+    seed(db, 5)
+    rows, cursor = keyset_page(db.query(Article), Article.score, Article.id, None, 5)
+    assert len(rows) == 5 and cursor is None
+
+def test_cursor_round_trips_floats_and_datetimes():
+    dt = datetime.datetime(2026, 3, 4, 5, 6, 7, 890)
+    assert decode_cursor(encode_cursor(dt, 42)) == (dt, 42)
+    assert decode_cursor(encode_cursor(12.5, 7)) == (12.5, 7)
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", encode_cursor(1.0, 1)[:-3]])
+def test_invalid_cursor_raises(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
@@ -0,0 +1,70 @@
+import time
+import threading
+from rate_limiter import TokenBucketLimiter, INTERACTIVE, BACKGROUND
+
+def drain(limiter):
+    for _ in range(int(limiter.rpm)):
+        limiter.acquire()
+
+def test_acquire_is_immediate_while_the_bucket_has_room():
+    limiter = TokenBucketLimiter(rpm=60, tpm=1000, jitter=0)
+    assert limiter.acquire(tokens=10) < 0.05
+
+def test_token_budget_limits_large_requests():
+    limiter = TokenBucketLimiter(rpm=6000, tpm=6000, jitter=0)
+    limiter.acquire(tokens=6000)
+    # 100 トークン/秒で戻るので、50 トークンには約0.5秒かかる
+    waited = limiter.acquire(tokens=50)
+    assert 0.3 < waited < 1.5
+
+def test_rate_limited_halves_rate_and_success_recovers_additively():
+    limiter = TokenBucketLimiter(rpm=6000, tpm=1e9, min_scale=0.1, jitter=0)
+    limiter.report_rate_limited()
+    assert limiter.rate_scale == 0.5
+    limiter.report_rate_limited()
+    assert limiter.rate_scale == 0.25
+    for _ in range(3):
+        limiter.report_success()
+    assert abs(limiter.rate_scale - 0.40) < 1e-9
+    for _ in range(100):
+        limiter.report_success()
+    assert limiter.rate_scale == 1.0
+
+def test_rate_scale_does_not_drop_below_min_scale():
+    limiter = TokenBucketLimiter(rpm=6000, tpm=1e9, min_scale=0.1, jitter=0)
+    for _ in range(10):
+        limiter.report_rate_limited()
+    assert limiter.rate_scale == 0.1
+
+def test_rate_limited_blocks_acquire_for_a_cooldown():
+    limiter = TokenBucketLimiter(rpm=600, tpm=1e9, jitter=0)
+    limiter.report_rate_limited()
+    # 1回目の停止は 60/rpm * 2 = 0.2 秒
+    waited = limiter.acquire()
+    assert 0.15 < waited < 1.0
+
+def test_interactive_waiter_is_served_before_background():
+    limiter = TokenBucketLimiter(rpm=300, tpm=1e9, jitter=0)
+    drain(limiter)
+    order = []
+
+    def take(priority, name):
+        limiter.acquire(priority=priority)
+        order.append(name)
+
+    background = threading.Thread(target=take, args=(BACKGROUND, "background"))
+    background.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=take, args=(INTERACTIVE, "interactive"))
+    interactive.start()
+    interactive.join(5)
+    background.join(5)
+    assert order == ["interactive", "background"]
+
+def test_set_rates_caps_the_current_bucket():
+    limiter = TokenBucketLimiter(rpm=6000, tpm=1e9, jitter=0)
+    limiter.set_rates(600, 1e9)
+    assert limiter.rpm == 600.0
+    # 満杯だった 6000 回分の枠も 600 回分に切り詰められるので、600 回で空になる
+    drain(limiter)
+    assert limiter.acquire() > 0.05
@@ -0,0 +1,58 @@
+import types
+from scoring import Matcher, KeywordRules, score_article, total_score
+
+def keyword(id, terms, bonus=10, condition="OR", excludes=()):
+    return types.SimpleNamespace(id=id, terms=list(terms), bonus=bonus, condition=condition, excludes=list(excludes), enabled=True)
+
+def names(matcher, text):
+    return {matcher.patterns[i] for i in matcher.find(text)}
+
+def test_matcher_finds_overlapping_patterns():
+    m = Matcher(["大規模言語", "言語モデル", "モデル", "言語処理"])
+    assert names(m, "大規模言語モデル") == {"大規模言語", "言語モデル", "モデル"}
+
+def test_matcher_respects_word_boundaries_for_ascii():
+    m = Matcher(["ai", "openai", "生成ai"])
+    assert names(m, "openai said") == {"openai"}
+    assert names(m, "ai, 生成aiとai.") == {"ai", "生成ai"}
+    assert names(m, "said") == set()
+
+def test_matcher_matches_japanese_inside_text():
+    m = Matcher(["エージェント"])
+    assert names(m, "自律型エージェントの研究") == {"エージェント"}
+
+def test_matcher_without_patterns():
+    assert Matcher([]).find("anything") == set()
+
+def test_rules_or_and_and_excludes():
+    rules = KeywordRules([
+        keyword(1, ["gpt"], bonus=10),
+        keyword(2, ["agent", "tool"], bonus=5, condition="AND"),
+        keyword(3, ["llama"], bonus=-20, excludes=["meta"]),
+    ])
+    assert rules.match("GPT agents") == (10.0, [1])
+    assert sorted(rules.match("gpt agent with a tool")[1]) == [1, 2]
+    assert rules.match("llama release") == (-20.0, [3])
+    assert rules.match("meta llama release") == (0.0, [])
+
+def test_rules_normalize_text_and_terms():
+    rules = KeywordRules([keyword(1, ["ＧＰＴ－４"])])
+    assert rules.match("<b>gpt-4</b> is out") == (10.0, [1])
+
+def test_rules_skip_empty_terms_and_zero_bonus():
+    rules = KeywordRules([keyword(1, ["  "]), keyword(2, ["gpt"], bonus=0)])
+    assert len(rules) == 0
+    assert rules.match("gpt") == (0.0, [])
+
+def test_score_article_uses_defaults_for_missing_fields():
+    assert score_article({}) == 35
+    assert score_article({"relevance": 40, "reliability": 30, "freshness": 20, "virality": 10}) == 100
+
+def test_score_article_ignores_malformed_details():
+    assert score_article("high") == 0
+    assert score_article({"relevance": "high"}) == 0
+
+def test_total_score_adds_bonuses_without_clamping():
+    assert total_score({"relevance": 40}, 5, 10.0) == 80.0
+    assert total_score(None, None, 0.0) == 35.0
+    assert total_score({}, -20, -30.0) == -15.0
@@ -0,0 +1,166 @@
+import os
+import re
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from urllib.parse import urlsplit, parse_qs
+from sqlalchemy import or_, and_
+from sqlalchemy.dialects.sqlite import insert
+from youtube_transcript_api import (
+    YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound, NoTranscriptAvailable, VideoUnavailable
+)
+from models import TranscriptCache
+
+TRANSCRIPT_WORKERS = int(os.environ.get("TRANSCRIPT_WORKERS", "4"))
+TRANSCRIPT_LANGUAGES = ["en", "ja"]
+# 取得できた字幕の保持期間と、字幕が無かった動画を再確認するまでの時間（自動字幕は後から付くことがある）
+TRANSCRIPT_CACHE_TTL_DAYS = int(os.environ.get("TRANSCRIPT_CACHE_TTL_DAYS", "30"))
+TRANSCRIPT_NEGATIVE_TTL_HOURS = int(os.environ.get("TRANSCRIPT_NEGATIVE_TTL_HOURS", "12"))
+
+OK = "ok"
+NONE = "none"
+
+# 再試行しても結果が変わらない失敗。通信エラーや 429 はキャッシュせず次回また取得する
+_PERMANENT_ERRORS = (TranscriptsDisabled, NoTranscriptFound, NoTranscriptAvailable, VideoUnavailable)
+_VIDEO_ID_RE = re.compile(r"^[A-Za-z0-9_-]{11}$")
+_PATH_PREFIXES = ("shorts", "embed", "live", "v", "e")
+
+def video_id(url):
+    """YouTube の動画 URL から動画 ID を取り出す。動画 URL でなければ None
+
+    watch?v= / youtu.be/ / shorts/ / embed/ / live/ 形式と、ID そのものを受け付ける。
+    """
+    url = (url or "").strip()
+    if _VIDEO_ID_RE.match(url):
+        return url
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return None
+    host = (parts.hostname or "").lower()
+    segments = [s for s in parts.path.split("/") if s]
+    candidate = None
+    if host == "youtu.be" or host.endswith(".youtu.be"):
+        candidate = segments[0] if segments else None
+    elif host == "youtube.com" or host.endswith(".youtube.com") or host == "youtube-nocookie.com" or host.endswith(".youtube-nocookie.com"):
+        if segments[:1] == ["watch"]:
+            candidate = (parse_qs(parts.query).get("v") or [None])[0]
+        elif len(segments) >= 2 and segments[0] in _PATH_PREFIXES:
+            candidate = segments[1]
+    if candidate and _VIDEO_ID_RE.match(candidate):
+        return candidate
+    return None
+
+def fetch_transcript(vid):
+    """字幕を取得する。戻り値: (本文, status)。一時的な失敗なら status は None（キャッシュしない）"""
+    try:
+        transcript = YouTubeTranscriptApi.get_transcript(vid, languages=TRANSCRIPT_LANGUAGES)
+        return " ".join(t["text"] for t in transcript), OK
+    except _PERMANENT_ERRORS as e:
+        print(f"[TRANSCRIPT] 字幕なし {vid}: {type(e).__name__}")
+        return "", NONE
+    except Exception as e:
+        print(f"[TRANSCRIPT] 取得に失敗 {vid}: {str(e)[:200]}")
+        return "", None
+
+def get_cached(db, video_ids):
+    """有効期限内のキャッシュを {video_id: 本文} で返す。字幕が無いと分かっている動画は空文字"""
+    video_ids = list(set(video_ids))
+    if not video_ids:
+        return {}
+    now = datetime.datetime.now()
+    rows = db.query(TranscriptCache.video_id, TranscriptCache.status, TranscriptCache.transcript).filter(
+        TranscriptCache.video_id.in_(video_ids),
+        or_(
+            and_(TranscriptCache.status == OK,
+                 TranscriptCache.fetched_at >= now - datetime.timedelta(days=TRANSCRIPT_CACHE_TTL_DAYS)),
+            and_(TranscriptCache.status == NONE,
+                 TranscriptCache.fetched_at >= now - datetime.timedelta(hours=TRANSCRIPT_NEGATIVE_TTL_HOURS)),
+        )
+    ).all()
+    return {vid: (text or "") if status == OK else "" for vid, status, text in rows}
+
+def store(db, vid, transcript, status, fetched_at=None):
+    fetched_at = fetched_at or datetime.datetime.now()
+    stmt = insert(TranscriptCache).values(video_id=vid, status=status, transcript=transcript or None, fetched_at=fetched_at)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[TranscriptCache.video_id],
+        set_={"status": stmt.excluded.status, "transcript": stmt.excluded.transcript, "fetched_at": fetched_at}
+    ))
+
+def evict(db):
+    """期限切れのエントリを削除する"""
+    now = datetime.datetime.now()
+    removed = db.query(TranscriptCache).filter(or_(
+        TranscriptCache.fetched_at < now - datetime.timedelta(days=TRANSCRIPT_CACHE_TTL_DAYS),
+        and_(TranscriptCache.status == NONE,
+             TranscriptCache.fetched_at < now - datetime.timedelta(hours=TRANSCRIPT_NEGATIVE_TTL_HOURS)),
+    )).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+class TranscriptPrefetcher:
+    """収集1回分の字幕取得。新着と分かった動画の字幕を、分析の順番を待たずに並列で取りに行く。
+
+    prefetch でキャッシュを引き、無いものだけをスレッドプールに投げる。同じ動画は1回だけ取得する。
+    取得結果は pending に溜め、書き込み段が flush で自分のトランザクションに含めて保存する。
+    """
+
+    def __init__(self, workers=TRANSCRIPT_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="transcript")
+        self._lock = threading.Lock()
+        self._results = {}  # video_id -> 本文 または Future
+        self._pending = []
+        self.hits = 0
+        self.fetched = 0
+        self.missing = 0
+        self.errors = 0
+
+    def prefetch(self, db, video_ids):
+        with self._lock:
+            wanted = [vid for vid in dict.fromkeys(video_ids) if vid and vid not in self._results]
+        cached = get_cached(db, wanted)
+        with self._lock:
+            for vid in wanted:
+                if vid in self._results:
+                    continue
+                if vid in cached:
+                    self.hits += 1
+                    self._results[vid] = cached[vid]
+                else:
+                    self._results[vid] = self._pool.submit(self._fetch, vid)
+
+    def _fetch(self, vid):
+        text, status = fetch_transcript(vid)
+        with self._lock:
+            if status is None:
+                self.errors += 1
+            else:
+                self.fetched += 1
+                if status == NONE:
+                    self.missing += 1
+                self._pending.append((vid, text, status, datetime.datetime.now()))
+        return text
+
+    def get(self, vid):
+        """字幕本文（無ければ空文字）。取得中なら終わるまで待つ"""
+        with self._lock:
+            result = self._results.get(vid)
+            if result is None:
+                result = self._results[vid] = self._pool.submit(self._fetch, vid)
+        return result.result() if isinstance(result, Future) else result
+
+    def flush(self, db):
+        """取得済みの結果をセッションに書き込む（コミットは呼び出し側）"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for vid, text, status, fetched_at in pending:
+            store(db, vid, text, status, fetched_at)
+        return len(pending)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+    def summary(self):
+        return (f"[TRANSCRIPT] キャッシュ {self.hits}件、取得 {self.fetched}件"
+                f"（字幕なし {self.missing}件）、一時的な失敗 {self.errors}件")
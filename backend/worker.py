@@ -0,0 +1,142 @@
+"""収集ワーカー。収集ジョブをキューから取り出して実行する（Web プロセスとは別に起動する）。
+
+複数起動してよい。同じソースのジョブはリースで排他され、ワーカーが落ちた場合は
+リースが切れたジョブを他のワーカーが引き継ぐ。
+
+usage: python worker.py            # 常駐してキューを処理する
+       python worker.py --once     # キューが空になるまで処理して終了
+       python worker.py enqueue    # 有効な全ソースの収集ジョブを積む（cron 等から）
+"""
+import os
+import sys
+import socket
+import signal
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from database import SessionLocal, init_db
+from collector import collect_data
+import jobs
+import metrics
+from gemini import split_budget
+
+# 1回に取るジョブ数。分析バッチはソースをまたいでまとめるので、数ソース分まとめて取る
+WORKER_BATCH_SOURCES = int(os.environ.get("WORKER_BATCH_SOURCES", "8"))
+WORKER_POLL_SECONDS = float(os.environ.get("WORKER_POLL_SECONDS", "5"))
+# 常駐ワーカーのメトリクスを公開するポート（0 で公開しない）。Web プロセスの /metrics とは別に収集する
+WORKER_METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", "0"))
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+def run_jobs(wid, claimed):
+    """取得したジョブのソースをまとめて収集し、ソース毎の進捗をジョブに書き込む"""
+    job_by_source = {job.source_id: job.id for job in claimed}
+    finished = set()
+    lock = threading.Lock()
+
+    def progress(source_id, status, **fields):
+        job_id = job_by_source.get(source_id)
+        if job_id is None:
+            return
+        if status in (jobs.DONE, jobs.FAILED):
+            with lock:
+                finished.add(job_id)
+        db = SessionLocal()
+        try:
+            if not jobs.update_job(db, job_id, wid, status=status, **fields):
+                print(f"[JOB] ジョブ{job_id}のリースを失っていたため進捗を破棄")
+        finally:
+            db.close()
+
+    # 収集中はリースを延長し続ける（止まったワーカーのジョブだけが期限切れになる）
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(max(1.0, jobs.JOB_LEASE_SECONDS / 3)):
+            with lock:
+                active = set(job_by_source.values()) - finished
+            db = SessionLocal()
+            try:
+                jobs.renew_leases(db, wid, active)
+            except Exception as e:
+                print(f"[JOB] リース延長に失敗: {e}")
+            finally:
+                db.close()
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    error = "未処理（ソースが無効・削除済み、または収集が中断）"
+    try:
+        collect_data(source_ids=list(job_by_source), progress=progress, job_ids=job_by_source)
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        error = str(e)[:500]
+    finally:
+        stop.set()
+        beat.join()
+    for job_id in set(job_by_source.values()) - finished:
+        db = SessionLocal()
+        try:
+            jobs.update_job(db, job_id, wid, status=jobs.FAILED, error=error)
+        finally:
+            db.close()
+
+def work(stop=None, once=False):
+    """キューを処理し続ける。once ならキューが空になった時点で戻る"""
+    stop = stop or threading.Event()
+    wid = worker_id()
+    print(f"[WORKER] 起動: {wid}")
+    while not stop.is_set():
+        db = SessionLocal()
+        try:
+            jobs.requeue_expired(db)
+            claimed = jobs.claim_jobs(db, wid, WORKER_BATCH_SOURCES)
+        finally:
+            db.close()
+        if claimed:
+            print(f"[WORKER] {len(claimed)}件のジョブを実行: " + ", ".join(str(job.id) for job in claimed))
+            run_jobs(wid, claimed)
+            continue
+        if once:
+            break
+        stop.wait(WORKER_POLL_SECONDS)
+    print(f"[WORKER] 停止: {wid}")
+
+def start_in_thread():
+    """Web プロセス内でワーカーを動かす（1プロセス構成のデプロイ用）"""
+    stop = threading.Event()
+    thread = threading.Thread(target=work, args=(stop,), daemon=True, name="collector-worker")
+    thread.start()
+    return stop
+
+def main(argv):
+    metrics.setup_logging()
+    init_db()
+    if argv[:1] == ["enqueue"]:
+        db = SessionLocal()
+        try:
+            run, queued, skipped = jobs.enqueue_collection(db)
+            run_id = run.id if run else None
+        finally:
+            db.close()
+        print(f"[JOB] {queued}件を投入（実行待ち・実行中のため {skipped}件をスキップ）" + (f" run={run_id}" if run_id else ""))
+        return
+
+    # Web プロセスとは別のリミッタになるので、収集に割り当てた枠だけを使う
+    split_budget("worker")
+    if WORKER_METRICS_PORT:
+        metrics.serve(WORKER_METRICS_PORT)
+    stop = threading.Event()
+    # 実行中のバッチを終えてから止まる
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    try:
+        work(stop, once="--once" in argv)
+    except KeyboardInterrupt:
+        stop.set()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])